@@ -0,0 +1,216 @@
+import json
+import time
+import queue
+import random
+import logging
+import threading
+import numpy as np
+import tensorflow as tf
+
+from agents.inference import PolicyInference
+from agents.replay_memory import LockedReplayMemory
+
+logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('RL-Logger')
+logger.setLevel(logging.INFO)
+
+
+class ActorLearner:
+    def __init__(self, agent, make_env, cfg='../cfg/dqn_setup.json'):
+        '''
+        Description:
+            Actor/learner execution mode for the DQN agents.
+            Actor threads step their own environment with a snapshot of the target policy and push
+            transitions into a bounded queue. The learner thread moves the queued transitions into the
+            (locked) replay memory of the agent and calls agent.train() continuously, throttled so that
+            no more than replay_ratio transitions are replayed per environment step. Every
+            policy_sync_interval learner steps the target weights are published and the actors
+            refresh their snapshot.
+        :param agent: DQN agent (agents.dqn, agents.dqn_ensemble_v1 or agents.dqn_lstm)
+        :param make_env: callable returning a new environment, called once for every actor after the first
+        :param cfg: json cfg file with nactors, replay_ratio, policy_sync_interval and queue_depth
+        '''
+        self.agent = agent
+
+        # Get hyper-parameters from json cfg file
+        data = []
+        with open(cfg) as json_file:
+            data = json.load(json_file)
+
+        self.nactors = int(data['nactors']) if int(data['nactors']) else 1
+        self.replay_ratio = float(data['replay_ratio']) if float(data['replay_ratio']) else 6.4
+        self.policy_sync_interval = int(data['policy_sync_interval']) if int(data['policy_sync_interval']) else 10
+        self.queue_depth = int(data['queue_depth']) if int(data['queue_depth']) else 256
+        self.warmup_step = getattr(agent, 'warmup_step', agent.batch_size)
+
+        # The first actor reuses the agent env
+        self.envs = [agent.env] + [make_env() for _ in range(self.nactors - 1)]
+
+        # Actors and learner share the agent memory
+        self.memory = LockedReplayMemory(agent.memory)
+        self.agent.memory = self.memory
+        self.queue = queue.Queue(maxsize=self.queue_depth)
+
+        # Published policy weights
+        self.policy_lock = threading.Lock()
+        self.policy_weights = agent.target_model.get_weights()
+        self.policy_version = 0
+
+        self.stats_lock = threading.Lock()
+        # The agent epsilon is shared by all actors
+        self.epsilon_lock = threading.Lock()
+        self.actors_done = threading.Event()
+        self.errors = []
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.next_episode = 0
+        self.env_steps = 0
+        self.train_steps = 0
+        self.episode_rewards = []
+        self.actor_busy = np.zeros(self.nactors)
+        self.learner_busy = 0.0
+
+    def _claim_episode(self, episodes):
+        with self.stats_lock:
+            if self.next_episode >= episodes:
+                return None
+            episode = self.next_episode
+            self.next_episode += 1
+            return episode
+
+    def _publish_policy(self):
+        weights = self.agent.target_model.get_weights()
+        with self.policy_lock:
+            self.policy_weights = weights
+            self.policy_version += 1
+
+    def _action(self, policy, state):
+        # Same epsilon-greedy policy as agent.action(), but with the actor snapshot
+        with self.epsilon_lock:
+            explore = (np.random.rand() <= self.agent.epsilon) or (len(self.memory) <= self.warmup_step)
+            if explore and len(self.memory) > self.agent.batch_size:
+                self.agent.epsilon_adj()
+        if explore:
+            return random.randrange(self.agent.env.action_space.n), 0
+        # Heads are stacked as (nheads, actions) and averaged, a plain DQN is a single head
+        q_values = np.reshape(policy.q_values(state), (-1, self.agent.env.action_space.n))
+        q_values = np.mean(q_values, axis=0)
+        return np.argmax(q_values), 1
+
+    def _actor(self, actor_id, env, episodes, nsteps):
+        snapshot = tf.keras.models.clone_model(self.agent.target_model)
+        policy = PolicyInference(snapshot)
+        version = -1
+        while not self.errors:
+            episode = self._claim_episode(episodes)
+            if episode is None:
+                return
+            current_state = env.reset()
+            total_reward = 0
+            for step in range(nsteps):
+                if version != self.policy_version:
+                    with self.policy_lock:
+                        weights, version = self.policy_weights, self.policy_version
+                    snapshot.set_weights(weights)
+
+                start = time.perf_counter()
+                action, policy_type = self._action(policy, current_state)
+                next_state, reward, done, _ = env.step(action)
+                self.actor_busy[actor_id] += time.perf_counter() - start
+
+                # Blocks when the learner falls behind by more than queue_depth transitions
+                if not self._put((current_state, action, reward, next_state, done)):
+                    return
+                with self.stats_lock:
+                    self.env_steps += 1
+                current_state = next_state
+                total_reward += reward
+                if done:
+                    break
+            with self.stats_lock:
+                self.episode_rewards.append((episode, actor_id, total_reward))
+            logger.info('Actor {} episode {} total reward: {}'.format(actor_id, episode, total_reward))
+
+    def _put(self, transition, timeout=0.1):
+        # Wait for room in the queue, gives up when another thread failed (the learner may be gone)
+        while not self.errors:
+            try:
+                self.queue.put(transition, timeout=timeout)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _drain_queue(self, timeout=None):
+        try:
+            transition = self.queue.get(timeout=timeout) if timeout else self.queue.get_nowait()
+            while True:
+                self.memory.append(*transition)
+                transition = self.queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _learner(self):
+        while not self.errors:
+            self._drain_queue()
+            if self.actors_done.is_set() and self.queue.empty():
+                return
+            # Wait for transitions when warming up or when the replay ratio is reached
+            if len(self.memory) <= self.warmup_step or \
+                    self.train_steps * self.agent.batch_size >= self.replay_ratio * self.env_steps:
+                self._drain_queue(timeout=0.01)
+                continue
+
+            start = time.perf_counter()
+            self.agent.train()
+            self.learner_busy += time.perf_counter() - start
+            self.train_steps += 1
+            if self.train_steps % self.policy_sync_interval == 0:
+                self._publish_policy()
+
+    def _run_thread(self, fn, *args):
+        try:
+            fn(*args)
+        except Exception as error:
+            logger.error('Thread {} failed: {}'.format(threading.current_thread().name, error))
+            self.errors.append(error)
+
+    def run(self, episodes, nsteps):
+        '''
+        Description:
+            Run the actors and the learner until the given number of episodes is collected
+        :param episodes: total number of episodes over all actors
+        :param nsteps: maximum number of steps per episode
+        :return: dict with the episode rewards, step counts and actor/learner utilization
+        '''
+        self._reset_stats()
+        self.actors_done.clear()
+        actors = [threading.Thread(target=self._run_thread, args=(self._actor, i, env, episodes, nsteps),
+                                   name='actor{}'.format(i)) for i, env in enumerate(self.envs)]
+        learner = threading.Thread(target=self._run_thread, args=(self._learner,), name='learner')
+
+        start = time.perf_counter()
+        learner.start()
+        for actor in actors:
+            actor.start()
+        for actor in actors:
+            actor.join()
+        actors_wall_time = time.perf_counter() - start
+        self.actors_done.set()
+        learner.join()
+        wall_time = time.perf_counter() - start
+        if self.errors:
+            raise self.errors[0]
+
+        report = {'episode_rewards': sorted(self.episode_rewards),
+                  'env_steps': self.env_steps,
+                  'train_steps': self.train_steps,
+                  'wall_time': wall_time,
+                  'actor_utilization': self.actor_busy / actors_wall_time,
+                  'learner_utilization': self.learner_busy / wall_time}
+        logger.info('Env steps: {} ({:.1f}/s), learner steps: {} ({:.1f}/s)'.format(
+            self.env_steps, self.env_steps / wall_time, self.train_steps, self.train_steps / wall_time))
+        logger.info('Actor utilization: {}, learner utilization: {:.2f}'.format(
+            np.round(report['actor_utilization'], 2), report['learner_utilization']))
+        return report
@@ -6,11 +6,14 @@ import logging
 import numpy as np
 import tensorflow as tf
 
-from collections import deque
 from tensorflow.keras.models import Model, Sequential
 from tensorflow.keras.layers import Dense, Input, LSTM
 from tensorflow.keras.optimizers import Adam
 
+from agents.replay_memory import ReplayMemory, PrioritizedReplayMemory
+from agents.inference import PolicyInference
+from agents.target_network import TargetNetworkUpdater
+
 logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('RL-Logger')
 logger.setLevel(logging.ERROR)
@@ -20,7 +23,6 @@ class DQN:
     def __init__(self, env, cfg='../cfg/dqn_setup.json', arch_type='MLP', nmodels=0):
         self.arch_type = arch_type
         self.env = env
-        self.memory = deque(maxlen=2000)
         self.avg_reward = 0
         self.target_train_counter = 0
 
@@ -42,8 +44,23 @@ class DQN:
         self.batch_size = int(data['batch_size']) if int(data['batch_size']) else 32
         self.tau = float(data['tau']) if float(data['tau']) else 1.0
         self.warmup_step = float(data['warmup_step']) if float(data['warmup_step']) else 100
+        self.memory_size = int(data['memory_size']) if int(data['memory_size']) else 2000
+        self.replay_type = data['replay_type'] if data['replay_type'] else 'uniform'
+        self.per_alpha = float(data['per_alpha']) if float(data['per_alpha']) else 0.6
+        self.per_beta = float(data['per_beta']) if float(data['per_beta']) else 0.4
+        self.per_beta_increment = float(data['per_beta_increment']) if float(data['per_beta_increment']) else 0.001
+        self.per_epsilon = float(data['per_epsilon']) if float(data['per_epsilon']) else 1e-6
+        self.hard_update_interval = int(data['hard_update_interval']) if int(data['hard_update_interval']) else 0
         self.save_model = ''
 
+        if self.replay_type == 'prioritized':
+            logger.info('Using prioritized replay memory')
+            self.memory = PrioritizedReplayMemory(self.memory_size, self.env.observation_space.shape,
+                                                  alpha=self.per_alpha, beta=self.per_beta,
+                                                  beta_increment=self.per_beta_increment, epsilon=self.per_epsilon)
+        else:
+            self.memory = ReplayMemory(self.memory_size, self.env.observation_space.shape)
+
         if self.arch_type == 'LSTM':
             logger.info('Defined Arch Type:{}'.format(self.arch_type))
             self.model = self._build_lstm_model()
@@ -56,6 +73,9 @@ class DQN:
             logger.info('Using Default Arch Type:{}'.format(self.arch_type))
             self.model = self._build_model()
             self.target_model = self._build_model()
+        self.policy = PolicyInference(self.target_model)
+        self.target_updater = TargetNetworkUpdater(self.model, self.target_model, tau=self.tau,
+                                                   hard_update_interval=self.hard_update_interval)
 
         # Save information
         train_file_name = 'dqn_{}_lr{}.log'.format(self.arch_type, self.learning_rate)
@@ -108,7 +128,7 @@ class DQN:
         return model
 
     def remember(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
+        self.memory.append(state, action, reward, next_state, done)
 
     def action(self, state):
         action = 0
@@ -121,22 +141,14 @@ class DQN:
                 self.epsilon_adj()
         else:
             logger.info('NN action')
-            np_state = np.array(state).reshape(1, len(state))
-            if self.arch_type == 'LSTM':
-                np_state = np.array(state).reshape(1, 1, len(state))
-            logger.info('NN action shape{}'.format(np_state.shape))
-            act_values = self.target_model.predict(np_state)
-            action = np.argmax(act_values[0])
+            act_values = self.policy.q_values(state)
+            action = np.argmax(act_values)
             policy_type = 1
 
         return action, policy_type
 
     def play(self, state):
-        np_state = np.array(state).reshape(1, len(state))
-        if self.arch_type == 'LSTM':
-            np_state = np.array(state).reshape(1, 1, len(state))
-        act_values = self.target_model.predict(np_state)
-        return np.argmax(act_values[0])
+        return np.argmax(self.policy.q_values(state))
 
     def train(self):
         if len(self.memory) < self.batch_size:
@@ -144,30 +156,30 @@ class DQN:
 
         logger.info('### TRAINING MODEL ###')
         losses = []
-        minibatch = random.sample(self.memory, self.batch_size)
-        batch_states = []
-        batch_target = []
-        for state, action, reward, next_state, done in minibatch:
-            np_state = np.array(state).reshape(1, len(state))
-            np_next_state = np.array(next_state).reshape(1, len(next_state))
-            if self.arch_type == 'LSTM':
-                np_state = np.array(state).reshape(1, 1, len(state))
-                np_next_state = np.array(next_state).reshape(1, 1, len(next_state))
-            expected_q = 0
-            if not done:
-                expected_q = self.gamma * np.amax(self.target_model.predict(np_next_state)[0])
-            target = reward + expected_q
-            target_f = self.target_model.predict(np_state)
-            target_f[0][action] = target
-
-            if batch_states == []:
-                batch_states = np_state
-                batch_target = target_f
-            else:
-                batch_states = np.append(batch_states, np_state, axis=0)
-                batch_target = np.append(batch_target, target_f, axis=0)
-
-        history = self.model.fit(batch_states, batch_target, epochs=1, verbose=0)
+        weights = None
+        if self.replay_type == 'prioritized':
+            states, actions, rewards, next_states, dones, idx, weights = self.memory.sample(self.batch_size)
+        else:
+            states, actions, rewards, next_states, dones = self.memory.sample(self.batch_size)
+        batch_states = self._batch_input(states)
+        batch_next_states = self._batch_input(next_states)
+        not_dones = 1.0 - dones.astype(np.float32)
+
+        # One forward pass per batch for the Bellman targets
+        expected_q = self.gamma * np.amax(self.target_model.predict_on_batch(batch_next_states), axis=1)
+        batch_target = np.array(self.target_model.predict_on_batch(batch_states))
+        batch_rows = np.arange(len(actions))
+        targets = rewards + not_dones * expected_q
+        if self.replay_type == 'prioritized':
+            # The priorities follow the TD error of the online network that is being trained
+            online_q = np.asarray(self.model.predict_on_batch(batch_states))
+            td_errors = targets - online_q[batch_rows, actions]
+        batch_target[batch_rows, actions] = targets
+
+        # The importance-sampling weights scale the per-sample Huber loss
+        history = self.model.fit(batch_states, batch_target, sample_weight=weights, epochs=1, verbose=0)
+        if self.replay_type == 'prioritized':
+            self.memory.update_priorities(idx, td_errors)
         losses.append(history.history['loss'][0])
         self.train_writer.writerow([np.mean(losses)])
         self.train_file.flush()
@@ -177,12 +189,16 @@ class DQN:
 
         return np.mean(losses)
 
+    def _batch_input(self, states):
+        # Stack the sampled states into the (batch, ...) input expected by the arch type
+        np_states = np.asarray(states, dtype=np.float32).reshape(len(states), -1)
+        if self.arch_type == 'LSTM':
+            np_states = np_states.reshape(len(states), 1, -1)
+        return np_states
+
     def target_train(self):
-        model_weights = self.model.get_weights()
-        target_weights = self.target_model.get_weights()
-        for i in range(len(target_weights)):
-            target_weights[i] = self.tau * model_weights[i] + (1 - self.tau) * target_weights[i]
-        self.target_model.set_weights(target_weights)
+        self.target_train_counter += 1
+        self.target_updater(self.target_train_counter)
 
     def epsilon_adj(self):
         if self.epsilon > self.epsilon_min:
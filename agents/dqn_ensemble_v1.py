@@ -6,20 +6,53 @@ import logging
 import numpy as np
 import tensorflow as tf
 
-from collections import deque
-from keras.models import Model, Sequential
-from keras.layers import Dense, Input, LSTM
-from keras.optimizers import Adam
+from tensorflow.keras.models import Model
+from tensorflow.keras.layers import Input, Lambda, Layer
+from tensorflow.keras.optimizers import Adam
+
+from agents.replay_memory import ReplayMemory, PrioritizedReplayMemory
+from agents.inference import PolicyInference
+from agents.target_network import TargetNetworkUpdater
 
 logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('RL-Logger')
 logger.setLevel(logging.ERROR)
 
 
+class EnsembleDense(Layer):
+    '''
+    Description:
+        Dense layer evaluated independently for every ensemble member with stacked weights,
+        mapping (batch, nmodels, input_dim) to (batch, nmodels, units) in a single einsum.
+        Each member slice is initialized like a standalone Dense layer (Glorot uniform, zero bias).
+    '''
+    def __init__(self, nmodels, units, activation=None, **kwargs):
+        super(EnsembleDense, self).__init__(**kwargs)
+        self.nmodels = nmodels
+        self.units = units
+        self.activation = tf.keras.activations.get(activation)
+
+    def build(self, input_shape):
+        input_dim = int(input_shape[-1])
+        limit = np.sqrt(6.0 / (input_dim + self.units))
+        self.kernel = self.add_weight(name='kernel', shape=(self.nmodels, input_dim, self.units),
+                                      initializer=tf.keras.initializers.RandomUniform(-limit, limit))
+        self.bias = self.add_weight(name='bias', shape=(self.nmodels, self.units), initializer='zeros')
+        super(EnsembleDense, self).build(input_shape)
+
+    def call(self, inputs):
+        return self.activation(tf.einsum('bni,niu->bnu', inputs, self.kernel) + self.bias)
+
+    def get_config(self):
+        config = super(EnsembleDense, self).get_config()
+        config.update({'nmodels': self.nmodels, 'units': self.units,
+                       'activation': tf.keras.activations.serialize(self.activation)})
+        return config
+
+
 class DQN:
     def __init__(self, env, cfg='../cfg/dqn_setup.json', nmodels=4):
         self.env = env
-        self.memory = deque(maxlen=2000)
         self.avg_reward = 0
         self.target_train_counter = 0
 
@@ -41,17 +74,32 @@ class DQN:
         self.batch_size = int(data['batch_size']) if int(data['batch_size']) else 32
         self.tau = float(data['tau']) if float(data['tau']) else 1.0
         self.warmup_step = float(data['warmup_step']) if float(data['warmup_step']) else 100
+        self.memory_size = int(data['memory_size']) if int(data['memory_size']) else 2000
+        self.replay_type = data['replay_type'] if data['replay_type'] else 'uniform'
+        self.per_alpha = float(data['per_alpha']) if float(data['per_alpha']) else 0.6
+        self.per_beta = float(data['per_beta']) if float(data['per_beta']) else 0.4
+        self.per_beta_increment = float(data['per_beta_increment']) if float(data['per_beta_increment']) else 0.001
+        self.per_epsilon = float(data['per_epsilon']) if float(data['per_epsilon']) else 1e-6
+        self.hard_update_interval = int(data['hard_update_interval']) if int(data['hard_update_interval']) else 0
         self.save_model = ''
 
+        if self.replay_type == 'prioritized':
+            logger.info('Using prioritized replay memory')
+            self.memory = PrioritizedReplayMemory(self.memory_size, self.env.observation_space.shape,
+                                                  alpha=self.per_alpha, beta=self.per_beta,
+                                                  beta_increment=self.per_beta_increment, epsilon=self.per_epsilon)
+        else:
+            self.memory = ReplayMemory(self.memory_size, self.env.observation_space.shape)
+
         self.nmodels = nmodels
         self.do_mode = False
-        self.models = []
-        self.target_models = []
-        self.last_loss = []
-        for _ in range(self.nmodels):
-            self.models.append(self._build_model())
-            self.target_models.append(self._build_model())
-            self.last_loss.append(100)
+        self.last_loss = [100] * self.nmodels
+        # All ensemble members live in one graph with stacked weights and one output head per member
+        self.model = self._build_model()
+        self.target_model = self._build_model()
+        self.policy = PolicyInference(self.target_model)
+        self.target_updater = TargetNetworkUpdater(self.model, self.target_model, tau=self.tau,
+                                                   hard_update_interval=self.hard_update_interval)
 
         # Save information
         train_file_name = 'ensemble_dqn_{}_lr{}.log'.format(self.nmodels, self.learning_rate)
@@ -59,21 +107,37 @@ class DQN:
         self.train_writer = csv.writer(self.train_file, delimiter=" ")
 
     def _build_model(self):
-        # Input: state
-        state_input = Input(self.env.observation_space.shape)
-        h1 = Dense(128, activation='relu')(state_input)
-        h2 = Dense(128, activation='relu')(h1)
-        h3 = Dense(128, activation='relu')(h2)
-        # Output: value mapped to action
-        output = Dense(self.env.action_space.n, activation='linear')(h3)
-        model = Model(inputs=state_input, outputs=output)
+        # Input: one state per ensemble member
+        state_input = Input((self.nmodels,) + self.env.observation_space.shape)
+        h1 = EnsembleDense(self.nmodels, 128, activation='relu')(state_input)
+        h2 = EnsembleDense(self.nmodels, 128, activation='relu')(h1)
+        h3 = EnsembleDense(self.nmodels, 128, activation='relu')(h2)
+        # Output: value mapped to action, split into one head per member so each has its own loss
+        q_values = EnsembleDense(self.nmodels, self.env.action_space.n, activation='linear')(h3)
+        outputs = [Lambda(lambda x, m: x[:, m, :], arguments={'m': m}, name='head{}'.format(m))(q_values)
+                   for m in range(self.nmodels)]
+        model = Model(inputs=state_input, outputs=outputs)
         adam = Adam(lr=self.learning_rate, clipnorm=1.0, clipvalue=0.5)
         model.compile(loss=tf.keras.losses.Huber(), optimizer=adam)
         model.summary()
         return model
 
+    def _predict_heads(self, model, states):
+        # Returns the Q-values of every member stacked as (batch, nmodels, actions)
+        outputs = model.predict_on_batch(states)
+        if not isinstance(outputs, list):
+            outputs = [outputs]
+        return np.stack([np.asarray(output) for output in outputs], axis=1)
+
+    def _ensemble_q_values(self, state):
+        # Feed the same state to every member and average their Q-values
+        # Heads are stacked as (nmodels, actions), a single head comes back unstacked
+        act_values = np.reshape(self.policy.q_values(state), (self.nmodels, self.env.action_space.n))
+        logger.debug('act_values_list:{}'.format(act_values))
+        return np.mean(act_values, axis=0)
+
     def remember(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
+        self.memory.append(state, action, reward, next_state, done)
 
     def action(self, state):
         action = 0
@@ -86,95 +150,88 @@ class DQN:
                 self.epsilon_adj()
         else:
             logger.info('NN action')
-            np_state = np.array(state).reshape(1, len(state))
-            act_values_list = []
-            logger.info('NN state shape{}'.format(np_state.shape))
-            for m in range(self.nmodels):
-                act_values_list.append(self.target_models[m].predict(np_state)[0])
-            logger.debug('act_values_list:{}'.format(act_values_list))
-            act_values = np.mean(act_values_list, axis=0)
+            act_values = self._ensemble_q_values(state)
             action = np.argmax(act_values)
             policy_type = 1
 
         return action, policy_type
 
     def play(self, state):
-        np_state = np.array(state).reshape(1, len(state))
-        if self.arch_type == 'LSTM':
-            np_state = np.array(state).reshape(1, 1, len(state))
-        act_values = self.target_model.predict(np_state)
-        return np.argmax(act_values[0])
+        return np.argmax(self._ensemble_q_values(state))
 
     def train(self):
         if len(self.memory) < self.batch_size:
             return
 
         logger.info('### TRAINING MODEL ###')
+        # Every member gets its own bootstrapped minibatch, stacked along the member axis
+        if self.replay_type == 'prioritized':
+            # beta is annealed once per training step, not once per member batch
+            member_batches = [self.memory.sample(self.batch_size, anneal_beta=False) for _ in range(self.nmodels)]
+            self.memory.anneal_beta()
+        else:
+            member_batches = [self.memory.sample(self.batch_size) for _ in range(self.nmodels)]
+        states, actions, rewards, next_states, dones = [np.stack(arrays, axis=1) for arrays in
+                                                        list(zip(*member_batches))[:5]]
+        weights = None
+        if self.replay_type == 'prioritized':
+            idx = np.stack([batch[5] for batch in member_batches], axis=1)
+            weights = [batch[6] for batch in member_batches]
+
+        # One forward pass for all members
+        expected_q = self.gamma * np.amax(self._predict_heads(self.target_model, next_states), axis=2)
+        batch_target = self._predict_heads(self.target_model, states)
+        batch_rows, batch_members = np.indices(actions.shape)
+        targets = rewards + (1.0 - dones.astype(np.float32)) * expected_q
+        if self.replay_type == 'prioritized':
+            # The priorities follow the TD error of the online members that are being trained
+            online_q = self._predict_heads(self.model, states)
+            td_errors = targets - online_q[batch_rows, batch_members, actions]
+        batch_target[batch_rows, batch_members, actions] = targets
+
+        history = self.model.fit(states, [batch_target[:, m] for m in range(self.nmodels)],
+                                 sample_weight=weights, epochs=1, verbose=0)
+        if self.replay_type == 'prioritized':
+            for m in range(self.nmodels):
+                self.memory.update_priorities(idx[:, m], td_errors[:, m])
+
         losses = []
         for m in range(self.nmodels):
-            minibatch = random.sample(self.memory, self.batch_size)
-            batch_states = []
-            batch_target = []
-            for state, action, reward, next_state, done in minibatch:
-                np_state = np.array(state).reshape(1, len(state))
-                np_next_state = np.array(next_state).reshape(1, len(next_state))
-                expectedQ = 0
-                if not done:
-                    expectedQ = self.gamma * np.amax(self.target_models[m].predict(np_next_state)[0])
-                target = reward + expectedQ
-                target_f = self.target_models[m].predict(np_state)
-                target_f[0][action] = target
-
-                if batch_states == []:
-                    batch_states = np_state
-                    batch_target = target_f
-                else:
-                    batch_states = np.append(batch_states, np_state, axis=0)
-                    batch_target = np.append(batch_target, target_f, axis=0)
-
-            history = self.models[m].fit(batch_states, batch_target, epochs=1, verbose=0)
-            current_loss = history.history['loss'][0]
+            loss_key = 'head{}_loss'.format(m) if self.nmodels > 1 else 'loss'
+            current_loss = history.history[loss_key][0]
             logger.debug('Loss for model[{}] {}'.format(m, current_loss))
-            losses.append(history.history['loss'][0])
-            # self.train_writer.writerow([np.mean(losses)])
-            # self.train_file.flush()
-
-            # if current_loss<3*self.last_loss[m]:
-            logger.debug('### TRAINING TARGET MODEL ###')
-            self.target_train()
+            losses.append(current_loss)
             self.last_loss[m] = current_loss
+        # self.train_writer.writerow([np.mean(losses)])
+        # self.train_file.flush()
+
+        logger.debug('### TRAINING TARGET MODEL ###')
+        self.target_train()
 
         return np.mean(losses)
 
     def target_train(self):
-        for m in range(self.nmodels):
-            model_weights = self.models[m].get_weights()
-            target_weights = self.target_models[m].get_weights()
-            for i in range(len(target_weights)):
-                target_weights[i] = self.tau*model_weights[i] + (1-self.tau)*target_weights[i]
-            self.target_models[m].set_weights(target_weights)
+        self.target_train_counter += 1
+        self.target_updater(self.target_train_counter)
 
     def epsilon_adj(self):
         if self.epsilon > self.epsilon_min:
             self.epsilon *= self.epsilon_decay
 
-    def load(self, names):
-        for m in range(self.nmodels):
-            self.target_models[m].load_weights(names[m])
+    def load(self, name):
+        self.target_model.load_weights(name)
 
     def save(self, name):
         abspath = os.path.abspath(self.save_model + name)
         path = os.path.dirname(abspath)
         if not os.path.exists(path):
             os.makedirs(path)
-        for m in range(self.nmodels):
-            this_model_name = name + '_id{}'.format(m)
-            # Save JSON config to disk
-            model_json_name = self.save_model + this_model_name + '.json'
-            json_config = self.target_models[m].to_json()
-            with open(model_json_name, 'w') as json_file:
-                json_file.write(json_config)
-            # Save weights to disk
-            self.target_models[m].save_weights(self.save_model + this_model_name + '.weights.h5')
-            self.target_models[m].save(self.save_model + this_model_name + '.modelall.h5')
-            logger.info('### SAVING MODELS ' + abspath + '###')
+        # Save JSON config to disk
+        model_json_name = self.save_model + name + '.json'
+        json_config = self.target_model.to_json()
+        with open(model_json_name, 'w') as json_file:
+            json_file.write(json_config)
+        # Save weights to disk
+        self.target_model.save_weights(self.save_model + name + '.weights.h5')
+        self.target_model.save(self.save_model + name + '.modelall.h5')
+        logger.info('### SAVING MODELS ' + abspath + '###')
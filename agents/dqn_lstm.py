@@ -1,6 +1,5 @@
 import random,sys,os
 import numpy as np
-from collections import deque
 import tensorflow as tf
 print("tf version ==> ",tf.__version__)
 from tensorflow import keras
@@ -10,6 +9,10 @@ from tensorflow.keras.optimizers import Adam
 from tensorflow.keras import backend as K
 import csv,json,math
 
+from agents.replay_memory import ReplayMemory
+from agents.inference import PolicyInference
+from agents.target_network import TargetNetworkUpdater
+
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 # 0 = all messages are logged (default behavior)
@@ -31,7 +34,6 @@ logger.setLevel(logging.ERROR)
 class DQN:
     def __init__(self, env,cfg='cfg/dqn_setup.json'):
         self.env = env
-        self.memory = deque(maxlen = 2000)
         self.avg_reward = 0
         self.target_train_counter = 0
 
@@ -68,10 +70,17 @@ class DQN:
         self.batch_size = int(data['batch_size']) if int(data['batch_size']) else 32
         self.target_train_interval =  50
         self.tau = float(data['tau']) if float(data['tau']) else 1.0
+        self.memory_size = int(data['memory_size']) if int(data['memory_size']) else 2000
+        self.hard_update_interval = int(data['hard_update_interval']) if int(data['hard_update_interval']) else 0
         self.save_model = './models/'
 
+        self.memory = ReplayMemory(self.memory_size, self.env.observation_space.shape)
+
         self.model = self._build_model()
-        self.target_model = self._build_model()    
+        self.target_model = self._build_model()
+        self.policy = PolicyInference(self.target_model)
+        self.target_updater = TargetNetworkUpdater(self.model, self.target_model, tau=self.tau,
+                                                   hard_update_interval=self.hard_update_interval)
 
     def _build_model(self):
         model = Sequential()
@@ -88,7 +97,7 @@ class DQN:
         return model       
 
     def remember(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
+        self.memory.append(state, action, reward, next_state, done)
 
     def action(self, state):
         if np.random.rand() <= self.epsilon:
@@ -98,14 +107,12 @@ class DQN:
                 self.epsilon_adj()
             return action, 0
         else:
-            np_state = np.array(state).reshape(1,1,len(state))
-            act_values = self.target_model.predict(np_state)
-            action = np.argmax(act_values[0])
+            act_values = self.policy.q_values(state)
+            action = np.argmax(act_values)
             return action, 1
 
     def play(self,state):
-        act_values = self.target_model.predict(state)
-        return np.argmax(act_values[0])
+        return np.argmax(self.policy.q_values(state))
 
     def train(self):
         if len(self.memory)<(self.batch_size):
@@ -113,7 +120,7 @@ class DQN:
 
         logger.info('### TRAINING MODEL ###')
         losses = []
-        minibatch = random.sample(self.memory, self.batch_size)
+        minibatch = zip(*self.memory.sample(self.batch_size))
 
         for state, action, reward, next_state, done in minibatch:
             #print ("minibatch state:",state)
@@ -131,12 +138,8 @@ class DQN:
         return 0
 
     def target_train(self):
-        self.target_train_counter = 0
-        model_weights  = self.model.get_weights()
-        target_weights =self.target_model.get_weights()
-        for i in range(len(target_weights)):
-            target_weights[i] = self.tau*model_weights[i] + (1-self.tau)*target_weights[i]
-        self.target_model.set_weights(target_weights)
+        self.target_train_counter += 1
+        self.target_updater(self.target_train_counter)
 
     def epsilon_adj(self):
         if self.epsilon > self.epsilon_min:
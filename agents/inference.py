@@ -0,0 +1,32 @@
+import numpy as np
+import tensorflow as tf
+
+
+class PolicyInference:
+    def __init__(self, model, input_shape=None):
+        '''
+        Description:
+            Low latency single state inference for acting in the environment.
+            The model call is traced once into a tf.function with a fixed (1, ...) input signature
+            and the input is copied into a reused float32 buffer, which avoids the per-call overhead
+            of keras predict(). Multi-head models are stacked as (heads, actions).
+        :param model: keras model that maps states to Q-values
+        :param input_shape: shape of one model input without the batch axis (default: model.input_shape[1:])
+        '''
+        self.model = model
+        if input_shape is None:
+            input_shape = model.input_shape[1:]
+        self.input_buffer = np.zeros((1,) + tuple(input_shape), dtype=np.float32)
+        self._q_values = tf.function(self._call_model,
+                                     input_signature=[tf.TensorSpec(self.input_buffer.shape, tf.float32)])
+
+    def _call_model(self, x):
+        outputs = self.model(x, training=False)
+        if isinstance(outputs, (list, tuple)):
+            outputs = tf.stack(outputs, axis=1)
+        return outputs
+
+    def q_values(self, state):
+        # The state is broadcast into the buffer, e.g. tiled across the members of an ensemble input
+        self.input_buffer[...] = np.reshape(state, self.input_buffer.shape[-1])
+        return self._q_values(self.input_buffer).numpy()[0]
@@ -0,0 +1,215 @@
+import threading
+import numpy as np
+
+
+class ReplayMemory:
+    def __init__(self, capacity, state_shape, state_dtype=np.float32):
+        '''
+        Description:
+            Replay memory backed by preallocated typed arrays.
+            Transitions are written at a cursor that wraps around once the capacity is reached,
+            overwriting the oldest entries (same behavior as a deque with maxlen).
+        :param capacity: maximum number of transitions kept in memory
+        :param state_shape: shape of a single environment observation
+        :param state_dtype: dtype used to store the states and next states
+        '''
+        self.capacity = int(capacity)
+        self.state_shape = tuple(state_shape)
+        # np.zeros only commits pages once they are written, so large capacities are cheap until filled
+        self.states = np.zeros((self.capacity,) + self.state_shape, dtype=state_dtype)
+        self.actions = np.zeros(self.capacity, dtype=np.int32)
+        self.rewards = np.zeros(self.capacity, dtype=np.float32)
+        self.next_states = np.zeros((self.capacity,) + self.state_shape, dtype=state_dtype)
+        self.dones = np.zeros(self.capacity, dtype=np.bool_)
+        self.cursor = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, state, action, reward, next_state, done):
+        idx = self.cursor
+        self.states[idx] = np.reshape(state, self.state_shape)
+        self.actions[idx] = action
+        self.rewards[idx] = reward
+        self.next_states[idx] = np.reshape(next_state, self.state_shape)
+        self.dones[idx] = done
+        self.cursor = (idx + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return idx
+
+    def extend(self, states, actions, rewards, next_states, dones):
+        '''
+        Description:
+            Append a batch of transitions with one vectorized write
+        :return: indices written
+        '''
+        n = len(actions)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+        # Only the last capacity transitions of a larger batch survive
+        start = max(n - self.capacity, 0)
+        idx = (self.cursor + np.arange(start, n)) % self.capacity
+        self.states[idx] = np.reshape(states[start:], (n - start,) + self.state_shape)
+        self.actions[idx] = actions[start:]
+        self.rewards[idx] = rewards[start:]
+        self.next_states[idx] = np.reshape(next_states[start:], (n - start,) + self.state_shape)
+        self.dones[idx] = dones[start:]
+        self.cursor = (self.cursor + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        return idx
+
+    def sample(self, batch_size):
+        '''
+        Description:
+            Uniformly sample a batch of transitions (with replacement)
+        :param batch_size: number of transitions to sample
+        :return: contiguous arrays (states, actions, rewards, next_states, dones)
+        '''
+        idx = np.random.randint(0, self.size, size=batch_size)
+        return self.gather(idx)
+
+    def gather(self, idx):
+        return self.states[idx], self.actions[idx], self.rewards[idx], self.next_states[idx], self.dones[idx]
+
+
+class SumTree:
+    def __init__(self, capacity):
+        '''
+        Description:
+            Binary sum-tree over a fixed number of leaves stored in a flat array.
+            Leaf i lives at position nleaves + i and every internal node holds the sum of its children,
+            so updates and proportional lookups are O(log n) and are vectorized over a batch of indices.
+        :param capacity: number of leaves (priorities) to store
+        '''
+        self.capacity = int(capacity)
+        self.nleaves = 1
+        while self.nleaves < self.capacity:
+            self.nleaves *= 2
+        self.depth = int(np.log2(self.nleaves))
+        self.tree = np.zeros(2 * self.nleaves, dtype=np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    def get(self, idx):
+        return self.tree[np.asarray(idx) + self.nleaves]
+
+    def update(self, idx, priorities):
+        nodes = np.asarray(idx, dtype=np.int64) + self.nleaves
+        self.tree[nodes] = priorities
+        # Recompute the parents level by level
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        '''
+        Description:
+            Find the leaves whose cumulative priority interval contains each value
+        :param values: array of values in [0, total)
+        :return: leaf indices
+        '''
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            go_right = values >= self.tree[left]
+            values -= self.tree[left] * go_right
+            nodes = left + go_right
+        return nodes - self.nleaves
+
+
+class PrioritizedReplayMemory(ReplayMemory):
+    def __init__(self, capacity, state_shape, alpha=0.6, beta=0.4, beta_increment=0.001, epsilon=1e-6,
+                 state_dtype=np.float32):
+        '''
+        Description:
+            Proportional prioritized replay memory (Schaul et al. 2016) on top of the array ring buffer.
+            New transitions get the current maximum priority so they are replayed at least once.
+        :param alpha: how much prioritization is used (0 is uniform)
+        :param beta: initial importance-sampling correction, annealed to 1 by beta_increment per training step
+        :param epsilon: small constant added to the absolute TD error
+        '''
+        super().__init__(capacity, state_shape, state_dtype=state_dtype)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.epsilon = epsilon
+        self.max_priority = 1.0
+        self.tree = SumTree(self.capacity)
+
+    def append(self, state, action, reward, next_state, done):
+        idx = super().append(state, action, reward, next_state, done)
+        self.tree.update([idx], [self.max_priority ** self.alpha])
+        return idx
+
+    def extend(self, states, actions, rewards, next_states, dones):
+        idx = super().extend(states, actions, rewards, next_states, dones)
+        self.tree.update(idx, np.full(len(idx), self.max_priority ** self.alpha))
+        return idx
+
+    def sample(self, batch_size, anneal_beta=True):
+        '''
+        Description:
+            Stratified proportional sampling, one draw per equal slice of the total priority
+        :param batch_size: number of transitions to sample
+        :param anneal_beta: anneal beta after sampling, disable when a training step samples several batches
+        :return: (states, actions, rewards, next_states, dones, indices, importance-sampling weights)
+        '''
+        total = self.tree.total()
+        segment = total / batch_size
+        values = (np.arange(batch_size) + np.random.rand(batch_size)) * segment
+        idx = np.clip(self.tree.find(np.minimum(values, np.nextafter(total, 0))), 0, self.size - 1)
+
+        probabilities = self.tree.get(idx) / total
+        weights = np.power(self.size * probabilities, -self.beta)
+        weights = (weights / weights.max()).astype(np.float32)
+        if anneal_beta:
+            self.anneal_beta()
+
+        return self.gather(idx) + (idx, weights)
+
+    def anneal_beta(self):
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+    def update_priorities(self, idx, td_errors):
+        priorities = np.abs(td_errors) + self.epsilon
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(idx, np.power(priorities, self.alpha))
+
+
+class LockedReplayMemory:
+    def __init__(self, memory):
+        '''
+        Description:
+            Thread-safe wrapper around a replay memory, every access is serialized by one lock.
+            Used when actor and learner threads share the same memory.
+        :param memory: ReplayMemory or PrioritizedReplayMemory instance
+        '''
+        self.memory = memory
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.memory)
+
+    def append(self, state, action, reward, next_state, done):
+        with self.lock:
+            return self.memory.append(state, action, reward, next_state, done)
+
+    def extend(self, states, actions, rewards, next_states, dones):
+        with self.lock:
+            return self.memory.extend(states, actions, rewards, next_states, dones)
+
+    def sample(self, batch_size, **kwargs):
+        with self.lock:
+            return self.memory.sample(batch_size, **kwargs)
+
+    def anneal_beta(self):
+        with self.lock:
+            self.memory.anneal_beta()
+
+    def update_priorities(self, idx, td_errors):
+        with self.lock:
+            self.memory.update_priorities(idx, td_errors)
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import queue
+import random
+import logging
+import multiprocessing
+import numpy as np
+
+from agents.shared_buffers import SharedRingBuffer, SharedWeights
+
+logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('RL-Logger')
+logger.setLevel(logging.INFO)
+
+
+def _rollout_worker(worker_id, env_id, env_kwargs, nsteps, seed, model_json, custom_objects, buffer_spec,
+                    weights_spec, epsilon, warmup, random_actions, stop_event, results):
+    # One env and one policy copy per process, limited to one TF thread to avoid oversubscription
+    os.environ['OMP_NUM_THREADS'] = '1'
+    import gym
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(1)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    from agents.inference import PolicyInference
+
+    random.seed(seed)
+    np.random.seed(seed)
+    env = gym.make(env_id, **env_kwargs)
+    env.seed(seed)
+
+    model = tf.keras.models.model_from_json(model_json, custom_objects=custom_objects)
+    policy = PolicyInference(model)
+    buffer = SharedRingBuffer(*buffer_spec)
+    weights = SharedWeights(*weights_spec)
+    version = -1
+    try:
+        episode = 0
+        while not stop_event.is_set():
+            current_state = env.reset()
+            total_reward = 0
+            for step in range(nsteps):
+                if int(weights.version[0]) != version:
+                    version, model_weights = weights.read()
+                    model.set_weights(model_weights)
+
+                # Random actions while the learner warms up the memory, as agent.action()
+                if warmup.value or np.random.rand() <= epsilon.value:
+                    action = random.randrange(env.action_space.n)
+                    random_actions.value += 1
+                else:
+                    # Heads are stacked as (nheads, actions) and averaged, a plain DQN is a single head
+                    q_values = np.reshape(policy.q_values(current_state), (-1, env.action_space.n))
+                    action = np.argmax(np.mean(q_values, axis=0))
+                next_state, reward, done, _ = env.step(action)
+                if not buffer.put(current_state, action, reward, next_state, done, should_stop=stop_event.is_set):
+                    return
+                current_state = next_state
+                total_reward += reward
+                if done:
+                    break
+            results.put((worker_id, episode, float(total_reward)))
+            episode += 1
+    finally:
+        buffer.close()
+        weights.close()
+
+
+class RolloutWorkers:
+    def __init__(self, agent, env_id, nsteps, cfg='../cfg/dqn_setup.json', custom_objects=None, seed=0,
+                 env_kwargs=None):
+        '''
+        Description:
+            Multi-process experience collection for the DQN agents.
+            Every worker process owns an env instance and a copy of the policy and writes its
+            transitions into its own shared memory ring buffer. The learner runs in this process: it
+            copies the buffers into the agent replay memory without pickling, trains with the same
+            replay ratio throttling as the actor/learner mode and publishes the target weights
+            into a shared block every policy_sync_interval learner steps.
+        :param agent: DQN agent
+        :param env_id: gym id of the env created in every worker
+        :param nsteps: maximum number of steps per episode
+        :param cfg: json cfg file with nworkers, replay_ratio, policy_sync_interval and queue_depth
+        :param custom_objects: keras custom objects needed to rebuild the model in the workers
+        :param seed: base seed, worker i uses seed + i
+        :param env_kwargs: keyword arguments of the env constructor, e.g. {'shared_data': True}
+        '''
+        self.agent = agent
+        self.env_id = env_id
+        self.nsteps = nsteps
+        self.custom_objects = custom_objects
+        self.seed = seed
+        self.env_kwargs = env_kwargs if env_kwargs else {}
+
+        # Get hyper-parameters from json cfg file
+        data = []
+        with open(cfg) as json_file:
+            data = json.load(json_file)
+
+        self.nworkers = int(data['nworkers']) if int(data['nworkers']) else multiprocessing.cpu_count()
+        self.replay_ratio = float(data['replay_ratio']) if float(data['replay_ratio']) else 6.4
+        self.policy_sync_interval = int(data['policy_sync_interval']) if int(data['policy_sync_interval']) else 10
+        self.buffer_capacity = int(data['queue_depth']) if int(data['queue_depth']) else 256
+        self.warmup_step = getattr(agent, 'warmup_step', agent.batch_size)
+
+        self.buffers = []
+        self.weights = None
+        self.processes = []
+        self.env_steps = 0
+        self.train_steps = 0
+
+    def start(self):
+        # Spawned workers do not inherit the TF runtime of this process
+        context = multiprocessing.get_context('spawn')
+        self.stop_event = context.Event()
+        self.results = context.Queue()
+        self.epsilon = context.Value('d', self.agent.epsilon)
+        self.warmup = context.Value('b', len(self.agent.memory) <= self.warmup_step)
+        # Random actions taken by every worker, only written by that worker
+        self.random_actions = [context.Value('q', 0, lock=False) for _ in range(self.nworkers)]
+        self.random_actions_seen = 0
+
+        state_shape = self.agent.env.observation_space.shape
+        self.buffers = [SharedRingBuffer(self.buffer_capacity, state_shape) for _ in range(self.nworkers)]
+        target_weights = self.agent.target_model.get_weights()
+        self.weights = SharedWeights([w.shape for w in target_weights])
+        self.weights.write(target_weights)
+
+        model_json = self.agent.target_model.to_json()
+        for i in range(self.nworkers):
+            process = context.Process(target=_rollout_worker, name='rollout{}'.format(i),
+                                      args=(i, self.env_id, self.env_kwargs, self.nsteps, self.seed + i, model_json,
+                                            self.custom_objects, self.buffers[i].spec(), self.weights.spec(),
+                                            self.epsilon, self.warmup, self.random_actions[i], self.stop_event,
+                                            self.results))
+            process.start()
+            self.processes.append(process)
+        logger.info('Started {} rollout workers'.format(self.nworkers))
+
+    def collect(self):
+        # Copy every worker buffer into the replay memory
+        ncollected = 0
+        for buffer in self.buffers:
+            batch = buffer.get()
+            ncollected += len(batch[1])
+            self.agent.memory.extend(*batch)
+        self.env_steps += ncollected
+        # Same exploration decay as agent.action(), once per random action of the workers
+        random_actions = sum(counter.value for counter in self.random_actions)
+        if len(self.agent.memory) > self.agent.batch_size:
+            for _ in range(random_actions - self.random_actions_seen):
+                self.agent.epsilon_adj()
+        self.random_actions_seen = random_actions
+        self.epsilon.value = self.agent.epsilon
+        self.warmup.value = len(self.agent.memory) <= self.warmup_step
+        return ncollected
+
+    def check_workers(self):
+        # Workers only return once stopped, so a dead worker during a run has failed
+        for process in self.processes:
+            if not process.is_alive():
+                raise RuntimeError('Rollout worker {} exited with code {}'.format(process.name, process.exitcode))
+
+    def publish_policy(self):
+        self.weights.write(self.agent.target_model.get_weights())
+
+    def run(self, episodes):
+        '''
+        Description:
+            Collect and train until the workers finished the given number of episodes
+        :param episodes: total number of episodes over all workers
+        :return: dict with the episode rewards, step counts and learner utilization
+        '''
+        if not self.processes:
+            self.start()
+        episode_rewards = []
+        learner_busy = 0.0
+        start = time.perf_counter()
+        while len(episode_rewards) < episodes:
+            try:
+                while True:
+                    episode_rewards.append(self.results.get_nowait())
+            except queue.Empty:
+                pass
+            self.check_workers()
+            self.collect()
+            if len(self.agent.memory) <= self.warmup_step or \
+                    self.train_steps * self.agent.batch_size >= self.replay_ratio * self.env_steps:
+                time.sleep(0.001)
+                continue
+
+            train_start = time.perf_counter()
+            self.agent.train()
+            learner_busy += time.perf_counter() - train_start
+            self.train_steps += 1
+            if self.train_steps % self.policy_sync_interval == 0:
+                self.publish_policy()
+        wall_time = time.perf_counter() - start
+
+        report = {'episode_rewards': episode_rewards[:episodes],
+                  'env_steps': self.env_steps,
+                  'train_steps': self.train_steps,
+                  'wall_time': wall_time,
+                  'learner_utilization': learner_busy / wall_time}
+        logger.info('Env steps: {} ({:.1f}/s), learner steps: {} ({:.1f}/s), learner utilization: {:.2f}'.format(
+            self.env_steps, self.env_steps / wall_time, self.train_steps, self.train_steps / wall_time,
+            report['learner_utilization']))
+        return report
+
+    def close(self):
+        self.stop_event.set()
+        for process in self.processes:
+            # Workers only exit once their queued results are consumed
+            while process.is_alive():
+                try:
+                    while True:
+                        self.results.get_nowait()
+                except queue.Empty:
+                    pass
+                process.join(timeout=0.1)
+        for buffer in self.buffers:
+            buffer.close()
+        self.weights.close()
+        self.processes = []
+        self.buffers = []
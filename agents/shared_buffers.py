@@ -0,0 +1,155 @@
+import time
+import numpy as np
+
+from multiprocessing import shared_memory
+
+
+def _layout(fields):
+    # Byte offsets of every field in a single shared block, 8 byte aligned
+    offsets = {}
+    nbytes = 0
+    for name, shape, dtype in fields:
+        offsets[name] = nbytes
+        nbytes += int(np.prod(shape)) * np.dtype(dtype).itemsize
+        nbytes = (nbytes + 7) // 8 * 8
+    return offsets, max(nbytes, 8)
+
+
+def _open_block(name, nbytes):
+    # Create a new block, or attach to an existing one that is owned (and unlinked) by its creator
+    if name is None:
+        return shared_memory.SharedMemory(create=True, size=nbytes)
+    return shared_memory.SharedMemory(name=name)
+
+
+class SharedRingBuffer:
+    def __init__(self, capacity, state_shape, name=None):
+        '''
+        Description:
+            Single producer / single consumer ring buffer of transitions in one shared memory block.
+            The producer writes a transition into slot write_count % capacity and then increments
+            write_count, the consumer reads everything up to write_count and then advances read_count,
+            so no locks or pickling are needed between the two processes.
+        :param capacity: number of transitions the buffer holds
+        :param state_shape: shape of a single environment observation
+        :param name: name of an existing block to attach to (None creates a new block)
+        '''
+        self.capacity = int(capacity)
+        self.state_shape = tuple(state_shape)
+        fields = [('counters', (2,), np.int64),
+                  ('states', (self.capacity,) + self.state_shape, np.float32),
+                  ('actions', (self.capacity,), np.int32),
+                  ('rewards', (self.capacity,), np.float32),
+                  ('next_states', (self.capacity,) + self.state_shape, np.float32),
+                  ('dones', (self.capacity,), np.bool_)]
+        offsets, nbytes = _layout(fields)
+        self.owner = name is None
+        self.shm = _open_block(name, nbytes)
+        self.name = self.shm.name
+        for field, shape, dtype in fields:
+            setattr(self, field, np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offsets[field]))
+        if self.owner:
+            self.counters[:] = 0
+
+    def spec(self):
+        # Arguments needed to attach to this buffer from another process
+        return self.capacity, self.state_shape, self.name
+
+    def __len__(self):
+        return int(self.counters[0] - self.counters[1])
+
+    def put(self, state, action, reward, next_state, done, should_stop=None, wait=0.001):
+        '''
+        Description:
+            Write one transition, waiting while the buffer is full
+        :param should_stop: optional callable, the wait is aborted when it returns True
+        :return: True if the transition was written
+        '''
+        write_count = int(self.counters[0])
+        while write_count - int(self.counters[1]) >= self.capacity:
+            if should_stop is not None and should_stop():
+                return False
+            time.sleep(wait)
+        idx = write_count % self.capacity
+        self.states[idx] = np.reshape(state, self.state_shape)
+        self.actions[idx] = action
+        self.rewards[idx] = reward
+        self.next_states[idx] = np.reshape(next_state, self.state_shape)
+        self.dones[idx] = done
+        # Publish only after the transition is written
+        self.counters[0] = write_count + 1
+        return True
+
+    def get(self):
+        '''
+        Description:
+            Read all available transitions
+        :return: copies of (states, actions, rewards, next_states, dones) in write order
+        '''
+        read_count = int(self.counters[1])
+        idx = np.arange(read_count, int(self.counters[0])) % self.capacity
+        batch = (self.states[idx], self.actions[idx], self.rewards[idx], self.next_states[idx], self.dones[idx])
+        self.counters[1] = read_count + len(idx)
+        return batch
+
+    def close(self):
+        # The numpy views have to be released before the block can be closed
+        for field in ['counters', 'states', 'actions', 'rewards', 'next_states', 'dones']:
+            setattr(self, field, None)
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SharedWeights:
+    def __init__(self, shapes, name=None):
+        '''
+        Description:
+            Flat float32 copy of the model weights in shared memory, guarded by a version counter
+            (seqlock). The writer makes the version odd while it copies the weights, readers retry
+            until they see the same even version before and after their copy.
+        :param shapes: list with the shape of every weight array (model.get_weights() order)
+        :param name: name of an existing block to attach to (None creates a new block)
+        '''
+        self.shapes = [tuple(shape) for shape in shapes]
+        self.sizes = [int(np.prod(shape)) for shape in self.shapes]
+        fields = [('version', (1,), np.int64), ('values', (sum(self.sizes),), np.float32)]
+        offsets, nbytes = _layout(fields)
+        self.owner = name is None
+        self.shm = _open_block(name, nbytes)
+        self.name = self.shm.name
+        self.version = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf, offset=offsets['version'])
+        self.values = np.ndarray((sum(self.sizes),), dtype=np.float32, buffer=self.shm.buf, offset=offsets['values'])
+        if self.owner:
+            self.version[0] = 0
+
+    def spec(self):
+        return self.shapes, self.name
+
+    def write(self, weights):
+        self.version[0] += 1
+        self.values[:] = np.concatenate([np.ravel(w) for w in weights])
+        self.version[0] += 1
+
+    def read(self, wait=0.0001):
+        '''
+        Description:
+            Consistent copy of the weights
+        :return: (version, list of weight arrays)
+        '''
+        while True:
+            version = int(self.version[0])
+            if version % 2 == 0:
+                values = self.values.copy()
+                if int(self.version[0]) == version:
+                    break
+            time.sleep(wait)
+        weights = [w.reshape(shape) for w, shape in zip(np.split(values, np.cumsum(self.sizes)[:-1]), self.shapes)]
+        return version, weights
+
+    def close(self):
+        self.version = None
+        self.values = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,45 @@
+import tensorflow as tf
+
+
+class TargetNetworkUpdater:
+    def __init__(self, model, target_model, tau=1.0, hard_update_interval=0):
+        '''
+        Description:
+            Target network update done as in-graph variable assignments, so no weights are copied
+            through NumPy. By default a Polyak update target = tau*model + (1-tau)*target is applied
+            on every call. With hard_update_interval > 0 the target is instead copied from the model
+            only every hard_update_interval calls.
+        :param model: online keras model
+        :param target_model: target keras model with the same architecture
+        :param tau: Polyak averaging coefficient
+        :param hard_update_interval: number of learner steps between hard copies (0 disables)
+        '''
+        self.model_variables = model.weights
+        self.target_variables = target_model.weights
+        self.tau = tau
+        self.hard_update_interval = hard_update_interval
+
+    @tf.function
+    def _soft_update(self, tau):
+        for variable, target_variable in zip(self.model_variables, self.target_variables):
+            target_variable.assign(tau * variable + (1.0 - tau) * target_variable)
+
+    @tf.function
+    def _hard_update(self):
+        for variable, target_variable in zip(self.model_variables, self.target_variables):
+            target_variable.assign(variable)
+
+    def __call__(self, step):
+        '''
+        Description:
+            Apply the target update for the given learner step
+        :param step: learner step counter
+        :return: True if the target network was updated
+        '''
+        if self.hard_update_interval > 0:
+            if step % self.hard_update_interval != 0:
+                return False
+            self._hard_update()
+        else:
+            self._soft_update(tf.constant(self.tau, dtype=tf.float32))
+        return True
@@ -1,71 +1,210 @@
+import os
 import h5py
+import queue
+import threading
 import numpy as np
 import keras
+from numpy.lib.stride_tricks import sliding_window_view
 #from keras.models import Sequential
 
 
 class DataGenerator(keras.utils.Sequence):
-    def __init__(self, filename, variables=['B:VIMIN','B:IMINER','I:MDAT40','I:IB','B:LINFRQ'], backward=200, forward=1, batch_size=32):
+    def __init__(self, filename, variables=['B:VIMIN','B:IMINER','I:MDAT40','I:IB','B:LINFRQ'], backward=200, forward=1, batch_size=32,
+                 shuffle=True, seed=None):
+        '''
+        Description:
+            Batches of (backward, forward) windows of a processed h5 file. A batch only depends on its index
+            and the epoch, so the generator can be used with Keras workers>1/use_multiprocessing: the h5 file
+            is opened lazily by every process that reads from it. A batch holds the windows of batch_size
+            consecutive starts, read as one row block. With shuffle the batches are shuffled at block granularity
+            every epoch: the spans of consecutive starts (at a random offset) are permuted and the windows are
+            shuffled inside every span. The shuffle follows from (seed, epoch) so all workers agree on it.
+        :param filename: processed h5 file (see dataprep.dataset.reformat_data and rechunk_processed)
+        :param variables: list of variables
+        :param backward: number of input time steps
+        :param forward: number of predicted time steps
+        :param batch_size: windows per batch
+        :param shuffle: shuffle the batches and the windows within every batch every epoch
+        :param seed: shuffling seed, random by default
+        '''
         ##
+        self.filename = filename
         self.batch_size = batch_size
         self.in_variables = variables
         self.backward = backward
         self.forward = forward
-        self.idx = 0
-        self.on_epoch_end()
+        self.shuffle = shuffle
+        self.seed = np.random.randint(2**31) if seed is None else seed
+        self.epoch = 0
+        self._starts = None
 
-        ##
-        self.hf = h5py.File(filename, 'r')
-        print([key for key in self.hf.keys()])
-        self.total_length = self.hf['ACNET/block0_values'].shape[0]
-        self.nvars = self.hf['ACNET/block0_values'].shape[1]
-        self.h5_variables = (self.hf['ACNET/block0_items'].value.astype(str))
+        ## Only the layout is read here, the file is opened again where the batches are read
+        self.hf = None
+        self.pid = None
+        with h5py.File(filename, 'r') as hf:
+            print([key for key in hf.keys()])
+            self.total_length = hf['ACNET/block0_values'].shape[0]
+            self.nvars = hf['ACNET/block0_values'].shape[1]
+            self.dtype = hf['ACNET/block0_values'].dtype
+            self.h5_variables = (hf['ACNET/block0_items'][()].astype(str))
         self.indices = []
         for var in self.in_variables:
             self.indices.append(np.where(self.h5_variables == var))
         if len(self.indices)!=len(self.in_variables):
             print('Not all variables are available.')
- 
+        ## Columns of the variables, read at once in increasing order and then put in the order of variables
+        columns = np.concatenate([index[0] for index in self.indices])
+        self.read_columns, self.column_order = np.unique(columns, return_inverse=True)
+        if len(self.read_columns) == self.read_columns[-1] - self.read_columns[0] + 1:
+            self.read_columns = slice(int(self.read_columns[0]), int(self.read_columns[-1]) + 1)
+        self.nwindows = max(self.total_length - (self.backward + self.forward) + 1, 0)
+
+    def __getstate__(self):
+        # h5py handles can not be shared with other processes, every worker opens its own
+        state = self.__dict__.copy()
+        state['hf'], state['pid'] = None, None
+        return state
+
+    @property
+    def values(self):
+        if self.hf is None or self.pid != os.getpid():
+            self.hf = h5py.File(self.filename, 'r')
+            self.pid = os.getpid()
+        return self.hf['ACNET/block0_values']
+
     def on_epoch_end(self):
         ''' Updates indexes after each epoch '''
-        self.idx = 0
+        self.epoch += 1
+
+    def epoch_starts(self, epoch):
+        # Window starts of an epoch in batch order, every batch covers a span of batch_size consecutive starts
+        if self._starts is None or self._starts[0] != epoch:
+            nbatches = self.nwindows // self.batch_size
+            spans = np.arange(nbatches)[:, None] * self.batch_size
+            inner = np.broadcast_to(np.arange(self.batch_size), (nbatches, self.batch_size))
+            if self.shuffle:
+                rng = np.random.default_rng([self.seed, epoch])
+                ## The windows left over by the spans move with the offset, so every window is used
+                offset = rng.integers(self.nwindows - nbatches * self.batch_size + 1)
+                spans = offset + rng.permutation(spans)
+                inner = rng.permuted(inner, axis=1)
+            self._starts = (epoch, (spans + inner).ravel())
+        return self._starts[1]
         
     def __len__(self):
         ''' Denotes the number of batches per epoch '''
-        nbatches = int(np.floor(self.total_length) / self.batch_size)
+        nbatches = self.nwindows // self.batch_size
         print('number of batches:{}'.format(nbatches))
         return nbatches
-    
-    def __getitem__(self, index):
-        ''' Generate on batch of data '''
-        list_x, list_y = [],[]
+
+    def _read_block(self, start, stop):
+        # Rows [start, stop) of the variables, one h5py read
+        block = self.values[start:stop, self.read_columns]
+        return block[:, self.column_order]
+
+    def _windows(self, starts):
+        '''
+        Description:
+            Cut the sample windows starting at starts out of the one row block that covers all of them,
+            the starts of a batch span batch_size consecutive rows
+        :param starts: window start rows
+        :return: (len(starts), nvars, backward + forward) windows, in the order of starts
+        '''
         sample_length = self.backward+self.forward
-        for b in range(self.batch_size):
-            ## Check if idx is within the available data if not wrap back to the beginning
-            if self.idx + sample_length > self.total_length:
-                self.idx = 0
-            # Define indices #
-            backward_start_idx = self.idx
-            backward_stop_idx = self.idx+self.backward
-            forward_start_idx = backward_stop_idx
-            forward_stop_idx = forward_start_idx + self.forward
-            sub_list_x,sub_list_y = [],[]
-            for i in range(len(self.indices)):
-                sub_list_x.append(self.hf['ACNET/block0_values'][backward_start_idx:backward_stop_idx, self.indices[i][0]].reshape(-1))
-                sub_list_y.append(self.hf['ACNET/block0_values'][forward_start_idx:forward_stop_idx,self.indices[i][0]].reshape(-1))
-            self.idx+=1
-            sub_batch_x = np.stack(sub_list_x,1)
-            sub_batch_y = np.stack(sub_list_y,1)
-            #print(sub_batch_x.shape)
-            list_x.append(sub_batch_x)
-            list_y.append(sub_batch_y)
-
-        batch_x = np.stack(list_x,0)
-        batch_y = np.stack(list_y,0)
+        first = starts.min()
+        block = self._read_block(first, starts.max() + sample_length)
+        return sliding_window_view(block, sample_length, axis=0)[starts - first]
+
+    def batch(self, index, epoch):
+        ''' Batch index of an epoch '''
+        starts = self.epoch_starts(epoch)[index * self.batch_size:(index + 1) * self.batch_size]
+        windows = self._windows(starts)
+
+        ## Shape is number of traces, number time steps, number of variables
+        batch_x = np.ascontiguousarray(windows[..., :self.backward].transpose(0, 2, 1))
+        batch_y = np.ascontiguousarray(windows[..., self.backward:].transpose(0, 2, 1))
         ## Reshape
         batch_y = batch_y.reshape(batch_y.shape[0], batch_y.shape[2])
         return batch_x,batch_y
+    
+    def __getitem__(self, index):
+        ''' Generate on batch of data '''
+        return self.batch(index, self.epoch)
+
+    def prefetch(self, queue_size=8):
+        '''
+        Description:
+            Iterate over the batches of the current epoch, prepared by a background thread that stays at
+            most queue_size batches ahead
+        :param queue_size: maximum number of prepared batches
+        '''
+        batches = queue.Queue(maxsize=queue_size)
+        stop = threading.Event()
+        epoch, nbatches = self.epoch, self.nwindows // self.batch_size
+
+        def put(item):
+            # Wait for a free slot unless the consumer stopped
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for index in range(nbatches):
+                    if not put(self.batch(index, epoch)):
+                        return
+            except Exception as error:
+                put(error)
+                return
+            put(None)
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            thread.join()
+
+    def to_tf_dataset(self, cycle_length=4, prefetch=None):
+        '''
+        Description:
+            tf.data version of the generator: the batches of every epoch are split in cycle_length
+            interleaved shards that are read in parallel, followed by a prefetch. The dataset repeats over
+            epochs with a new shuffle each epoch, use steps_per_epoch=len(generator) in fit.
+        :param cycle_length: number of shards read in parallel
+        :param prefetch: number of prefetched batches, tf.data.AUTOTUNE by default
+        '''
+        import tensorflow as tf
+
+        nbatches = self.nwindows // self.batch_size
+        nvars = len(self.in_variables)
+        signature = (tf.TensorSpec(shape=(self.batch_size, self.backward, nvars), dtype=self.dtype),
+                     tf.TensorSpec(shape=(self.batch_size, nvars), dtype=self.dtype))
+
+        def shard_batches(epoch, shard):
+            for index in range(shard, nbatches, cycle_length):
+                yield self.batch(index, epoch)
+
+        def epoch_batches(epoch):
+            shards = tf.data.Dataset.range(cycle_length)
+            return shards.interleave(
+                lambda shard: tf.data.Dataset.from_generator(shard_batches, output_signature=signature,
+                                                             args=(epoch, shard)),
+                cycle_length=cycle_length, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
 
+        dataset = tf.data.Dataset.counter().flat_map(epoch_batches)
+        return dataset.prefetch(tf.data.AUTOTUNE if prefetch is None else prefetch)
 
 
 '''
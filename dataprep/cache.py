@@ -0,0 +1,104 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+
+from sklearn.preprocessing import MinMaxScaler
+
+import logging
+
+logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('RL-Logger')
+logger.setLevel(logging.INFO)
+
+## Bump when the on-disk layout or the env preprocessing changes, old entries are then ignored
+CACHE_VERSION = 1
+
+
+def cache_key(filename, **params):
+    '''
+    Description:
+        Key of a cached dataset: the source file (path, size and mtime) and the preprocessing parameters
+    :param filename: source data file
+    :param params: json serializable parameters that change the cached content
+    :return: hex digest
+    '''
+    stat = os.stat(filename)
+    source = {'path': os.path.abspath(filename), 'size': stat.st_size, 'mtime': stat.st_mtime,
+              'version': CACHE_VERSION}
+    description = json.dumps({'source': source, 'params': params}, sort_keys=True, default=str)
+    return hashlib.sha1(description.encode()).hexdigest()
+
+
+def scaler_params(scalers, variables):
+    # MinMaxScaler state as plain json values
+    return {var: {'data_min': float(scaler.data_min_[0]), 'data_max': float(scaler.data_max_[0]),
+                  'feature_range': list(scaler.feature_range)} for var, scaler in zip(variables, scalers)}
+
+
+def scalers_from_params(params, variables):
+    '''
+    Description:
+        Rebuild fitted MinMaxScalers from the parameters stored by scaler_params
+    :return: list of scalers in the order of variables
+    '''
+    scalers = []
+    for var in variables:
+        scaler = MinMaxScaler(feature_range=tuple(params[var]['feature_range']))
+        scaler.fit(np.array([[params[var]['data_min']], [params[var]['data_max']]]))
+        scalers.append(scaler)
+    return scalers
+
+
+def cached_series(filename, variables, build, nrows=None, look_back=None, scaling='minmax', cache_dir=None,
+                  mmap=True):
+    '''
+    Description:
+        Cleaned and scaled (time, nvars) float32 series of an env, built once and then memory-mapped
+        from {cache_dir}/{key}/series.npy. The scale parameters are stored next to it in manifest.json.
+        The key combines the source file with the variables, nrows, look_back, scaling method and the
+        build function, so changing any of them builds a new entry.
+        Entries are written to a temporary directory and renamed, concurrent builds of the same
+        entry (e.g. parallel workers) keep the first one that finished.
+        With mmap the series is not copied into the process: all processes that map the same entry
+        share its pages read-only through the OS page cache.
+    :param filename: source data file
+    :param variables: list of variables (series columns)
+    :param build: function returning (series, scale parameters as json serializable dict)
+    :param nrows: number of rows read from the source file
+    :param look_back: window length used by the env
+    :param scaling: name of the scaling method applied by build
+    :param cache_dir: cache location, defaults to .cache next to the source file
+    :param mmap: memory-map the series (read-only) instead of loading a private copy
+    :return: series, scale parameters
+    '''
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(filename)), '.cache')
+    key = cache_key(filename, variables=list(variables), nrows=nrows, look_back=look_back, scaling=scaling,
+                    build='{}.{}'.format(build.__module__, build.__qualname__))
+    entry_dir = os.path.join(cache_dir, key)
+    manifest_name = os.path.join(entry_dir, 'manifest.json')
+
+    if not os.path.exists(manifest_name):
+        logger.info('Building dataset cache for {}'.format(filename))
+        series, params = build()
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=key + '.', dir=cache_dir)
+        np.save(os.path.join(tmp_dir, 'series.npy'), np.ascontiguousarray(series, dtype=np.float32))
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as json_file:
+            json.dump({'source': os.path.abspath(filename), 'variables': list(variables), 'nrows': nrows,
+                       'look_back': look_back, 'scaling': scaling, 'shape': list(np.shape(series)),
+                       'scale_params': params}, json_file, indent=1)
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    with open(manifest_name) as json_file:
+        manifest = json.load(json_file)
+    series = np.load(os.path.join(entry_dir, 'series.npy'), mmap_mode='r' if mmap else None)
+    return series, manifest['scale_params']
@@ -0,0 +1,150 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+import logging
+
+logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('RL-Logger')
+logger.setLevel(logging.INFO)
+
+## Bump when the on-disk layout changes
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+
+
+class ColumnarWriter:
+    def __init__(self, dirname, partition_freq='1h', dtype=np.float32):
+        '''
+        Description:
+            Writes processed (time indexed) data as a columnar dataset: the rows are partitioned by time
+            and every partition is a compressed npz file holding the time stamps (int64 ns) and one array
+            per column, so readers only decompress the columns they ask for. manifest.json lists the
+            columns and the time range of every partition.
+            Dataframes can be appended chunk by chunk (e.g. from the streaming reformat), a partition
+            split over several chunks is stored as several parts.
+        :param dirname: output directory
+        :param partition_freq: time span of a partition
+        :param dtype: column type
+        '''
+        self.dirname = dirname
+        self.partition_freq = partition_freq
+        self.dtype = np.dtype(dtype)
+        self.columns = None
+        self.parts = []
+        os.makedirs(dirname, exist_ok=True)
+        ## Remove a previous dataset, the manifest last so an interrupted write is never read as complete
+        if os.path.exists(os.path.join(dirname, MANIFEST)):
+            os.remove(os.path.join(dirname, MANIFEST))
+        for name in os.listdir(dirname):
+            if name.startswith('part-') and name.endswith('.npz'):
+                os.remove(os.path.join(dirname, name))
+
+    def append(self, df):
+        if self.columns is None:
+            self.columns = [str(column) for column in df.columns]
+        time = df.index.values.astype('datetime64[ns]').view(np.int64)
+        partitions = np.asarray(df.index.floor(self.partition_freq).values.astype('datetime64[ns]').view(np.int64))
+        ## Rows are time ordered, so every partition is one contiguous block
+        bounds = np.flatnonzero(np.diff(partitions)) + 1
+        for start, stop in zip(np.append(0, bounds), np.append(bounds, len(df))):
+            if stop > start:
+                self._write_part(time[start:stop], df.values[start:stop])
+
+    def _write_part(self, time, values):
+        name = 'part-{:06d}.npz'.format(len(self.parts))
+        arrays = {'time': time}
+        for i in range(len(self.columns)):
+            arrays['col{}'.format(i)] = np.ascontiguousarray(values[:, i], dtype=self.dtype)
+        np.savez_compressed(os.path.join(self.dirname, name), **arrays)
+        self.parts.append({'file': name, 'start': int(time[0]), 'stop': int(time[-1]), 'nrows': len(time)})
+
+    def close(self):
+        manifest = {'version': FORMAT_VERSION, 'columns': self.columns or [], 'dtype': self.dtype.name,
+                    'partition_freq': self.partition_freq, 'parts': self.parts}
+        tmp_name = os.path.join(self.dirname, MANIFEST + '.tmp')
+        with open(tmp_name, 'w') as json_file:
+            json.dump(manifest, json_file, indent=1)
+        os.replace(tmp_name, os.path.join(self.dirname, MANIFEST))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+def write_columnar(df, dirname, partition_freq='1h', dtype=np.float32):
+    '''
+    Description:
+        Write a time indexed dataframe as columnar dataset, see ColumnarWriter
+    '''
+    with ColumnarWriter(dirname, partition_freq=partition_freq, dtype=dtype) as writer:
+        writer.append(df)
+
+
+def _to_ns(time):
+    return None if time is None else pd.Timestamp(time).as_unit('ns').value
+
+
+def load_columnar(dirname, variables=None, start=None, stop=None, nrows=None):
+    '''
+    Description:
+        Read a columnar dataset: only the partitions overlapping [start, stop) are opened and only the
+        requested variables are decompressed, straight into one preallocated array
+    :param dirname: dataset directory written by ColumnarWriter
+    :param variables: list of variables, None reads all columns
+    :param start: first time stamp (anything pd.Timestamp accepts), None from the beginning
+    :param stop: end time stamp (excluded), None to the end
+    :param nrows: maximum number of rows
+    :return: time (datetime64[ns]) array, (nrows, nvars) array in the stored column type
+    '''
+    with open(os.path.join(dirname, MANIFEST)) as json_file:
+        manifest = json.load(json_file)
+    columns = manifest['columns']
+    variables = columns if variables is None else list(variables)
+    missing = [var for var in variables if var not in columns]
+    if len(missing) > 0:
+        raise KeyError('Variables {} not in {}'.format(missing, dirname))
+    members = ['col{}'.format(columns.index(var)) for var in variables]
+
+    start_ns, stop_ns = _to_ns(start), _to_ns(stop)
+    parts = [part for part in manifest['parts']
+             if (start_ns is None or part['stop'] >= start_ns) and (stop_ns is None or part['start'] < stop_ns)]
+    capacity = sum(part['nrows'] for part in parts)
+    if nrows is not None:
+        capacity = min(capacity, nrows)
+    time = np.empty(capacity, dtype=np.int64)
+    values = np.empty((capacity, len(variables)), dtype=manifest['dtype'])
+
+    size = 0
+    for part in parts:
+        if size >= capacity:
+            break
+        with np.load(os.path.join(dirname, part['file'])) as npz:
+            part_time = npz['time']
+            lo = 0 if start_ns is None else np.searchsorted(part_time, start_ns)
+            hi = len(part_time) if stop_ns is None else np.searchsorted(part_time, stop_ns)
+            hi = min(hi, lo + capacity - size)
+            n = hi - lo
+            time[size:size + n] = part_time[lo:hi]
+            for j, member in enumerate(members):
+                values[size:size + n, j] = npz[member][lo:hi]
+        size += n
+    return time[:size].view('datetime64[ns]'), values[:size]
+
+
+def load_columnar_frame(dirname, variables=None, start=None, stop=None, nrows=None):
+    '''
+    Description:
+        load_columnar as a dataframe with a time column, the layout returned by load_reformated_cvs
+    '''
+    time, values = load_columnar(dirname, variables, start=start, stop=stop, nrows=nrows)
+    if variables is None:
+        with open(os.path.join(dirname, MANIFEST)) as json_file:
+            variables = json.load(json_file)['columns']
+    df = pd.DataFrame(values, columns=list(variables))
+    df.insert(0, 'time', time)
+    return df
@@ -1,70 +1,366 @@
+import os
 import pandas as pd
 import h5py
 import numpy as np
 import datetime
-from functools import reduce
+import gzip
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 from sklearn.preprocessing import MinMaxScaler
+from dataprep.columnar import ColumnarWriter, write_columnar, load_columnar_frame, MANIFEST
+from numpy.lib.stride_tricks import sliding_window_view
 
 ## TODO: Another ugly hack
 look_back=150
 look_forward=1
+## Same time stamp format for every row, independent of how the rows are split into chunks
+CSV_DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
 
-def reformat_data(filename, data_type='h5'):
+def _grid_origin(store, h5_keys):
+    '''
+    Description:
+        Start of the resampling grid shared by all keys: midnight of the earliest first row. The keys are
+        aligned on their time bins, so they have to be binned on the same grid even if they start on different days.
+    :param store: open pandas HDFStore of the RAW h5 file
+    :param h5_keys: device keys
+    :return: origin timestamp, 'start_day' if all keys are empty
+    '''
+    starts = [store.select(key, start=0, stop=1).utc_seconds for key in h5_keys]
+    starts = [pd.to_datetime(start.iloc[0], unit='s') for start in starts if len(start) > 0]
+    return min(starts).normalize() if len(starts) > 0 else 'start_day'
+
+
+def _bin_key(filename, key, freq='66ms', origin='start_day'):
+    '''
+    Description:
+        Read one device key of the RAW h5 file and average it onto the resampling grid
+    :param filename: the name of the RAW h5 file for the ACNET ParamData
+    :param key: device key
+    :param freq: resampling frequency
+    :param origin: start of the resampling grid, see _grid_origin
+    :return: series named after the key, indexed by time bin, empty bins are dropped
+    '''
+    series = _clean_key(pd.read_hdf(filename, key), key)
+    ## TODO: double check if using mean will cause any problems
+    return series.resample(freq, origin=origin).mean().dropna()
+
+
+def _clean_key(df, key):
+    # Raw (utc_seconds, value) rows as a time indexed series, rows with inf/nan are dropped
+    df = df.replace([np.inf, -np.inf], np.nan)
+    df = df.dropna(axis=0)
+    series = pd.Series(pd.to_numeric(df.value).values, index=pd.to_datetime(df.utc_seconds.values, unit='s'),
+                       name=key)
+    series.index.name = 'time'
+    return series
+
+
+class _BinnedKeyStream:
+    def __init__(self, store, key, chunksize, origin, freq='66ms'):
+        '''
+        Description:
+            Reads one time ordered device key of the RAW h5 file in chunks of rows and bins every chunk
+            to the resampling grid. The rows of the last bin of a chunk are carried over to the next one,
+            so every bin is averaged over all its rows at once and matches the in-memory resampling.
+        :param store: open pandas HDFStore of the RAW h5 file
+        :param key: device key
+        :param chunksize: number of raw rows read at once
+        :param origin: start of the resampling grid, shared by all keys (see _grid_origin)
+        :param freq: resampling frequency
+        '''
+        self.store = store
+        self.key = key
+        self.chunksize = chunksize
+        self.freq = freq
+        self.bin = pd.Timedelta(freq)
+        self.start = 0
+        self.exhausted = False
+        self.origin = origin
+        self.carry = None
+        self.binned = []
+        ## Every bin before this time is final
+        self.complete_until = pd.Timestamp.min
+
+    def read(self):
+        df = self.store.select(self.key, start=self.start, stop=self.start + self.chunksize)
+        self.start += len(df)
+        self.exhausted = len(df) < self.chunksize
+        series = _clean_key(df, self.key)
+        if self.carry is not None:
+            series = pd.concat([self.carry, series])
+        if len(series) == 0:
+            if self.exhausted:
+                self.complete_until = pd.Timestamp.max
+            return
+
+        if self.exhausted:
+            self.carry = None
+            self.complete_until = pd.Timestamp.max
+        else:
+            ## Hold back the rows of the last (possibly incomplete) bin
+            bins = np.asarray((series.index - self.origin) // self.bin)
+            split = np.searchsorted(bins, bins[-1])
+            self.carry = series.iloc[split:]
+            series = series.iloc[:split]
+            self.complete_until = self.origin + int(bins[-1]) * self.bin
+        if len(series) > 0:
+            ## TODO: double check if using mean will cause any problems
+            self.binned.append(series.resample(self.freq, origin=self.origin).mean().dropna())
+
+    def pop(self, until):
+        # Remove and return the binned series before until
+        if len(self.binned) == 0:
+            return pd.Series([], name=self.key, dtype=np.float64,
+                             index=pd.DatetimeIndex([], dtype='datetime64[ns]', name='time'))
+        binned = pd.concat(self.binned)
+        split = len(binned) if until == pd.Timestamp.max else binned.index.searchsorted(until)
+        self.binned = [binned.iloc[split:]]
+        return binned.iloc[:split]
+
+
+def _reformat_streaming(filename, h5_keys, chunksize, write):
+    '''
+    Description:
+        Merge the binned keys of the RAW h5 file in time order: the key that lags behind is read next and
+        every time bin that is final for all keys is aligned and passed to write. The memory use is bounded
+        by about one chunk of rows per key, independent of the length of the file.
+    :param write: function called with every merged dataframe
+    '''
+    with pd.HDFStore(filename, 'r') as store:
+        origin = _grid_origin(store, h5_keys)
+        streams = [_BinnedKeyStream(store, key, chunksize, origin) for key in h5_keys]
+        emitted_until = pd.Timestamp.min
+        while not all(stream.exhausted for stream in streams):
+            lagging = min((stream for stream in streams if not stream.exhausted), key=lambda s: s.complete_until)
+            lagging.read()
+            until = min(stream.complete_until for stream in streams)
+            if until > emitted_until:
+                df = pd.concat([stream.pop(until) for stream in streams], axis=1, join='inner')
+                df = df.dropna(axis=0)
+                ## The chunks are appended to one table, so the index does not keep the frequency of a chunk
+                df.index = pd.DatetimeIndex(df.index, freq=None, name='time')
+                if len(df) > 0:
+                    write(df)
+                emitted_until = until
+
+
+def reformat_data(filename, data_type='h5', nworkers=None, chunksize=None):
     '''
     Description:
         Method used to reformat the original h5 files a common resampled time index.
-        This allows for easier data processing within the TF2 Dataset tools
+        This allows for easier data processing within the TF2 Dataset tools.
+        Every key is read and binned to the 66ms grid once by a pool of worker processes, the binned
+        series are then aligned with a single concat. Only time bins where every key has data are kept.
+        All keys share one grid, starting at midnight of the earliest sample.
+        With chunksize the keys are instead streamed in chunks of rows and the output is appended chunk by
+        chunk, for archives that do not fit in memory. The output matches the in-memory path.
+        The columnar output (see dataprep.columnar) is written to the directory filename_processed.
     :param filename: the name of the RAW h5 file for the ACNET ParamData
-    :param data_type: output data type (h5 or csv)
+    :param data_type: output data type (h5, csv or columnar)
+    :param nworkers: number of worker processes (default: number of cpus), 1 reads the keys in this process
+    :param chunksize: number of raw rows per key read at once in streaming mode, None reads whole keys
     :return: dictionary with method status
     '''
     status = {'Status': 'OK'}
-    if data_type!='h5' and data_type!='csv':
+    if data_type not in ['h5', 'csv', 'columnar']:
         return {'Status': 'Failed', 'Message': '"{}" is not a valid output data file type.'.format(data_type)}
 
     # Find keys ##
-    f = h5py.File(filename, 'r')
-    h5_keys = list(f.keys())
+    with h5py.File(filename, 'r') as f:
+        h5_keys = list(f.keys())
     print('keys:{}'.format(h5_keys))
     print(len(h5_keys))
 
+    if chunksize is not None:
+        return _reformat_data_streaming(filename, h5_keys, data_type, chunksize, status)
+
     ## Read data and reformat ##
-    valid_dfs = []
-    valid_keys = []
-    for i,key in enumerate(h5_keys):
-        df = pd.read_hdf(filename,key)
-        df = df.replace([np.inf, -np.inf], np.nan)
-        df = df.dropna(axis=0)
-        df_new          = pd.DataFrame()
-        df_new['time']  = pd.to_datetime(df.utc_seconds,unit='s')
-        df_new[key]     = pd.to_numeric(df.value)
-        ## TODO: double check if using mean will cause any problems
-        df_new          = df_new.reset_index().set_index('time').resample('66ms').mean()
-        del df_new['index']
-        valid_keys.append(key)
-        valid_dfs.append(df_new)
+    ## Each worker holds one raw key at a time, only the binned series are sent back
+    with pd.HDFStore(filename, 'r') as store:
+        origin = _grid_origin(store, h5_keys)
+    if nworkers == 1:
+        valid_series = [_bin_key(filename, key, origin=origin) for key in h5_keys]
+    else:
+        with ProcessPoolExecutor(max_workers=nworkers) as executor:
+            valid_series = list(executor.map(_bin_key, repeat(filename), h5_keys, repeat('66ms'), repeat(origin)))
+    valid_keys = [series.name for series in valid_series]
 
     ## Print available variables ##
     print('valid_keys',valid_keys)
 
-    df_merged = reduce(lambda  left,right: pd.merge(left,right,on=['time'],how='outer'), valid_dfs)
-    df_merged = df_merged.reset_index().set_index('time').resample('66ms').mean()
-    df_merged = df_merged.replace([np.inf, -np.inf], np.nan)
+    df_merged = pd.concat(valid_series, axis=1, join='inner')
     df_merged = df_merged.dropna(axis=0)
+    ## Whether the index keeps a frequency depends on gaps in the data, it is not stored (as in streaming mode)
+    df_merged.index = pd.DatetimeIndex(df_merged.index, freq=None, name='time')
 
     if data_type=='h5':
-        df_merged.to_hdf(filename+'_processed.h5', 'ACNET')
+        df_merged.to_hdf(filename+'_processed.h5', key='ACNET')
 
     if data_type=='csv':
         ## Regular CSV
-        df_merged.to_csv(filename + '_processed.csv')
+        df_merged.to_csv(filename + '_processed.csv', date_format=CSV_DATE_FORMAT)
         ## Compressed CSV
-        df_merged.to_csv(filename + '_processed.csv.gz', compression='gzip')
+        df_merged.to_csv(filename + '_processed.csv.gz', compression='gzip', date_format=CSV_DATE_FORMAT)
+
+    if data_type=='columnar':
+        write_columnar(df_merged, filename + '_processed')
+
+    return status
+
+
+class _FixedFormatWriter:
+    def __init__(self, filename, columns, key='ACNET'):
+        '''
+        Description:
+            Writes a time indexed dataframe chunk by chunk in the pandas fixed h5 format, the layout written
+            by DataFrame.to_hdf (axis0, axis1, block0_items and block0_values). The first row is written by
+            pandas as template for the nodes and their attributes. The chunks are appended to resizable
+            datasets of a temporary file, on close the index and values are copied block by block into
+            the nodes of the template.
+        :param filename: output h5 file
+        :param columns: columns of the dataframe, used if no chunk is appended
+        :param key: group of the dataframe
+        '''
+        self.filename = filename
+        self.columns = columns
+        self.key = key
+        self.tmp_name = filename + '.tmp'
+        self.tmp = h5py.File(self.tmp_name, 'w')
+        self.index = None
+        self.values = None
+
+    def append(self, df):
+        if self.index is None:
+            df.iloc[:1].to_hdf(self.filename, key=self.key, mode='w')
+            self.index = self.tmp.create_dataset('axis1', shape=(0,), maxshape=(None,), dtype=np.int64,
+                                                 chunks=(65536,))
+            ncols = df.shape[1]
+            self.values = self.tmp.create_dataset('block0_values', shape=(0, ncols), maxshape=(None, ncols),
+                                                  dtype=df.values.dtype, chunks=(max(65536 // ncols, 1), ncols))
+        nrows = len(self.index)
+        self.index.resize((nrows + len(df),))
+        self.index[nrows:] = df.index.values.astype('datetime64[ns]').view(np.int64)
+        self.values.resize((nrows + len(df), self.values.shape[1]))
+        self.values[nrows:] = df.values
+
+    def close(self):
+        if self.index is None:
+            pd.DataFrame(columns=self.columns, dtype=np.float64,
+                         index=pd.DatetimeIndex([], dtype='datetime64[ns]', name='time')).to_hdf(
+                self.filename, key=self.key, mode='w')
+        else:
+            with h5py.File(self.filename, 'r+') as f:
+                group = f[self.key]
+                for name, data in [('axis1', self.index), ('block0_values', self.values)]:
+                    attrs = [(attr, value, group[name].attrs.get_id(attr).dtype)
+                             for attr, value in group[name].attrs.items()]
+                    del group[name]
+                    node = group.create_dataset(name, shape=data.shape, dtype=data.dtype)
+                    for attr, value, dtype in attrs:
+                        node.attrs.create(attr, value, dtype=dtype)
+                    step = 1 << 20
+                    for start in range(0, len(data), step):
+                        node[start:start + step] = data[start:start + step]
+        self.tmp.close()
+        os.remove(self.tmp_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.tmp.close()
+            os.remove(self.tmp_name)
+
+
+def _reformat_data_streaming(filename, h5_keys, data_type, chunksize, status):
+    ## Append the merged chunks to the output files as they come
+    if data_type=='h5':
+        with _FixedFormatWriter(filename+'_processed.h5', h5_keys) as writer:
+            _reformat_streaming(filename, h5_keys, chunksize, writer.append)
+
+    if data_type=='csv':
+        with open(filename + '_processed.csv', 'w', newline='') as csv_file, \
+                gzip.open(filename + '_processed.csv.gz', 'wt', newline='') as gz_file:
+            def write(df):
+                header = csv_file.tell() == 0
+                df.to_csv(csv_file, header=header, date_format=CSV_DATE_FORMAT)
+                df.to_csv(gz_file, header=header, date_format=CSV_DATE_FORMAT)
+            _reformat_streaming(filename, h5_keys, chunksize, write)
+
+    if data_type=='columnar':
+        with ColumnarWriter(filename + '_processed') as writer:
+            _reformat_streaming(filename, h5_keys, chunksize, writer.append)
 
+    print('valid_keys',h5_keys)
     return status
 
+def rechunk_processed(filename, output, chunk_rows=4096, compression=None):
+    '''
+    Description:
+        Copy a processed h5 file (as written by reformat_data) with the values re-chunked for window access:
+        every chunk holds chunk_rows consecutive time steps of a single variable, so reading a block of rows
+        for a few variables only touches the chunks of those variables. The file stays readable with
+        load_reformated_hdf5 and the DataGenerator.
+    :param filename: processed h5 file
+    :param output: re-chunked h5 file
+    :param chunk_rows: time steps per chunk, should cover a few batch spans (batch_size + window length)
+    :param compression: h5py compression filter of the values (e.g. 'gzip'), None to store them uncompressed
+    '''
+    with h5py.File(filename, 'r') as src, h5py.File(output, 'w') as dst:
+        _copy_attrs(src, dst)
+        ## Index and column names are copied as they are, only the values are rewritten
+        group = dst.create_group('ACNET')
+        _copy_attrs(src['ACNET'], group)
+        for name, node in src['ACNET'].items():
+            if name != 'block0_values':
+                src.copy(node, group, name=name)
+                continue
+            nrows = node.shape[0]
+            values = group.create_dataset(name, shape=node.shape, dtype=node.dtype,
+                                          chunks=(max(min(chunk_rows, nrows), 1), 1), compression=compression)
+            _copy_attrs(node, values)
+            ## PyTables reads chunked arrays as CArray
+            values.attrs.create('CLASS', np.bytes_(b'CARRAY'), dtype=node.attrs.get_id('CLASS').dtype)
+            ## Copy a block of chunks at a time to bound the memory use
+            step = chunk_rows * 16
+            for start in range(0, nrows, step):
+                values[start:start + step] = node[start:start + step]
+
+
+def _copy_attrs(src, dst):
+    # Keep the stored attribute types, PyTables and pandas check them
+    for name, value in src.attrs.items():
+        dst.attrs.create(name, value, dtype=src.attrs.get_id(name).dtype)
+
+
+def processed_source(filename):
+    '''
+    Description:
+        Columnar copy of a processed csv file if there is one: the directory written next to it by
+        reformat_data (filename_processed.csv -> filename_processed) or, for other csv files,
+        name.csv -> name_processed. Otherwise the csv file itself.
+    :param filename: csv or compressed csv file
+    :return: columnar directory or filename, to be read with load_reformated_cvs
+    '''
+    stem = filename
+    for suffix in ['.csv.gz', '.csv']:
+        if stem.endswith(suffix):
+            stem = stem[:-len(suffix)]
+            break
+    dirname = stem if stem.endswith('_processed') else stem + '_processed'
+    if os.path.exists(os.path.join(dirname, MANIFEST)):
+        return dirname
+    return filename
+
 def load_reformated_cvs(filename,nrows=100000):
-    df = pd.read_csv(filename,nrows=nrows)
+    ## Columnar directories are read without parsing text, the frame has the same layout as the csv
+    if os.path.isdir(filename):
+        df = load_columnar_frame(filename, nrows=nrows)
+    else:
+        df = pd.read_csv(filename,nrows=nrows)
     df=df.replace([np.inf, -np.inf], np.nan)
     df=df.dropna(axis=0)
     return df
@@ -74,6 +370,24 @@ def load_reformated_hdf5(filename):
     print(df.columns)
     return df
 
+def create_windows(series, look_back=1, look_forward=1):
+    '''
+     Description:
+         Sliding windows over a (multivariate) time series as strided views, nothing is copied.
+         Window i holds series[i:i + look_back] as input and series[i + look_back:i + look_back + look_forward]
+         as output, for the same windows as create_dataset. Copies only happen when windows are gathered,
+         e.g. X[batch_ids] or np.copy(X[i]).
+     :param series: numpy array (time,) or (time, nvars)
+     :param look_back: number of time step before prediction
+     :param look_forward: number of time step to prediction
+     :return: two read-only views (input,output) with shapes (N, [nvars,] look_back) and (N, [nvars,] look_forward)
+     '''
+    offset = look_back + look_forward
+    nwindows = max(len(series) - (offset + 1), 0)
+    windows = sliding_window_view(series, offset, axis=0)[:nwindows]
+    return windows[..., :look_back], windows[..., look_back:]
+
+
 def create_dataset(dataset, look_back=1, look_forward=1):
     '''
      Description:
@@ -82,16 +396,33 @@ def create_dataset(dataset, look_back=1, look_forward=1):
      :param dataset: pandas dataframe with variable
      :param look_back: number of time step before prediction
      :param look_forward: number of time step to prediction
-     :return: two numpy array (input,output)
+     :return: two numpy array views (input,output)
      '''
-    X, Y = [], []
-    offset = look_back + look_forward
-    for i in range(len(dataset) - (offset + 1)):
-        xx = dataset[i:(i + look_back), 0]
-        yy = dataset[(i + look_back):(i + offset), 0]
-        X.append(xx)
-        Y.append(yy)
-    return np.array(X), np.array(Y)
+    return create_windows(np.asarray(dataset)[:, 0], look_back, look_forward)
+
+
+def get_scaled_series(dataframe, variables, split_fraction=0.8, feature_range=(0, 1)):
+    '''
+     Description:
+         Scale each variable with its own MinMaxScaler (fit on the full series) and split the
+         variables, stacked as one contiguous (time, nvars) float32 array, into train/test series
+     :param dataframe: pandas dataframe
+     :param variables: list of variables
+     :param split_fraction: desired split fraction between train and test
+     :param feature_range: MinMaxScaler range, None keeps the values unscaled
+     :return: scalers (None if not scaled), train series, test series
+    '''
+    series = np.ascontiguousarray(dataframe[variables].values, dtype=np.float32)
+    scalers = None
+    if feature_range is not None:
+        scalers = []
+        for v in range(len(variables)):
+            scaler = MinMaxScaler(feature_range=feature_range)
+            series[:, v] = scaler.fit_transform(series[:, v:v + 1])[:, 0]
+            scalers.append(scaler)
+
+    train_size = int(len(series) * split_fraction)
+    return scalers, series[0:train_size], series[train_size:len(series)]
 
 
 def get_dataset(dataframe, variable='B:VIMIN', split_fraction=0.8,concate_axis=1):
@@ -103,45 +434,22 @@ def get_dataset(dataframe, variable='B:VIMIN', split_fraction=0.8,concate_axis=1
      :param split_fraction: desired split fraction between train and test
      :return: scaler, (x-train,y-train), (x-test,y-test)
     '''
-    dataset = dataframe[variable].values
-    dataset = dataset.astype('float32')
-    dataset = np.reshape(dataset, (-1, 1))
-    scaler = MinMaxScaler(feature_range=(0, 1))
-    dataset = scaler.fit_transform(dataset)
-
-    ## TODO: Fix
-    #print(len(dataset))
-    train_size = int(len(dataset) * split_fraction)
-    #print(train_size)
-    test_size = len(dataset) - train_size
-    #print(test_size)
-
-    ## Split dataset
-    train, test = dataset[0:train_size, :], dataset[train_size:len(dataset), :]
-
-    ## Create train dataset
-    X_train, Y_train = create_dataset(train, look_back, look_forward)
-    X_train = np.reshape(X_train, (X_train.shape[0], 1, X_train.shape[1]))
-    Y_train = np.reshape(Y_train, (Y_train.shape[0], Y_train.shape[1]))
-
-    ## Create test dataset
-    X_test, Y_test = create_dataset(test, look_back, look_forward)
-    X_test = np.reshape(X_test, (X_test.shape[0], 1, X_test.shape[1]))
-    Y_test = np.reshape(Y_test, (Y_test.shape[0], Y_test.shape[1]))
-    #print(X_test.shape)
-    #print(Y_test.shape)
-    return scaler, X_train, Y_train, X_test, Y_test
+    scalers, X_train, Y_train, X_test, Y_test = get_datasets(dataframe, variables=[variable],
+                                                             split_fraction=split_fraction)
+    return scalers[0], X_train, Y_train, X_test, Y_test
 
 
 def get_datasets(dataframe,variables = ['B:VIMIN', 'B:IMINER', 'B:LINFRQ', 'I:IB', 'I:MDAT40'],split_fraction=0.8,concate_axis=1):
-    data_list = []
-    scalers = []
-    for v in range(len(variables)):
-        data_list.append(get_dataset(dataframe,variable=variables[v],split_fraction=split_fraction))
-    ## TODO: Horrible hack that should quickly be fixed
-    scalers = [data_list[0][0],data_list[1][0],data_list[2][0],data_list[3][0],data_list[4][0]]
-    X_train = np.concatenate((data_list[0][1], data_list[1][1], data_list[2][1], data_list[3][1], data_list[4][1]), axis=concate_axis)
-    Y_train = np.concatenate((data_list[0][2], data_list[1][2], data_list[2][2], data_list[3][2], data_list[4][2]), axis=1)
-    X_test = np.concatenate((data_list[0][3], data_list[1][3], data_list[2][3], data_list[3][3], data_list[4][3]), axis=concate_axis)
-    Y_test = np.concatenate((data_list[0][4], data_list[1][4], data_list[2][4], data_list[3][4], data_list[4][4]), axis=1)
+    '''
+     Description:
+         Multivariate version of get_dataset, the inputs are (N, nvars, look_back) window views
+         into one scaled (time, nvars) series per split
+     :return: scalers, x-train, y-train, x-test, y-test
+    '''
+    scalers, train, test = get_scaled_series(dataframe, variables, split_fraction=split_fraction)
+    X_train, Y_train = create_windows(train, look_back, look_forward)
+    X_test, Y_test = create_windows(test, look_back, look_forward)
+    ## Outputs are small (look_forward values per window) and are returned as (N, nvars*look_forward)
+    Y_train = np.reshape(Y_train, (Y_train.shape[0], -1))
+    Y_test = np.reshape(Y_test, (Y_test.shape[0], -1))
     return scalers,X_train,Y_train,X_test,Y_test
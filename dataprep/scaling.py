@@ -0,0 +1,89 @@
+import joblib
+import numpy as np
+
+from functools import lru_cache
+
+
+class AffineScaler:
+    def __init__(self, scale, offset):
+        '''
+        Description:
+            Per-variable affine scaling, scaled = values * scale + offset.
+            Replaces per-variable sklearn scalers (and the median/range dictionaries of the robust scaling)
+            in the env step loops: the coefficients are plain numpy vectors and the transforms work on
+            any number of variables and samples at once.
+        :param scale: one scale factor per variable
+        :param offset: one offset per variable
+        '''
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.offset = np.asarray(offset, dtype=np.float64)
+        self.inverse_scale = 1 / self.scale
+        self.inverse_offset = -self.offset / self.scale
+
+    @classmethod
+    def from_minmax(cls, scalers):
+        # One fitted (single feature) MinMaxScaler per variable
+        return cls(np.concatenate([scaler.scale_ for scaler in scalers]),
+                   np.concatenate([scaler.min_ for scaler in scalers]))
+
+    @classmethod
+    def from_robust(cls, scale_dict, variables):
+        # (value - median) / range, see all_inplace_scale in surrogate_accelerator_v4
+        ranges = np.array([scale_dict[str(var)]['range'] for var in variables], dtype=np.float64)
+        medians = np.array([scale_dict[str(var)]['median'] for var in variables], dtype=np.float64)
+        return cls(1 / ranges, -medians / ranges)
+
+    @classmethod
+    def load(cls, filenames):
+        '''
+        Description:
+            Convert saved sklearn MinMaxScalers (e.g. surrogate_models/scaler_var*_nsteps250k.pkl),
+            every file is only read once per process
+        :param filenames: list of pickle files, one per variable
+        '''
+        return cls.from_minmax([_load_scaler(filename) for filename in filenames])
+
+    def _coefficients(self, scale, offset, variables, axis, ndim):
+        if variables is None:
+            variables = slice(None)
+        scale, offset = scale[variables], offset[variables]
+        if np.ndim(scale) == 0 or axis == -1 or axis == ndim - 1:
+            return scale, offset
+        shape = [1] * ndim
+        shape[axis] = -1
+        return scale.reshape(shape), offset.reshape(shape)
+
+    def transform(self, values, variables=None, axis=-1):
+        '''
+        Description:
+            Scale values
+        :param values: array with the variables along axis
+        :param variables: index of a single variable (any values shape) or slice/list of the variables in values
+        :param axis: variable axis of values
+        :return: scaled copy of values
+        '''
+        scale, offset = self._coefficients(self.scale, self.offset, variables, axis, np.ndim(values))
+        return values * scale + offset
+
+    def inverse_transform(self, values, variables=None, axis=-1):
+        scale, offset = self._coefficients(self.inverse_scale, self.inverse_offset, variables, axis,
+                                           np.ndim(values))
+        return values * scale + offset
+
+    def transform_inplace(self, values, variables=None, axis=-1):
+        scale, offset = self._coefficients(self.scale, self.offset, variables, axis, np.ndim(values))
+        values *= scale
+        values += offset
+        return values
+
+    def inverse_transform_inplace(self, values, variables=None, axis=-1):
+        scale, offset = self._coefficients(self.inverse_scale, self.inverse_offset, variables, axis,
+                                           np.ndim(values))
+        values *= scale
+        values += offset
+        return values
+
+
+@lru_cache(maxsize=None)
+def _load_scaler(filename):
+    return joblib.load(filename)
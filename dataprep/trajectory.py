@@ -0,0 +1,120 @@
+import os
+import glob
+import json
+import numpy as np
+
+## Columns of a trajectory log and their on-disk types (state columns keep the observation shape)
+COLUMNS = [('state', np.float32), ('action', np.int32), ('reward', np.float32), ('next_state', np.float32),
+           ('total_reward', np.float32), ('done', np.bool_), ('policy_type', np.int8), ('episode', np.int32)]
+
+
+class TrajectoryRecorder:
+    def __init__(self, filename, chunk_size=10000, episodes_per_chunk=10):
+        '''
+        Description:
+            Buffered binary replacement for the per-step csv writer of the drivers.
+            Steps are stored in typed column buffers and written as compressed npz chunks
+            ({filename}_chunk000000.npz, ...) when the buffer is full or every episodes_per_chunk episodes.
+            Chunks are written to a temporary file first, so a run that is interrupted leaves only
+            complete chunks behind.
+        :param filename: path prefix of the chunk files
+        :param chunk_size: maximum number of steps per chunk
+        :param episodes_per_chunk: number of finished episodes after which the buffer is flushed
+        '''
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.episodes_per_chunk = episodes_per_chunk
+        self.nchunks = len(glob.glob(filename + '_chunk*.npz'))
+        self.nrows = 0
+        self.nepisodes = 0
+        self.columns = None
+        path = os.path.dirname(os.path.abspath(filename))
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def _allocate(self, state):
+        state_shape = np.shape(np.squeeze(state))
+        self.columns = {}
+        for name, dtype in COLUMNS:
+            shape = (self.chunk_size,) + state_shape if name in ['state', 'next_state'] else (self.chunk_size,)
+            self.columns[name] = np.zeros(shape, dtype=dtype)
+
+    def record(self, state, action, reward, next_state, total_reward, done, policy_type, episode):
+        if self.columns is None:
+            self._allocate(state)
+        row = self.nrows
+        self.columns['state'][row] = np.reshape(state, self.columns['state'].shape[1:])
+        self.columns['action'][row] = action
+        self.columns['reward'][row] = np.squeeze(reward)
+        self.columns['next_state'][row] = np.reshape(next_state, self.columns['next_state'].shape[1:])
+        self.columns['total_reward'][row] = np.squeeze(total_reward)
+        self.columns['done'][row] = done
+        self.columns['policy_type'][row] = policy_type
+        self.columns['episode'][row] = episode
+        self.nrows += 1
+        if self.nrows >= self.chunk_size:
+            self.flush()
+
+    def end_episode(self):
+        self.nepisodes += 1
+        if self.nepisodes % self.episodes_per_chunk == 0:
+            self.flush()
+
+    def flush(self):
+        if self.nrows == 0:
+            return
+        chunk_name = '{}_chunk{:06d}.npz'.format(self.filename, self.nchunks)
+        tmp_name = chunk_name + '.tmp'
+        with open(tmp_name, 'wb') as chunk_file:
+            np.savez_compressed(chunk_file, **{name: column[:self.nrows] for name, column in self.columns.items()})
+        os.replace(tmp_name, chunk_name)
+        self.nchunks += 1
+        self.nrows = 0
+
+    def close(self):
+        self.flush()
+
+
+def load_trajectories(filename, mmap=True):
+    '''
+    Description:
+        Load a trajectory log written by TrajectoryRecorder for offline analysis or replay.
+        The chunks are consolidated once into one .npy file per column ({filename}_columns/),
+        which are then memory-mapped. The consolidation is redone when new chunks were written.
+    :param filename: path prefix used by the recorder
+    :param mmap: memory-map the columns (read-only) instead of loading them
+    :return: dictionary of column name to array
+    '''
+    chunk_names = sorted(glob.glob(filename + '_chunk*.npz'))
+    if len(chunk_names) == 0:
+        raise FileNotFoundError('No trajectory chunks found for {}'.format(filename))
+    column_dir = filename + '_columns'
+    manifest_name = os.path.join(column_dir, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_name):
+        with open(manifest_name) as json_file:
+            manifest = json.load(json_file)
+
+    if manifest.get('chunks') != [os.path.basename(name) for name in chunk_names]:
+        if not os.path.exists(column_dir):
+            os.makedirs(column_dir)
+        chunks = [np.load(name) for name in chunk_names]
+        nrows = sum(len(chunk['action']) for chunk in chunks)
+        for name, dtype in COLUMNS:
+            shape = (nrows,) + chunks[0][name].shape[1:]
+            column = np.lib.format.open_memmap(os.path.join(column_dir, name + '.npy'), mode='w+',
+                                               dtype=dtype, shape=shape)
+            row = 0
+            for chunk in chunks:
+                values = chunk[name]
+                column[row:row + len(values)] = values
+                row += len(values)
+            column.flush()
+            del column
+        for chunk in chunks:
+            chunk.close()
+        with open(manifest_name, 'w') as json_file:
+            json.dump({'chunks': [os.path.basename(name) for name in chunk_names], 'nrows': nrows}, json_file)
+
+    mmap_mode = 'r' if mmap else None
+    return {name: np.load(os.path.join(column_dir, name + '.npy'), mmap_mode=mmap_mode) for name, _ in COLUMNS}
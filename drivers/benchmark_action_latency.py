@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import gym
+import time
+import logging
+import numpy as np
+
+from gym import spaces
+
+from agents.dqn import DQN
+from agents.dqn_ensemble_v1 import DQN as EnsembleDQN
+from agents.dqn_lstm import DQN as LSTMDQN
+
+#
+logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('RL-Logger')
+logger.setLevel(logging.INFO)
+
+# Control loop cadence given by the 66ms resampling in dataprep.dataset.reformat_data
+CONTROL_INTERVAL_MS = 66.0
+
+
+class SpacesOnlyEnv(gym.Env):
+    # The agents only need the spaces, so no surrogate model or data is loaded
+    def __init__(self, nobs=5, nactions=7):
+        self.observation_space = spaces.Box(low=0, high=+1, shape=(nobs,), dtype=np.float64)
+        self.action_space = spaces.Discrete(nactions)
+
+
+def time_calls(fn, states, warmup=20):
+    for state in states[:warmup]:
+        fn(state)
+    latencies = np.zeros(len(states))
+    for i, state in enumerate(states):
+        start = time.perf_counter()
+        fn(state)
+        latencies[i] = (time.perf_counter() - start) * 1000.0
+    return latencies
+
+
+def report(name, latencies):
+    p50, p99 = np.percentile(latencies, [50, 99])
+    print('{:28s} p50 {:8.3f} ms  p99 {:8.3f} ms  ({:5.1f}% of the {:.0f} ms interval at p99)'.format(
+        name, p50, p99, 100.0 * p99 / CONTROL_INTERVAL_MS, CONTROL_INTERVAL_MS))
+
+
+def keras_predict(agent, reshape):
+    def fn(state):
+        return np.argmax(agent.target_model.predict(np.asarray(state).reshape(reshape))[0])
+    return fn
+
+
+if __name__ == "__main__":
+    NCALLS = 2000
+    cfg = '../cfg/dqn_setup.json'
+    env = SpacesOnlyEnv()
+    states = np.random.rand(NCALLS, env.observation_space.shape[0])
+
+    agent = DQN(env, cfg=cfg, arch_type='MLP')
+    report('MLP keras predict', time_calls(keras_predict(agent, (1, -1)), states[:200]))
+    report('MLP play', time_calls(agent.play, states))
+
+    agent = DQN(env, cfg=cfg, arch_type='LSTM')
+    report('LSTM play', time_calls(agent.play, states))
+
+    agent = LSTMDQN(env, cfg=cfg)
+    report('LSTM agent play', time_calls(agent.play, states))
+
+    for nmodels in [4, 8, 16, 32]:
+        agent = EnsembleDQN(env, cfg=cfg, nmodels=nmodels)
+        report('Ensemble({}) play'.format(nmodels), time_calls(agent.play, states))
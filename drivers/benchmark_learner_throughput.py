@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import time
+import logging
+import numpy as np
+
+from agents.dqn import DQN
+from agents.dqn_ensemble_v1 import DQN as EnsembleDQN
+from agents.dqn_lstm import DQN as LSTMDQN
+
+from benchmark_action_latency import SpacesOnlyEnv
+
+#
+logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('RL-Logger')
+logger.setLevel(logging.INFO)
+
+
+def fill_memory(agent, env, ntransitions):
+    nobs = env.observation_space.shape[0]
+    for _ in range(ntransitions):
+        agent.remember(np.random.rand(nobs), env.action_space.sample(), np.random.rand(),
+                       np.random.rand(nobs), False)
+
+
+def numpy_target_train(agent):
+    # Previous target update, kept as the baseline: weights round-trip through NumPy on every step
+    def fn():
+        model_weights = agent.model.get_weights()
+        target_weights = agent.target_model.get_weights()
+        for i in range(len(target_weights)):
+            target_weights[i] = agent.tau * model_weights[i] + (1 - agent.tau) * target_weights[i]
+        agent.target_model.set_weights(target_weights)
+    return fn
+
+
+def steps_per_second(fn, nsteps, warmup=10):
+    for _ in range(warmup):
+        fn()
+    start = time.perf_counter()
+    for _ in range(nsteps):
+        fn()
+    return nsteps / (time.perf_counter() - start)
+
+
+def report(name, agent, nsteps):
+    update_rate = steps_per_second(agent.target_train, nsteps)
+    train_rate = steps_per_second(agent.train, nsteps)
+    print('{:36s} target update {:9.1f} /s  learner {:7.1f} steps/s'.format(name, update_rate, train_rate))
+
+
+if __name__ == "__main__":
+    NSTEPS = 200
+    HARD_UPDATE_INTERVAL = 100
+    cfg = '../cfg/dqn_setup.json'
+    env = SpacesOnlyEnv()
+
+    agents = [('MLP', lambda: DQN(env, cfg=cfg, arch_type='MLP')),
+              ('LSTM agent', lambda: LSTMDQN(env, cfg=cfg)),
+              ('Ensemble(8)', lambda: EnsembleDQN(env, cfg=cfg, nmodels=8))]
+
+    for name, make_agent in agents:
+        agent = make_agent()
+        fill_memory(agent, env, 1000)
+
+        in_graph_target_train = agent.target_train
+        agent.target_train = numpy_target_train(agent)
+        report('{} numpy soft update'.format(name), agent, NSTEPS)
+
+        agent.target_train = in_graph_target_train
+        report('{} in-graph soft update'.format(name), agent, NSTEPS)
+
+        agent.target_updater.hard_update_interval = HARD_UPDATE_INTERVAL
+        report('{} hard update every {}'.format(name, HARD_UPDATE_INTERVAL), agent, NSTEPS)
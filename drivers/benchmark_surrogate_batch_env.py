@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import time, logging
+import numpy as np
+import gym
+
+##
+logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('RL-Logger')
+logger.setLevel(logging.ERROR)
+
+if __name__ == "__main__":
+
+    NSTEPS = 200
+
+    env = gym.make('gym_accelerator:Surrogate_Accelerator-v1')
+    env.reset()
+    start = time.time()
+    for i in range(NSTEPS):
+        _, _, done, _ = env.step(env.action_space.sample())
+        if done:
+            env.reset()
+    print('Surrogate_Accelerator-v1: {:.1f} env steps/s'.format(NSTEPS / (time.time() - start)))
+
+    for nenvs in [64, 128, 256]:
+        env = gym.make('gym_accelerator:Surrogate_Accelerator_Batch-v1', nenvs=nenvs)
+        env.seed(0)
+        observations = env.reset()
+        assert observations.shape == (nenvs, env.nvariables)
+        start = time.time()
+        for i in range(NSTEPS):
+            observations, rewards, dones, info = env.step(np.random.randint(env.action_space.n, size=nenvs))
+        print('Surrogate_Accelerator_Batch-v1 ({}): {:.1f} env steps/s'.format(
+            nenvs, NSTEPS * nenvs / (time.time() - start)))
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import gym
+import time
+import logging
+import csv
+import os
+import random
+import numpy as np
+import tensorflow as tf
+
+from datetime import datetime
+
+# Framework class
+from agents.dqn import DQN
+from agents.actor_learner import ActorLearner
+
+# Seed value
+seed_value = 0
+os.environ['PYTHONHASHSEED'] = str(seed_value)
+random.seed(seed_value)
+np.random.seed(seed_value)
+tf.random.set_seed(seed_value)
+
+#
+logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('RL-Logger')
+logger.setLevel(logging.INFO)
+
+if __name__ == "__main__":
+
+    now = datetime.now()
+    timestamp = now.strftime("D%m%d%Y-T%H%M%S")
+    print("date and time:", timestamp)
+
+    # Train
+    EPISODES = 2000
+    NSTEPS = 50
+    cfg = '../cfg/dqn_setup.json'
+
+    # Setup environment
+    env_version = 1
+
+    def make_env():
+        env = gym.make('gym_accelerator:Surrogate_Accelerator-v{}'.format(env_version), shared_data=True)
+        env._max_episode_steps = NSTEPS
+        env.seed(random.randrange(2 ** 31))
+        return env
+
+    estart = time.time()
+    env = make_env()
+    end = time.time()
+    logger.info('Time init environment: %s' % str((end - estart) / 60.0))
+
+    # Setup agent
+    arch_type = 'MLP'
+    logger.info('Using DQN {}'.format(arch_type))
+    agent = DQN(env, cfg=cfg, arch_type=arch_type)
+    runner = ActorLearner(agent, make_env, cfg=cfg)
+    logger.info('Actors: {}, replay ratio: {}, policy sync interval: {}, queue depth: {}'.format(
+        runner.nactors, runner.replay_ratio, runner.policy_sync_interval, runner.queue_depth))
+
+    # Save information
+    save_directory = './results_dqn_actor_learner_{}_nactors{}_surrogate{}_{}/'.format(
+        arch_type, runner.nactors, env_version, timestamp)
+    if not os.path.exists(save_directory):
+        os.mkdir(save_directory)
+    logger.info('Save directory:{}'.format(save_directory))
+    safe_file_prefix = 'fnal_surrogate_dqn_actor_learner_episodes{}_steps{}_{}'.format(EPISODES, NSTEPS, timestamp)
+
+    report = runner.run(EPISODES, NSTEPS)
+
+    train_file_e = open(save_directory + safe_file_prefix + '_reduced_batched_memories.log', 'w')
+    train_writer_e = csv.writer(train_file_e, delimiter=" ")
+    for e, actor_id, total_reward in report['episode_rewards']:
+        train_writer_e.writerow([e, total_reward, actor_id])
+    train_file_e.close()
+
+    stats_file = open(save_directory + safe_file_prefix + '_utilization.log', 'w')
+    stats_writer = csv.writer(stats_file, delimiter=" ")
+    stats_writer.writerow(['env_steps', 'train_steps', 'wall_time', 'learner_utilization', 'actor_utilization'])
+    stats_writer.writerow([report['env_steps'], report['train_steps'], report['wall_time'],
+                           report['learner_utilization']] + list(report['actor_utilization']))
+    stats_file.close()
+
+    agent.save(save_directory + '/final/policy_model' + safe_file_prefix)
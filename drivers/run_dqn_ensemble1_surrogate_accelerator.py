@@ -9,6 +9,7 @@ logger = logging.getLogger('RL-Logger')
 logger.setLevel(logging.INFO)
 
 from agents.dqn_ensemble_v1 import DQN
+from dataprep.trajectory import TrajectoryRecorder
 
 if __name__ == "__main__":
 
@@ -49,8 +50,7 @@ if __name__ == "__main__":
     env.save_dir=save_directory
     ## Save infomation ##
     safe_file_prefix = 'fnal_surrogate_dqn_ensemble1_nmodels{}_mlp_episodes{}_steps{}_{}'.format(nmodels,EPISODES,NSTEPS,timestamp)
-    train_file_s = open(save_directory+safe_file_prefix+'_batched_memories.log','w')
-    train_writer_s = csv.writer(train_file_s, delimiter = " ")
+    recorder = TrajectoryRecorder(save_directory+safe_file_prefix+'_trajectories')
     train_file_e = open(save_directory+safe_file_prefix+'_reduced_batched_memories.log','w')
     train_writer_e = csv.writer(train_file_e, delimiter = " ")
 
@@ -74,8 +74,6 @@ if __name__ == "__main__":
             logger.info('Reward: %s' % str(reward))
             logger.info('Done: %s' % str(done))
 
-            ##
-            current_state = next_state
             ##
             total_reward+=reward
             step_counter += 1
@@ -85,9 +83,12 @@ if __name__ == "__main__":
                 done = True
 
             ## Save memory
-            train_writer_s.writerow([current_state,action,reward,next_state,total_reward,done,policy_type,e])
-            train_file_s.flush()
+            recorder.record(current_state,action,reward,next_state,total_reward,done,policy_type,e)
+
+            ##
+            current_state = next_state
 
+        recorder.end_episode()
         logger.info('total reward: %s' % str(total_reward))
         train_writer_e.writerow([e,total_reward])
         train_file_e.flush()
@@ -98,6 +99,6 @@ if __name__ == "__main__":
 
 
     agent.save(save_directory+'/final/policy_model'+safe_file_prefix)
-    train_file_s.close()
+    recorder.close()
 
 
@@ -8,6 +8,7 @@ logger = logging.getLogger('RL-Logger')
 logger.setLevel(logging.INFO)
 
 from agents.dqn_lstm import DQN
+from dataprep.trajectory import TrajectoryRecorder
 
 if __name__ == "__main__":
     ###########
@@ -35,8 +36,7 @@ if __name__ == "__main__":
     #################
     agent = DQN(env,cfg='../cfg/dqn_setup.json')
     ## Save infomation ##
-    train_file_s = open("data_accelerator_lstm_episode%s_steps%s_batched_memories_0602420_v1.log" % (str(EPISODES),str(NSTEPS)), 'w')
-    train_writer_s = csv.writer(train_file_s, delimiter = " ")   
+    recorder = TrajectoryRecorder("data_accelerator_lstm_episode%s_steps%s_trajectories_0602420_v1" % (str(EPISODES),str(NSTEPS)))
     
     for e in tqdm(range(EPISODES), desc='RL Episodes', leave=True):
         logger.info('Starting new episode: %s' % str(e))
@@ -59,8 +59,6 @@ if __name__ == "__main__":
             logger.info('Reward: %s' % str(reward))
             logger.info('Done: %s' % str(done))
             
-            ##
-            current_state = next_state
             ##
             total_reward+=reward
             step_counter += 1
@@ -70,8 +68,12 @@ if __name__ == "__main__":
                 done = True
 
             ## Save memory
-            train_writer_s.writerow([current_state,action,reward,next_state,total_reward,done,policy_type,e])
-            train_file_s.flush()
+            recorder.record(current_state,action,reward,next_state,total_reward,done,policy_type,e)
+
+            ##
+            current_state = next_state
+
+        recorder.end_episode()
         
         logger.info('total reward: %s' % str(total_reward))
         
@@ -81,4 +83,4 @@ if __name__ == "__main__":
            
             
     agent.save('./final/data_accelerator_mse_final')
-    train_file_s.close()
\ No newline at end of file
+    recorder.close()
\ No newline at end of file
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import gym
+import time
+import json
+import logging
+import csv
+import os
+import random
+import numpy as np
+import tensorflow as tf
+
+from tqdm import tqdm
+from datetime import datetime
+
+# Framework class
+from agents.dqn import DQN
+
+#
+logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('RL-Logger')
+logger.setLevel(logging.INFO)
+
+
+def set_seeds(seed_value):
+    os.environ['PYTHONHASHSEED'] = str(seed_value)
+    random.seed(seed_value)
+    np.random.seed(seed_value)
+    tf.random.set_seed(seed_value)
+
+
+def episodes_to_threshold(total_rewards, threshold, window):
+    # First episode where the moving average of the total reward reaches the threshold
+    for e in range(window - 1, len(total_rewards)):
+        if np.mean(total_rewards[e - window + 1:e + 1]) >= threshold:
+            return e + 1
+    return None
+
+
+def run_training(replay_type, seed, base_cfg, save_directory, episodes, nsteps):
+    set_seeds(seed)
+
+    # Write the config variant used by this run
+    cfg = dict(base_cfg)
+    cfg['replay_type'] = replay_type
+    cfg_name = os.path.join(save_directory, 'dqn_setup_{}_seed{}.json'.format(replay_type, seed))
+    with open(cfg_name, 'w') as json_file:
+        json.dump(cfg, json_file, indent=4)
+
+    env = gym.make('gym_accelerator:Surrogate_Accelerator-v1')
+    env._max_episode_steps = nsteps
+    env.seed(seed)
+    env.save_dir = save_directory
+    agent = DQN(env, cfg=cfg_name)
+
+    counter = 0
+    total_rewards = []
+    estart = time.time()
+    for e in tqdm(range(episodes), desc='{} seed {}'.format(replay_type, seed), leave=True):
+        current_state = env.reset()
+        total_reward = 0
+        done = False
+        step_counter = 0
+        while not done:
+            action, policy_type = agent.action(current_state)
+            next_state, reward, done, _ = env.step(action)
+            agent.remember(current_state, action, reward, next_state, done)
+            if counter >= 250 and counter % 5 == 0:
+                agent.train()
+            current_state = next_state
+            total_reward += reward
+            step_counter += 1
+            counter += 1
+            if step_counter >= nsteps:
+                done = True
+        total_rewards.append(total_reward)
+    elapsed = time.time() - estart
+    return total_rewards, elapsed
+
+
+if __name__ == "__main__":
+
+    now = datetime.now()
+    timestamp = now.strftime("D%m%d%Y-T%H%M%S")
+    print("date and time:", timestamp)
+
+    # Benchmark setup
+    EPISODES = 250
+    NSTEPS = 50
+    SEEDS = [0, 1, 2]
+    REWARD_THRESHOLD = -10
+    AVERAGE_WINDOW = 10
+
+    with open('../cfg/dqn_setup.json') as json_file:
+        base_cfg = json.load(json_file)
+
+    save_directory = './results_replay_benchmark_surrogate1_{}/'.format(timestamp)
+    if not os.path.exists(save_directory):
+        os.mkdir(save_directory)
+    logger.info('Save directory:{}'.format(save_directory))
+
+    results_file = open(save_directory + 'replay_benchmark_episodes{}_steps{}.log'.format(EPISODES, NSTEPS), 'w')
+    results_writer = csv.writer(results_file, delimiter=" ")
+    results_writer.writerow(['replay_type', 'seed', 'episodes_to_threshold', 'best_reward', 'time_s'])
+
+    summary = {}
+    for replay_type in ['uniform', 'prioritized']:
+        summary[replay_type] = []
+        for seed in SEEDS:
+            total_rewards, elapsed = run_training(replay_type, seed, base_cfg, save_directory, EPISODES, NSTEPS)
+            n_episodes = episodes_to_threshold(total_rewards, REWARD_THRESHOLD, AVERAGE_WINDOW)
+            summary[replay_type].append(n_episodes if n_episodes is not None else EPISODES)
+            results_writer.writerow([replay_type, seed, n_episodes, np.max(total_rewards), elapsed])
+            results_file.flush()
+
+    # Runs that never reach the threshold are counted as the full number of episodes
+    print('Episodes to reach a {}-episode average reward of {}:'.format(AVERAGE_WINDOW, REWARD_THRESHOLD))
+    for replay_type, values in summary.items():
+        print('  {:12s} mean {:7.1f}  per seed {}'.format(replay_type, np.mean(values), values))
+    results_file.close()
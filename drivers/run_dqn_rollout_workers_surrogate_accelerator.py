@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import gym
+import time
+import logging
+import csv
+import os
+import random
+import numpy as np
+import tensorflow as tf
+
+from datetime import datetime
+
+# Framework class
+from agents.dqn import DQN
+from agents.rollout_workers import RolloutWorkers
+
+#
+logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('RL-Logger')
+logger.setLevel(logging.INFO)
+
+if __name__ == "__main__":
+
+    # Seed value
+    seed_value = 0
+    os.environ['PYTHONHASHSEED'] = str(seed_value)
+    random.seed(seed_value)
+    np.random.seed(seed_value)
+    tf.random.set_seed(seed_value)
+
+    now = datetime.now()
+    timestamp = now.strftime("D%m%d%Y-T%H%M%S")
+    print("date and time:", timestamp)
+
+    # Train
+    EPISODES = 2000
+    NSTEPS = 50
+    cfg = '../cfg/dqn_setup.json'
+
+    # Setup environment, the workers create their own instances
+    # This instance builds the dataset cache, the workers then map the same series read-only
+    env_version = 1
+    env_id = 'gym_accelerator:Surrogate_Accelerator-v{}'.format(env_version)
+    env_kwargs = {'shared_data': True}
+    estart = time.time()
+    env = gym.make(env_id, **env_kwargs)
+    env._max_episode_steps = NSTEPS
+    end = time.time()
+    logger.info('Time init environment: %s' % str((end - estart) / 60.0))
+
+    # Setup agent
+    arch_type = 'MLP'
+    logger.info('Using DQN {}'.format(arch_type))
+    agent = DQN(env, cfg=cfg, arch_type=arch_type)
+    workers = RolloutWorkers(agent, env_id, NSTEPS, cfg=cfg, seed=seed_value, env_kwargs=env_kwargs)
+    logger.info('Workers: {}, replay ratio: {}, policy sync interval: {}, buffer capacity: {}'.format(
+        workers.nworkers, workers.replay_ratio, workers.policy_sync_interval, workers.buffer_capacity))
+
+    # Save information
+    save_directory = './results_dqn_rollout_workers_{}_nworkers{}_surrogate{}_{}/'.format(
+        arch_type, workers.nworkers, env_version, timestamp)
+    if not os.path.exists(save_directory):
+        os.mkdir(save_directory)
+    logger.info('Save directory:{}'.format(save_directory))
+    safe_file_prefix = 'fnal_surrogate_dqn_rollout_workers_episodes{}_steps{}_{}'.format(EPISODES, NSTEPS, timestamp)
+
+    try:
+        report = workers.run(EPISODES)
+    finally:
+        workers.close()
+
+    train_file_e = open(save_directory + safe_file_prefix + '_reduced_batched_memories.log', 'w')
+    train_writer_e = csv.writer(train_file_e, delimiter=" ")
+    for e, (worker_id, worker_episode, total_reward) in enumerate(report['episode_rewards']):
+        train_writer_e.writerow([e, total_reward, worker_id, worker_episode])
+    train_file_e.close()
+
+    stats_file = open(save_directory + safe_file_prefix + '_utilization.log', 'w')
+    stats_writer = csv.writer(stats_file, delimiter=" ")
+    stats_writer.writerow(['nworkers', 'env_steps', 'train_steps', 'wall_time', 'env_steps_per_s',
+                           'learner_utilization'])
+    stats_writer.writerow([workers.nworkers, report['env_steps'], report['train_steps'], report['wall_time'],
+                           report['env_steps'] / report['wall_time'], report['learner_utilization']])
+    stats_file.close()
+
+    agent.save(save_directory + '/final/policy_model' + safe_file_prefix)
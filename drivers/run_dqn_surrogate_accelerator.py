@@ -16,6 +16,7 @@ from datetime import datetime
 
 # Framework class
 from agents.dqn import DQN
+from dataprep.trajectory import TrajectoryRecorder
 
 # Seed value
 # Apparently you may use different seed values at each stage
@@ -85,8 +86,7 @@ if __name__ == "__main__":
     logger.info('Save directory:{}'.format(save_directory))
     env.save_dir = save_directory
     safe_file_prefix = 'fnal_surrogate_dqn_mlp_episodes{}_steps{}_{}'.format(EPISODES, NSTEPS, timestamp)
-    train_file_s = open(save_directory + safe_file_prefix + '_batched_memories.log', 'w')
-    train_writer_s = csv.writer(train_file_s, delimiter=" ")
+    recorder = TrajectoryRecorder(save_directory + safe_file_prefix + '_trajectories')
     train_file_e = open(save_directory + safe_file_prefix + '_reduced_batched_memories.log', 'w')
     train_writer_e = csv.writer(train_file_e, delimiter=" ")
 
@@ -117,9 +117,6 @@ if __name__ == "__main__":
             logger.info('Reward: %s' % str(reward))
             logger.info('Done: %s' % str(done))
 
-            # Update  current state
-            current_state = next_state
-
             # Increment total reward
             total_reward += reward
             step_counter += 1
@@ -130,9 +127,12 @@ if __name__ == "__main__":
                 done = True
 
             # Save memory
-            train_writer_s.writerow([current_state, action, reward, next_state, total_reward, done, policy_type, e])
-            train_file_s.flush()
+            recorder.record(current_state, action, reward, next_state, total_reward, done, policy_type, e)
+
+            # Update  current state
+            current_state = next_state
 
+        recorder.end_episode()
         logger.info('Total reward: %s' % str(total_reward))
         train_writer_e.writerow([e, total_reward])
         train_file_e.flush()
@@ -141,4 +141,4 @@ if __name__ == "__main__":
             best_reward = total_reward
 
     agent.save(save_directory + '/final/policy_model' + safe_file_prefix)
-    train_file_s.close()
+    recorder.close()
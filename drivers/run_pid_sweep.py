@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import glob, time, logging
+import numpy as np
+import pandas as pd
+
+##
+logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('RL-Logger')
+logger.setLevel(logging.INFO)
+
+import gym_accelerator.envs.pid_sweep as ps
+
+
+def load_windows(filename, nsteps):
+    # Same cleaning as Data_Accelerator.load_data
+    df = pd.read_csv(filename)
+    df = df.replace([np.inf, -np.inf], np.nan)
+    df = df.dropna(axis=0)
+    df = df.round(decimals=5)
+    ## Windows as the data env reads them in episodes of nsteps steps (the setting of reset() is held over
+    ## the episode), enough episodes to go once through the data
+    nepisodes = max(len(ps.regulation_windows(df['B:VIMIN'].values)) // (nsteps + 1), 1)
+    return ps.episode_windows(df['B_VIMIN'].values, df['B:VIMIN'].values, nsteps, nepisodes)
+
+
+if __name__ == "__main__":
+    DATA_FILES = sorted(glob.glob('../data/*.csv'))
+    ## Baseline gains and bounds of Data_Accelerator
+    ALPHA_BASELINE, GAMMA_BASELINE = 8.5e-2, 7.535e-5
+    ALPHA_RANGE, GAMMA_RANGE = (7.5e-2, 1.2e-1), (1e-6, 1e-2)
+    ## Episode length of run_dqn_lstm_data_accelerator.py
+    NSTEPS = 50
+
+    for filename in DATA_FILES:
+        start = time.time()
+        setting, measured = load_windows(filename, NSTEPS)
+
+        ## Grid sweep, the baseline is evaluated in the same pass
+        alphas, gammas = ps.grid(ALPHA_RANGE, GAMMA_RANGE, nalphas=32, ngammas=32)
+        alphas, gammas = np.append(alphas, ALPHA_BASELINE), np.append(gammas, GAMMA_BASELINE)
+        results = ps.sweep(setting, measured, alphas, gammas)
+        best = np.argmin(results['err_avg'][:-1])
+
+        ## Refine with the cross-entropy method, gamma is searched in log10
+        def objective(samples):
+            return ps.sweep(setting, measured, samples[:, 0], 10 ** samples[:, 1])['err_avg']
+        cem_best, cem_err_avg = ps.cross_entropy_search(objective, [ALPHA_RANGE[0], np.log10(GAMMA_RANGE[0])],
+                                                        [ALPHA_RANGE[1], np.log10(GAMMA_RANGE[1])],
+                                                        niterations=10, seed=1)
+
+        logger.info('{}: {} windows in {:.1f} s'.format(filename, len(measured), time.time() - start))
+        logger.info('  baseline alpha {:.4e} gamma {:.4e}: err_avg {:.4e} rms {:.4e}'.format(
+            ALPHA_BASELINE, GAMMA_BASELINE, results['err_avg'][-1], results['rms'][-1]))
+        logger.info('  grid     alpha {:.4e} gamma {:.4e}: err_avg {:.4e} rms {:.4e}'.format(
+            alphas[best], gammas[best], results['err_avg'][best], results['rms'][best]))
+        logger.info('  CEM      alpha {:.4e} gamma {:.4e}: err_avg {:.4e}'.format(
+            cem_best[0], 10 ** cem_best[1], cem_err_avg))
@@ -34,3 +34,8 @@ register(
     id='Surrogate_Accelerator-v4',
     entry_point='gym_accelerator.envs:Surrogate_Accelerator_v4',
 )
+
+register(
+    id='Surrogate_Accelerator_Batch-v1',
+    entry_point='gym_accelerator.envs:Surrogate_Accelerator_Batch',
+)
@@ -5,3 +5,4 @@ from gym_accelerator.envs.surrogate_accelerator_v1 import Surrogate_Accelerator_
 from gym_accelerator.envs.surrogate_accelerator_v2 import Surrogate_Accelerator_v2
 from gym_accelerator.envs.surrogate_accelerator_v3 import Surrogate_Accelerator_v3
 from gym_accelerator.envs.surrogate_accelerator_v4 import Surrogate_Accelerator_v4
+from gym_accelerator.envs.surrogate_accelerator_batch import Surrogate_Accelerator_Batch
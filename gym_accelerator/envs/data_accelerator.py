@@ -10,6 +10,8 @@ import pandas as pd
 import shutil, joblib
 
 from keras.models import load_model
+from gym_accelerator.envs.regulation import Regulator
+import dataprep.dataset as dp
 
 import logging
 logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
@@ -60,30 +62,31 @@ class Data_Accelerator(gym.Env):
         ## Application setup
         self.data = self.load_data()
         self.data_index = 0
+        ## The columns are held as contiguous arrays, the state windows are views into them
+        self.nsamples = 15
+        self.setting_data = np.ascontiguousarray(self.data['B_VIMIN'].values, dtype=np.float64)
+        self.measured_data = np.ascontiguousarray(self.data['B:VIMIN'].values, dtype=np.float64)
+        self.window_offsets = np.arange(self.nsamples)
 
         ## Initial settings
         self.alpha = 8.5e-2
         self.gamma = 7.535e-5
         self.alpha_baseline = self.alpha
         self.gamma_baseline = self.gamma
-        self.beta_last = 0.0
-        self.beta_last_baseline = 0.0
+        ## Regulation with the tuned and with the fixed baseline settings
+        self.regulator = Regulator(self.alpha, self.gamma)
+        self.regulator_baseline = Regulator(self.alpha_baseline, self.gamma_baseline)
 
         ##
         self.best_alpha = self.alpha
         self.best_reward = -100
         self.step_counter=0
-        ##
-        self.state = {} 
-        
-        self.state['B_VIMIN']     = self.data['B_VIMIN'][self.data_index:self.data_index+15].tolist()
-        self.state['B:VIMIN_data']= self.data['B:VIMIN'][self.data_index:self.data_index+15].tolist()
+        ## Current setting (B_VIMIN) and measurement (B:VIMIN) windows
+        self.setting = self.setting_data[self.data_index:self.data_index+self.nsamples]
+        self.measured = self.measured_data[self.data_index:self.data_index+self.nsamples]
         
         self.actionMap_alpha = [0, 0.0001, 0.001,  0.01,   
                                   -0.0001,-0.001, -0.01]
-        
-        ##
-        self.next_state = {}
 
         ## Env state output:  ##
         alpha_min = 7.500e-2#8.500e-2 + 5*5e-02
@@ -102,12 +105,19 @@ class Data_Accelerator(gym.Env):
         high = np.append(high, gamma_max)
         
         self.observation_space = spaces.Box(low=low, high=high, dtype=np.float32)
+        self.alpha_low = self.observation_space.low[16]
+        self.alpha_high = self.observation_space.high[16]
 
         logger.info('alpha_high %s' % str(self.observation_space.high[16]))
         logger.info('alpha_low %s' % str(self.observation_space.low[16]))
         
         self.action_space = spaces.Discrete(7)
 
+        ## Observations are written into two preallocated buffers used in turns,
+        ## so the returned state stays valid while the next step is taken
+        self.observations = np.zeros((2, self.observation_space.shape[0]), dtype=np.float32)
+        self.observation_slot = 0
+
     def step(self, action):
 
         self.step_counter+=1
@@ -122,32 +132,31 @@ class Data_Accelerator(gym.Env):
         self.gamma = self.gamma+delta_gamma
          
         ## Check action boundary conditions
-        if self.alpha>self.observation_space.high[16]:
+        if self.alpha>self.alpha_high:
             self.alpha-=delta_alpha
             logger.info("High alpha:  %s (%s) " %(self.alpha,delta_alpha))
-            return self._getState(self.state),reward,done, {}
-        if self.alpha<self.observation_space.low[16]:
+            return self._getState(),reward,done, {}
+        if self.alpha<self.alpha_low:
             self.alpha+=delta_alpha
             logger.info("Low alpha:  %s (%s) " %(self.alpha,delta_alpha))
-            return self._getState(self.state),reward,done, {}
+            return self._getState(),reward,done, {}
          
-        ## Copy the setting to the next time
-        self.next_state['B_VIMIN']       = self.state['B_VIMIN']
-        self.next_state['B:VIMIN_data']  = self.data['B:VIMIN'][self.data_index:self.data_index+15].tolist()
+        ## The setting is kept, the next measurement window is a view into the data
+        measured = self.measured_data[self.data_index:self.data_index+self.nsamples]
         
         self.data_index += 16
-        if self.data_index+15 > len(self.data['B:VIMIN']): self.data_index=0
+        if self.data_index+15 > len(self.measured_data): self.data_index=0
         ## Calculate the regulated voltage
-        reg = self._get_regulation(self.next_state['B:VIMIN_data'])
-        reg_baseline = self._get_regulation_baseline(self.next_state['B:VIMIN_data'])
+        reg = self._get_regulation(measured)
+        reg_baseline = self._get_regulation_baseline(measured)
         self.reg = reg
         self.reg_baseline = reg_baseline
         
-        err = 10 * (reg - self.next_state['B:VIMIN_data'])
+        err = 10 * (reg - measured)
         self.err = err
         err_avg = self.err_avg(err)
         
-        err_baseline = 10 * (reg_baseline - self.next_state['B:VIMIN_data'])
+        err_baseline = 10 * (reg_baseline - measured)
         self.err_baseline = err_baseline
         err_avg_baseline = self.err_avg(err_baseline)
         
@@ -156,24 +165,82 @@ class Data_Accelerator(gym.Env):
         reward = biminer_limit/abs(err_avg) #np.average(reward)
 
         ## Update current states 
-        self.state['B_VIMIN']         = self.next_state['B_VIMIN']
-        self.state['B:VIMIN_data']    = self.next_state['B:VIMIN_data']
+        self.measured = measured
 
         if self.best_reward < reward:
             self.best_reward = reward
             self.best_alpha = self.alpha
         #
         done = False #Question: done == end of cycle?
-        return self._getState(self.state), reward, done, {}
-                   
+        return self._getState(), reward, done, {}
+
+    def step_many(self, actions):
+        '''
+        Description:
+            Apply a sequence of actions at once, same as calling step for every action in turn.
+            The sequence stops at the first step that is done (alpha out of bounds).
+        :param actions: sequence of discrete actions
+        :return: observations (nsteps, 18), rewards (nsteps,), dones (nsteps,), info
+        '''
+        ## Alpha and start of the measurement window of every step, stopping at the first out of bounds alpha.
+        ## Only this bookkeeping runs per step, it uses the same arithmetic and comparisons as step
+        alphas = np.empty(len(actions)+1)
+        starts = np.empty(len(actions), dtype=np.int64)
+        alpha = alphas[0] = self.alpha
+        nsteps = 0
+        for action in actions:
+            alpha = alpha+self.actionMap_alpha[action]
+            if alpha>self.alpha_high or alpha<self.alpha_low:
+                break
+            alphas[nsteps+1] = alpha
+            starts[nsteps] = self.data_index
+            nsteps += 1
+            self.data_index += 16
+            if self.data_index+15 > len(self.measured_data): self.data_index=0
+        starts = starts[:nsteps]
+        self.step_counter += nsteps
+        observations = np.empty((len(actions), self.observations.shape[1]), dtype=np.float32)
+        dones = np.zeros(len(actions), dtype=np.bool_)
+        rewards = np.empty(0)
+
+        if nsteps > 0:
+            measured = self.measured_data[starts[:, None] + self.window_offsets]
+            ## Calculate the regulated voltage of all steps
+            ER = 10*(measured-self.setting)
+            reg = self.regulator.sequence(ER, self.setting, alpha=alphas[1:nsteps+1], gamma=self.gamma)
+            reg_baseline = self.regulator_baseline.sequence(ER, self.setting)
+            err = 10 * (reg - measured)
+            biminer_limit=1e-5
+            rewards = biminer_limit/np.average(np.abs(err), axis=1)
+
+            observations[:nsteps, 0] = self.setting[0]
+            observations[:nsteps, 1:1+self.nsamples] = measured
+            observations[:nsteps, 1+self.nsamples] = alphas[1:nsteps+1]
+            observations[:nsteps, 2+self.nsamples] = self.gamma
 
-    def _getState(self, state):
-        ls = [ v for v in state.values() ]
-        o = np.array(ls[0][0])
-        o = np.append(o,np.array(ls[1])).tolist()
-        o = np.append(o,self.alpha)
-        o = np.append(o,self.gamma)
-        #np_next_state = np.array(list_state)
+            self.alpha = float(alphas[nsteps])
+            self.measured = measured[-1]
+            self.regulator.alpha = self.alpha
+            self.reg, self.reg_baseline = reg[-1], reg_baseline[-1]
+            self.err, self.err_baseline = err[-1], 10 * (reg_baseline[-1] - measured[-1])
+            best = np.argmax(rewards)
+            if self.best_reward < rewards[best]:
+                self.best_reward = rewards[best]
+                self.best_alpha = float(alphas[best+1])
+        if nsteps < len(actions):
+            ## The out of bounds action is handled by step and ends the sequence
+            observations[nsteps], reward, dones[nsteps], _ = self.step(actions[nsteps])
+            rewards = np.append(rewards, reward)
+            observations, dones = observations[:nsteps+1], dones[:nsteps+1]
+        return observations, rewards, dones, {}
+
+    def _getState(self):
+        o = self.observations[self.observation_slot]
+        self.observation_slot ^= 1
+        o[0] = self.setting[0]
+        o[1:1+self.nsamples] = self.measured
+        o[1+self.nsamples] = self.alpha
+        o[2+self.nsamples] = self.gamma
         return o
 
     def _get_prediction(self,cur_state):
@@ -186,53 +253,26 @@ class Data_Accelerator(gym.Env):
     
     def _get_regulation(self,fitted):
         #print("====>adjusted")
-        beta_last = self.beta_last
-        gamma = self.gamma
-        alpha = self.alpha
-        #print("alpha: ",alpha)
-        #print("gamma: ",gamma)
-        
-        length = len(fitted)
-        beta=np.zeros(length)
-        beta[0]=beta_last
-        
-        _MIN = self.state["B_VIMIN"] #setting
-        ER = 10*(np.array(fitted)-_MIN) # TODO: Ask Jason and Gabe if this is correct 
-        #print (self.data_index)
-        #print ("ER: ",ER)
-        
-        beta[1:] = [beta[i-1]+gamma*ER[i] for i in range(1,length)]
-        MIN_regulated = _MIN + alpha * ER + beta #predict the next, shiftting happens in the plotting
-        
-        self.beta_last = beta[-1]
-        return MIN_regulated
+        _MIN = self.setting #setting
+        ER = 10*(fitted-_MIN) # TODO: Ask Jason and Gabe if this is correct 
+        ## alpha and gamma are tuned by the agent
+        self.regulator.alpha = self.alpha
+        self.regulator.gamma = self.gamma
+        return self.regulator(ER, _MIN) #predict the next, shiftting happens in the plotting
     
     def _get_regulation_baseline(self,fitted):
         #print("====>baseline")
-        beta_last = self.beta_last_baseline
-        gamma = self.gamma_baseline
-        alpha = self.alpha_baseline
-        
-        length = len(fitted)
-        beta=np.zeros(length)
-        beta[0]=beta_last
-        
-        _MIN = self.state["B_VIMIN"] #setting
-        ER = 10*(np.array(fitted)-_MIN) # TODO: Ask Jason and Gabe if this is correct 
-        
-        beta[1:] = [beta[i-1]+gamma*ER[i] for i in range(1,length)]
-        MIN_regulated = _MIN + alpha * ER + beta #predict the next, shiftting happens in the plotting
-        
-        self.beta_last_baseline = beta[-1]
-        return MIN_regulated
+        _MIN = self.setting #setting
+        ER = 10*(fitted-_MIN) # TODO: Ask Jason and Gabe if this is correct 
+        return self.regulator_baseline(ER, _MIN)
          
     def reset(self):
         self.alpha = self.best_alpha
         self.data_index += 16
-        if self.data_index+15 > len(self.data['B:VIMIN'])-30: self.data_index=0
-        self.state['B_VIMIN']     = self.data['B_VIMIN'][self.data_index:self.data_index+15].tolist()
-        self.state['B:VIMIN_data']= self.data['B:VIMIN'][self.data_index:self.data_index+15].tolist()
-        return self._getState(self.state) 
+        if self.data_index+15 > len(self.measured_data)-30: self.data_index=0
+        self.setting = self.setting_data[self.data_index:self.data_index+self.nsamples]
+        self.measured = self.measured_data[self.data_index:self.data_index+self.nsamples]
+        return self._getState() 
 
     def render(self):
         return 0
@@ -242,9 +282,8 @@ class Data_Accelerator(gym.Env):
         
     def load_data(self):
         dataPath = self.basePath + self.cfg['data_dir'] + self.cfg['data_name']
-        df = pd.read_csv(dataPath)
-        df=df.replace([np.inf, -np.inf], np.nan)
-        df=df.dropna(axis=0)
+        ## Read from the columnar copy of the data when there is one
+        df = dp.load_reformated_cvs(dp.processed_source(dataPath), nrows=None)
         df=df.round(decimals=5)
         print(len(df))
         return df
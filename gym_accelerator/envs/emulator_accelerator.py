@@ -21,12 +21,14 @@ class Incremental(Space):
         
 class Emulator_Accelerator(gym.Env):
   def __init__(self,df=None):
-    if df==None:
+    if df is None:
       self.df = self.load_data()
     else:
       self.df = df
       
     print(self.df)
+    ## Fit the linear model and index the noise once, reset() reuses them
+    self.df = self._prepData(self.df)
     
     self.min_BIMIN = 103.3
     self.max_BIMIN = 103.4
@@ -88,6 +90,12 @@ class Emulator_Accelerator(gym.Env):
     return [seed]
       
   def predict(self,x):
+    '''
+    Description:
+       B:IMINER for one or many B:VIMIN settings, linear model plus sampled noise
+    :param x: B:VIMIN value or array of values
+    :return: B:IMINER with the shape of x
+    '''
     #print ("predict-->action x: ",x)
     y=self._BIMINER_linear(x)
     r=self._random_from_cdf(x)
@@ -116,12 +124,9 @@ class Emulator_Accelerator(gym.Env):
     return self.state, self.reward, self.done, {}
   
   def reset(self,df=None):
-    if df == None:
-      df=self.df
-    else:
-      self.df = df
+    if df is not None:
+      self.df = self._prepData(df)
     self.seed()
-    self.df = self._prepData(self.df)
     init = self.np_random.uniform(low=self.min_BIMIN, high=self.max_BIMIN) #random init. control
     #print ('reset-->init: random action:',init)
     self.err = self.predict(init)
@@ -134,6 +139,7 @@ class Emulator_Accelerator(gym.Env):
     self.m, self.b = self._LinearRegression(df)
     df["IMINER_linear"]=self._BIMINER_linear(df["B:VIMIN"]) # the linear regression portion
     df["IMINER_std"]=df["B:IMINER"]-df["IMINER_linear"] # calculate the deviation 
+    self._build_noise_index(df)
     return df
     
   def _LinearRegression(self,df):
@@ -149,35 +155,55 @@ class Emulator_Accelerator(gym.Env):
     y=self.m*x+self.b
     return y
   
-  def _random_from_cdf(self,x):
-    sampling_window = 0.005
-    error_window = 0.01
-    
+  def _build_noise_index(self,df):
+    '''
+    Description:
+       The noise for a setting x is drawn from the histogram of the deviations of all samples with
+       B:VIMIN in [x-sampling_window, x+sampling_window]. Those samples are a contiguous range [lo,hi)
+       of the data sorted by B:VIMIN, and only a finite number of ranges exist (they change where x
+       crosses a B:VIMIN value +- the window), so the histogram CDF of every range is built once here.
+       Sampling is then two binary searches for the range, one lookup and one draw.
+    '''
+    self.sampling_window = 0.005
     nbins = 100
-    df = self.df
-    state = self.state
-    #print("state: ==>", state)
-    error = state[0]
-    #print(error)
-    
-    #filter according to x-axis:
-    y_std = df[df["B:VIMIN"].between(x-sampling_window,x+sampling_window)]
-    #y_std = y_std[y_std["B:IMINER"].between(error-error_window,error+error_window)]
-    if y_std.empty: return 0
-    
-    # get the y-axis noise value according to the x-axis filtering
-    hist, bins = np.histogram(y_std["IMINER_std"], bins=nbins)
-    bin_midpoints = bins[:-1] + np.diff(bins)/2
-  
-    cdf = np.cumsum(hist)
-    cdf = cdf / cdf[-1]
-  
-    values = np.random.rand(len(y_std)*10)
-    value_bins = np.searchsorted(cdf, values)
-    random_from_cdf = bin_midpoints[value_bins]
-  
-    if len(random_from_cdf)>0:
-      i=random.randint(0,len(random_from_cdf)-1)
-      return random_from_cdf[i]
-    else:
-      return 0
\ No newline at end of file
+    order = np.argsort(df["B:VIMIN"].values, kind='stable')
+    self.noise_vimin = df["B:VIMIN"].values[order]
+    deviation = df["IMINER_std"].values[order]
+
+    ## Evaluate the ranges around all points where they can change. Because of rounding in x+-sampling_window
+    ## a range changes within a few ulps of an edge, so every float that close is evaluated as well
+    edges = np.unique(np.concatenate([self.noise_vimin-self.sampling_window, self.noise_vimin+self.sampling_window]))
+    ulps = np.spacing(np.abs(edges))
+    x = np.concatenate([(edges[:, None] + np.arange(-4, 5)*ulps[:, None]).ravel(), (edges[:-1]+edges[1:])/2,
+                        [edges[0]-1, edges[-1]+1]])
+    lo, hi = self._noise_range(x)
+    self.noise_keys, first = np.unique(lo*(len(self.noise_vimin)+1)+hi, return_index=True)
+
+    self.noise_cdf = np.ones((len(self.noise_keys), nbins))
+    self.noise_midpoints = np.zeros((len(self.noise_keys), nbins))
+    for k, i in enumerate(first):
+      if hi[i] > lo[i]:
+        hist, bins = np.histogram(deviation[lo[i]:hi[i]], bins=nbins)
+        cdf = np.cumsum(hist)
+        self.noise_cdf[k] = cdf / cdf[-1]
+        self.noise_midpoints[k] = bins[:-1] + np.diff(bins)/2
+
+  def _noise_range(self,x):
+    ## Sample range with B:VIMIN.between(x-sampling_window, x+sampling_window)
+    lo = np.searchsorted(self.noise_vimin, x-self.sampling_window, side='left')
+    hi = np.searchsorted(self.noise_vimin, x+self.sampling_window, side='right')
+    return lo, hi
+
+  def _random_from_cdf(self,x):
+    x = np.asarray(x, dtype=np.float64)
+    lo, hi = self._noise_range(x)
+    keys = lo*(len(self.noise_vimin)+1)+hi
+    k = np.minimum(np.searchsorted(self.noise_keys, keys), len(self.noise_keys)-1)
+    if not np.all(self.noise_keys[k] == keys):
+      raise KeyError('B:VIMIN range missing from the noise index')
+    values = self.np_random.uniform(size=x.shape)
+    ## Position of every value in its CDF table, as np.searchsorted(cdf, value)
+    value_bins = np.sum(self.noise_cdf[k] < values[..., None], axis=-1)
+    random_from_cdf = np.take_along_axis(self.noise_midpoints[k], value_bins[..., None], axis=-1)[..., 0]
+    ## No samples close to x, no noise
+    return np.where(hi > lo, random_from_cdf, 0.0)
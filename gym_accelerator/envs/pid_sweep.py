@@ -0,0 +1,169 @@
+import numpy as np
+
+import logging
+
+logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('RL-Logger')
+logger.setLevel(logging.INFO)
+
+## Window layout of Data_Accelerator: 15 samples per step, the next step starts 16 samples later
+NSAMPLES = 15
+STRIDE = 16
+
+
+def regulation_windows(series, nsamples=NSAMPLES, stride=STRIDE):
+    '''
+    Description:
+        Consecutive step windows of a data column, laid out as the data env reads them
+    :param series: 1d data column
+    :param nsamples: samples per window
+    :param stride: distance between the starts of two windows
+    :return: (nwindows, nsamples) read-only view
+    '''
+    series = np.ascontiguousarray(series, dtype=np.float64)
+    windows = np.lib.stride_tricks.sliding_window_view(series, nsamples)
+    return windows[::stride]
+
+
+def episode_windows(setting, measured, nsteps, nepisodes, nsamples=NSAMPLES, stride=STRIDE):
+    '''
+    Description:
+        Setting and measurement windows in the order a new Data_Accelerator steps through them, for nepisodes
+        episodes of nsteps steps (reset() and nsteps calls of step()). The env reads the setting window once
+        in reset() and holds it for the whole episode, while the measurement window advances every step.
+    :param setting: 1d setting (B_VIMIN) column
+    :param measured: 1d measurement (B:VIMIN) column
+    :param nsteps: steps per episode
+    :param nepisodes: number of episodes
+    :return: setting and measured windows, both (nepisodes * nsteps, nsamples)
+    '''
+    ## Same index arithmetic as Data_Accelerator.reset and Data_Accelerator.step
+    nrows = len(measured)
+    setting_starts = np.empty(nepisodes * nsteps, dtype=np.int64)
+    measured_starts = np.empty(nepisodes * nsteps, dtype=np.int64)
+    index = 0
+    for episode in range(nepisodes):
+        index += stride
+        if index + nsamples > nrows - 30: index = 0
+        setting_starts[episode * nsteps:(episode + 1) * nsteps] = index
+        for step in range(nsteps):
+            measured_starts[episode * nsteps + step] = index
+            index += stride
+            if index + nsamples > nrows: index = 0
+    offsets = np.arange(nsamples)
+    setting = np.asarray(setting, dtype=np.float64)
+    measured = np.asarray(measured, dtype=np.float64)
+    return setting[setting_starts[:, None] + offsets], measured[measured_starts[:, None] + offsets]
+
+
+def sweep(setting, measured, alphas, gammas, chunk_size=1024, per_window=False):
+    '''
+    Description:
+        Evaluate the B:VIMIN regulation of the data env for many (alpha, gamma) settings over a whole dataset.
+        The regulated error of a window is linear in the gains,
+            err = (10 * alpha - 1) * ER + 10 * gamma * C
+        with ER = 10 * (measured - setting) and C the running integral of ER (without the first sample
+        of every window, as in Regulator), so all settings are evaluated with a few array operations.
+        Like the data env the integral runs over the dataset without resets.
+        Every window is regulated against its own setting window: with the windows of regulation_windows
+        (the setting read at the same time as the measurement) this only approximates the data env, which
+        holds the setting of reset() over an episode. The windows of episode_windows reproduce the env.
+        The windows are processed in chunks, the memory use is about len(alphas) * chunk_size * 15 floats.
+    :param setting: (nwindows, nsamples) setting (B_VIMIN) windows
+    :param measured: (nwindows, nsamples) measured (B:VIMIN) windows
+    :param alphas: proportional gains, shape (nparams,)
+    :param gammas: integral gains, shape (nparams,)
+    :param chunk_size: number of windows processed at once
+    :param per_window: also return the err_avg of every window
+    :return: dict of (nparams,) averages over the windows: err_avg, rms and reward (as computed by the data env),
+             with per_window the (nparams, nwindows) err_avg in 'window_err_avg'
+    '''
+    alphas = np.atleast_1d(np.asarray(alphas, dtype=np.float64))
+    gammas = np.atleast_1d(np.asarray(gammas, dtype=np.float64))
+    alphas, gammas = np.broadcast_arrays(alphas, gammas)
+    nparams, nwindows = len(alphas), len(measured)
+    nsamples = np.shape(measured)[1]
+    # Gains of the error terms, shape (nparams, 1, 1) to broadcast over the windows and samples
+    error_gain = (10 * alphas - 1)[:, None, None]
+    integral_gain = (10 * gammas)[:, None, None]
+
+    totals = {'err_avg': np.zeros(nparams), 'rms': np.zeros(nparams), 'reward': np.zeros(nparams)}
+    window_err_avg = np.zeros((nparams, nwindows)) if per_window else None
+    integral = 0.0
+    for start in range(0, nwindows, chunk_size):
+        stop = min(start + chunk_size, nwindows)
+        ER = 10 * (np.asarray(measured[start:stop]) - np.asarray(setting[start:stop]))
+        increments = ER.copy()
+        increments[:, 0] = 0
+        C = np.cumsum(increments).reshape(ER.shape)
+        C += integral
+        integral = C[-1, -1]
+
+        # Only the absolute error needs the full (nparams, nwindows, nsamples) array, the sums entering
+        # the RMS follow from per window moments of ER and C
+        err = np.multiply(error_gain, ER)
+        err += integral_gain * C
+        err_avg = np.abs(err, out=err).sum(axis=2) / nsamples
+        g1, g2 = error_gain[..., 0], integral_gain[..., 0]
+        err_sum = g1 * ER.sum(axis=1) + g2 * C.sum(axis=1)
+        err_square_sum = (g1 ** 2 * np.square(ER).sum(axis=1) + 2 * g1 * g2 * (ER * C).sum(axis=1)
+                          + g2 ** 2 * np.square(C).sum(axis=1))
+        rms = np.sqrt(np.maximum(err_square_sum - 2 * err_avg * err_sum + nsamples * err_avg ** 2, 0))
+        totals['err_avg'] += err_avg.sum(axis=1)
+        totals['rms'] += rms.sum(axis=1)
+        totals['reward'] += (1e-5 / err_avg).sum(axis=1)
+        if per_window:
+            window_err_avg[:, start:stop] = err_avg
+
+    results = {key: value / max(nwindows, 1) for key, value in totals.items()}
+    if per_window:
+        results['window_err_avg'] = window_err_avg
+    return results
+
+
+def grid(alpha_range, gamma_range, nalphas=16, ngammas=16, log_gamma=True):
+    '''
+    Description:
+        Flattened (alpha, gamma) grid for sweep
+    :param alpha_range: (min, max) alpha
+    :param gamma_range: (min, max) gamma
+    :param log_gamma: space gamma logarithmically, its range covers orders of magnitude
+    :return: alphas, gammas, both shape (nalphas * ngammas,)
+    '''
+    alphas = np.linspace(alpha_range[0], alpha_range[1], nalphas)
+    if log_gamma:
+        gammas = np.geomspace(gamma_range[0], gamma_range[1], ngammas)
+    else:
+        gammas = np.linspace(gamma_range[0], gamma_range[1], ngammas)
+    alphas, gammas = np.meshgrid(alphas, gammas, indexing='ij')
+    return alphas.ravel(), gammas.ravel()
+
+
+def cross_entropy_search(objective, low, high, population=64, nelite=8, niterations=20, seed=None):
+    '''
+    Description:
+        Derivative-free minimization with the cross-entropy method: every iteration samples a population
+        from a Gaussian, evaluates all of it with one objective call and refits the Gaussian to the best
+        nelite samples.
+    :param objective: function of a (population, ndims) array returning (population,) values to minimize
+    :param low: lower bound of every dimension
+    :param high: upper bound of every dimension
+    :param population: samples per iteration
+    :param nelite: samples used to refit the distribution
+    :param niterations: number of iterations
+    :param seed: random seed
+    :return: best sample, its objective value
+    '''
+    rng = np.random.default_rng(seed)
+    low, high = np.asarray(low, dtype=np.float64), np.asarray(high, dtype=np.float64)
+    mean, std = (low + high) / 2, (high - low) / 4
+    best, best_value = mean, np.inf
+    for iteration in range(niterations):
+        samples = np.clip(rng.normal(mean, std, size=(population, len(mean))), low, high)
+        values = np.asarray(objective(samples))
+        elite = samples[np.argsort(values)[:nelite]]
+        mean, std = elite.mean(axis=0), elite.std(axis=0) + 1e-12
+        if values.min() < best_value:
+            best, best_value = samples[np.argmin(values)], values.min()
+        logger.info('CEM iteration {}: best {} at {}'.format(iteration, best_value, best))
+    return best, best_value
@@ -0,0 +1,68 @@
+import numpy as np
+
+
+class Regulator:
+    def __init__(self, alpha, gamma, sign=1.0, shape=()):
+        '''
+        Description:
+            Regulation of the B:VIMIN setting from the error, eq (1) of Rachael's report:
+                beta[t] = beta[t-1] + gamma * error[t]
+                regulated[t] = setting[t] + sign * (alpha * error[t] + beta[t])
+            The integral term beta is kept as state between calls, so every call only integrates the
+            new samples (one cumulative sum). alpha, gamma and beta can hold one value per episode
+            to regulate many episodes at once.
+        :param alpha: proportional gain, scalar or shape
+        :param gamma: integral gain, scalar or shape
+        :param sign: +1 for the data env, -1 for the surrogate PID baseline
+        :param shape: batch shape of the episodes, () for a single episode
+        '''
+        self.alpha = alpha
+        self.gamma = gamma
+        self.sign = sign
+        self.beta = np.zeros(shape)
+
+    def reset(self, beta=0.0):
+        self.beta = np.zeros_like(self.beta) + beta
+
+    def __call__(self, error, setting):
+        '''
+        Description:
+            Regulate a window of samples and advance the integral term
+        :param error: error samples, shape (*shape, nsamples)
+        :param setting: setting samples, same shape as error
+        :return: regulated setting, same shape as error
+        '''
+        error = np.asarray(error, dtype=np.float64)
+        gamma = np.asarray(self.gamma)[..., None]
+        # As in the original loop the first sample of a window carries the previous beta over unchanged
+        beta = np.empty(np.broadcast(error, self.beta[..., None]).shape)
+        beta[..., 0] = self.beta
+        np.cumsum(gamma * error[..., 1:], axis=-1, out=beta[..., 1:])
+        beta[..., 1:] += beta[..., 0:1]
+        self.beta = beta[..., -1].copy()
+        return setting + self.sign * (np.asarray(self.alpha)[..., None] * error + beta)
+
+    def sequence(self, error, setting, alpha=None, gamma=None):
+        '''
+        Description:
+            Regulate consecutive windows of a single episode (one window per step) at once, same as
+            calling the regulator on every window in turn with the gains of that step
+        :param error: error windows, shape (nsteps, nsamples)
+        :param setting: setting samples, broadcastable to error
+        :param alpha: proportional gain of every step, defaults to the current alpha
+        :param gamma: integral gain of every step, defaults to the current gamma
+        :return: regulated windows, same shape as error
+        '''
+        error = np.asarray(error, dtype=np.float64)
+        nsteps = error.shape[0]
+        if nsteps == 0:
+            return setting + np.zeros_like(error)
+        alpha = np.broadcast_to(self.alpha if alpha is None else alpha, (nsteps,))[:, None]
+        gamma = np.broadcast_to(self.gamma if gamma is None else gamma, (nsteps,))[:, None]
+        # The first sample of every window does not integrate, so the running sum skips it
+        increments = gamma * error
+        increments[:, 0] = 0
+        beta = np.cumsum(increments).reshape(error.shape)
+        beta += self.beta
+        self.beta = np.array(beta[-1, -1])
+        return setting + self.sign * (alpha * error + beta)
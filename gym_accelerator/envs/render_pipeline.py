@@ -0,0 +1,162 @@
+import threading
+import multiprocessing
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+import logging
+
+logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('RL-Logger')
+logger.setLevel(logging.INFO)
+
+
+class AsyncRenderer:
+    def __init__(self, max_workers=2, max_pending=4):
+        '''
+        Description:
+            Renders env snapshots in a background process pool so plotting never blocks env.step().
+            At most max_pending frames are queued or in flight, further frames are dropped
+            (and counted) until the pool catches up. Frames whose render raised are counted as failed.
+        :param max_workers: number of render processes
+        :param max_pending: maximum number of frames waiting for or being rendered
+        '''
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rendered = 0
+        self.dropped = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def _start(self):
+        # Spawned workers do not inherit the TF runtime and models of the env process
+        self.executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+
+    def _done(self, future):
+        error = None if future.cancelled() else future.exception()
+        with self.lock:
+            self.pending -= 1
+            if error is None and not future.cancelled():
+                self.rendered += 1
+            else:
+                self.failed += 1
+        if error is not None:
+            logger.error('Render failed: {}'.format(error))
+
+    def submit(self, render_fn, snapshot):
+        '''
+        Description:
+            Queue one frame for rendering
+        :param render_fn: module level function called as render_fn(snapshot) in a worker
+        :param snapshot: dictionary with the numpy arrays and values needed by render_fn
+        :return: True if the frame was queued, False if it was dropped
+        '''
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.dropped += 1
+                return False
+            self.pending += 1
+        if self.executor is None:
+            self._start()
+        future = self.executor.submit(render_fn, snapshot)
+        future.add_done_callback(self._done)
+        return True
+
+    def close(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+        if self.dropped > 0 or self.failed > 0:
+            logger.info('Rendered {} frames, dropped {} frames, {} failed'.format(
+                self.rendered, self.dropped, self.failed))
+
+
+def _setup_plots():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    plt.rcParams['axes.titlesize'] = 18
+    plt.rcParams['axes.titleweight'] = 'bold'
+    plt.rcParams['axes.labelsize'] = 18
+    plt.rcParams['axes.labelweight'] = 'regular'
+    plt.rcParams['xtick.labelsize'] = 14
+    plt.rcParams['ytick.labelsize'] = 14
+    plt.rcParams['font.family'] = [u'serif']
+    plt.rcParams['font.size'] = 16
+    sns.set_style("ticks")
+    return plt
+
+
+def render_traces(snapshot):
+    '''
+    Description:
+        Digital twin vs data traces of B:VIMIN and B:IMINER (Surrogate_Accelerator_v1)
+    :param snapshot: dict with the unscaled 'traces' and 'data_traces' (nvars, nsamples), 'variables',
+                     'data_total_reward', 'total_reward' and the output 'filename'
+    '''
+    plt = _setup_plots()
+    traces = snapshot['traces']
+    data_traces = snapshot['data_traces']
+    nvars = len(traces)
+    fig, axs = plt.subplots(nvars, figsize=(12, 8))
+    for v in range(0, nvars):
+        if v == 0:
+            axs[v].set_title('Raw data reward: {:.2f} - RL agent reward: {:.2f} '.format(
+                snapshot['data_total_reward'], snapshot['total_reward']))
+        axs[v].plot(traces[v], label='Digital twin', color='black')
+        if v == 1:
+            x = np.arange(len(data_traces[v]))
+            axs[v].fill_between(x, -data_traces[v], +data_traces[v], alpha=0.2, color='red')
+        axs[v].plot(data_traces[v], 'r--', label='Data')
+        axs[v].set_xlabel('time')
+        axs[v].set_ylabel('{}'.format(snapshot['variables'][v]))
+        axs[v].legend(loc='upper left')
+
+    plt.savefig(snapshot['filename'])
+    plt.close('all')
+
+
+def render_traces_pid(snapshot):
+    '''
+    Description:
+        RL policy vs data vs PID equation traces and the B:VIMIN/B:IMINER correlation plot
+        (Surrogate_Accelerator_v4)
+    :param snapshot: dict with the unscaled 'traces', 'data_traces' and 'pid_traces' (nvars, nsamples),
+                     'variables', the episode rewards and the output 'filename' and 'corr_filename'
+    '''
+    plt = _setup_plots()
+    traces = snapshot['traces']
+    data_traces = snapshot['data_traces']
+    pid_traces = snapshot['pid_traces']
+    nvars = len(traces)
+    fig, axs = plt.subplots(nvars, figsize=(12, 8))
+    for v in range(0, nvars):
+        if v == 0:
+            axs[v].set_title('Raw data reward: {:.2f} - RL agent reward: {:.2f} - PID Eq reward {:.2f}'.format(
+                snapshot['data_total_reward'], snapshot['total_reward'], snapshot['rachael_reward']))
+        axs[v].plot(traces[v], label='RL Policy', color='black')
+        if v == 1:
+            x = np.arange(len(data_traces[v]))
+            axs[v].fill_between(x, -data_traces[v], +data_traces[v], alpha=0.2, color='red')
+        axs[v].plot(data_traces[v], 'r--', label='Data')
+        axs[v].plot(pid_traces[v], label="PID Eq", color='blue', linestyle='dotted')
+        axs[v].set_xlabel('time')
+        axs[v].set_ylabel('{}'.format(snapshot['variables'][v]))
+        axs[v].legend(loc='upper left')
+    plt.savefig(snapshot['filename'])
+    plt.clf()
+
+    fig, axs = plt.subplots(1, figsize=(12, 12))
+    axs.scatter(data_traces[0], data_traces[1], label='Data')
+    axs.scatter(traces[0], traces[1], label='RL Policy')
+    axs.scatter(pid_traces[0], pid_traces[1], label='PID Eq')
+    axs.set_xlabel(snapshot['variables'][0])
+    axs.set_ylabel(snapshot['variables'][1])
+    axs.legend(loc='upper left')
+    plt.savefig(snapshot['corr_filename'])
+    plt.close('all')
@@ -0,0 +1,55 @@
+import numpy as np
+
+
+class RingWindow:
+    def __init__(self, shape, dtype=np.float32):
+        '''
+        Description:
+            Sliding window of the env state, shape (..., nvariables, nsamples), kept in a circular buffer.
+            The buffer holds every sample twice (at t and t + nsamples), so the current window is always
+            the contiguous slice [head, head + nsamples) and pushing a new time step writes one column
+            instead of shifting the whole history.
+        :param shape: window shape, the last axis is time
+        :param dtype: buffer type
+        '''
+        self.shape = tuple(shape)
+        self.nsamples = self.shape[-1]
+        self.buffer = np.zeros(self.shape[:-1] + (2 * self.nsamples,), dtype=dtype)
+        self.head = 0
+
+    def window(self):
+        # View of the current window, oldest sample first
+        return self.buffer[..., self.head:self.head + self.nsamples]
+
+    def last(self):
+        # View of the newest sample of every variable
+        return self.buffer[..., self.head + self.nsamples - 1]
+
+    def reset(self, window, index=slice(None)):
+        '''
+        Description:
+            Overwrite the window (or the windows selected by index along the first axis)
+        :param window: new window values
+        :param index: slice or index array of the first axis
+        '''
+        n, h = self.nsamples, self.head
+        self.buffer[index, ..., h:h + n] = window
+        # Mirror the written samples into the other half of the buffer
+        self.buffer[index, ..., :h] = self.buffer[index, ..., n:n + h]
+        self.buffer[index, ..., h + n:] = self.buffer[index, ..., h:n]
+
+    def push(self, column):
+        '''
+        Description:
+            Advance the window by one time step
+        :param column: new sample of every variable, shape (..., nvariables)
+        '''
+        self.buffer[..., self.head] = column
+        self.buffer[..., self.head + self.nsamples] = column
+        self.head = (self.head + 1) % self.nsamples
+
+    def set_last(self, variable, value, index=slice(None)):
+        # Overwrite the newest sample of one variable (in the windows selected by index)
+        idx = (self.head - 1) % self.nsamples
+        self.buffer[index, ..., variable, idx] = value
+        self.buffer[index, ..., variable, idx + self.nsamples] = value
@@ -0,0 +1,177 @@
+import gym
+from gym import spaces
+from gym.utils import seeding
+import pandas as pd
+import dataprep.dataset as dp
+import dataprep.cache as dc
+from dataprep.scaling import AffineScaler
+from gym_accelerator.envs.ring_window import RingWindow
+from tensorflow import keras
+import numpy as np
+
+import logging
+
+logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('RL-Logger')
+logger.setLevel(logging.INFO)
+
+np.seterr(divide='ignore', invalid='ignore')
+
+
+class Surrogate_Accelerator_Batch(gym.Env):
+    def __init__(self, nenvs=64, shared_data=False):
+        '''
+        Description:
+            Vectorized version of Surrogate_Accelerator_v1 that runs nenvs episodes side by side.
+            The state holds all episodes as (nenvs, nvariables, nsamples) and every step runs a single
+            batched booster model call. Each episode starts at its own random batch_id and finished
+            episodes are reset automatically, their last observation is returned in the info dict.
+        :param nenvs: number of concurrent episodes
+        :param shared_data: memory-map the cached series read-only so parallel env instances share one copy
+        '''
+        self.shared_data = shared_data
+        self.save_dir = './'
+        self.nenvs = nenvs
+        self.max_steps = 100
+        self.episodes = np.zeros(self.nenvs, dtype=np.int64)
+        self.steps = np.zeros(self.nenvs, dtype=np.int64)
+        self.total_reward = np.zeros(self.nenvs)
+        self.data_total_reward = np.zeros(self.nenvs)
+        self.diff = np.zeros(self.nenvs)
+
+        # Define boundary
+        self.min_BIMIN = 103.1
+        self.max_BIMIN = 103.6
+
+        # Load surrogate models
+        self.booster_model = keras.models.load_model(
+            '../surrogate_models/fullbooster_noshift_e250_bs99_nsteps250k_invar5_outvar3_axis1_mmscaler_t0_D10122020'
+            '-T175237_kfold2__e16_vl0.00038.h5')
+
+        # Load data to initialize the env
+        filename = '310_11_more_params.csv'
+        self.variables = ['B:VIMIN', 'B:IMINER', 'B:LINFRQ', 'I:IB', 'I:MDAT40']
+        self.nvariables = len(self.variables)
+        logger.info('Number of variables:{}'.format(self.nvariables))
+
+        # Processed data, read from its columnar copy when there is one
+        source = dp.processed_source('../data/' + filename)
+        def prepare():
+            data = dp.load_reformated_cvs(source, nrows=250000)
+            data['B:VIMIN'] = data['B:VIMIN'].shift(-1)
+            data = data.set_index(pd.to_datetime(data.time))
+            data = data.dropna()
+            data = data.drop_duplicates()
+            scalers, series, _ = dp.get_scaled_series(data, self.variables, split_fraction=1.0)
+            return series, dc.scaler_params(scalers, self.variables)
+
+        # The cleaned and scaled series is cached on disk, the windows are views into the train part
+        series, scale_params = dc.cached_series(source, self.variables, prepare, nrows=250000,
+                                                look_back=10 * 15, scaling='minmax', mmap=shared_data)
+        self.scalers = dc.scalers_from_params(scale_params, self.variables)
+        self.scaler = AffineScaler.from_minmax(self.scalers)
+        self.series = series[0:int(len(series) * 0.70)]
+        self.X_train, _ = dp.create_windows(self.series, look_back=10 * 15)
+
+        self.nbatches = self.X_train.shape[0]
+        self.nsamples = self.X_train.shape[2]
+        # Episodes read X_train[batch_id + steps], so the start points leave room for a full episode
+        self.max_batch_id = self.nbatches - self.max_steps - 1
+        self.batch_id = np.zeros(self.nenvs, dtype=np.int64)
+
+        print('Data shape:{}'.format(self.X_train.shape))
+        self.observation_space = spaces.Box(
+            low=0,
+            high=+1,
+            shape=(self.nvariables,),
+            dtype=np.float64
+        )
+
+        self.actionMap_VIMIN = np.array([0, 0.0001, 0.005, 0.001, -0.0001, -0.005, -0.001])
+        self.action_space = spaces.Discrete(7)
+        self.VIMIN = np.zeros(self.nenvs)
+        ## The state history is a ring buffer, the booster model input is assembled into a reused buffer
+        self.ring = RingWindow((self.nenvs, self.nvariables, self.nsamples), dtype=self.X_train.dtype)
+        self.model_input = np.zeros(shape=(self.nenvs, self.nvariables, self.nsamples), dtype=self.X_train.dtype)
+        self.column = np.zeros(shape=(self.nenvs, self.nvariables), dtype=self.X_train.dtype)
+        self.seed()
+
+    @property
+    def state(self):
+        # Current (nenvs, nvariables, nsamples) windows, a view into the ring buffer
+        return self.ring.window()
+
+    def seed(self, seed=None):
+        self.np_random, seed = seeding.np_random(seed)
+        return [seed]
+
+    def _reset_envs(self, envs):
+        self.episodes[envs] += 1
+        self.steps[envs] = 0
+        self.data_total_reward[envs] = 0
+        self.total_reward[envs] = 0
+        self.diff[envs] = 0
+        self.batch_id[envs] = self.np_random.randint(0, high=self.max_batch_id, size=len(envs))
+        self.ring.reset(self.X_train[self.batch_id[envs]], envs)
+        self.VIMIN[envs] = self.ring.last()[envs, 0]
+
+    def step(self, actions):
+        '''
+        Description:
+            Apply one action per episode and advance all episodes with one surrogate call
+        :param actions: array of nenvs discrete actions
+        :return: observations (nenvs, nvariables), rewards (nenvs,), dones (nenvs,), info
+        '''
+        self.steps += 1
+        dones = np.zeros(self.nenvs, dtype=np.bool_)
+
+        # Step 1: Calculate the new B:VINMIN based on the policy actions
+        delta_VIMIN = self.actionMap_VIMIN[np.asarray(actions, dtype=np.int64)]
+        DENORN_BVIMIN = self.scaler.inverse_transform(self.VIMIN, 0) + delta_VIMIN
+        dones |= (DENORN_BVIMIN < self.min_BIMIN) | (DENORN_BVIMIN > self.max_BIMIN)
+        self.VIMIN = self.scaler.transform(DENORN_BVIMIN, 0)
+        self.ring.set_last(0, self.VIMIN)
+
+        # Step 2: Predict all episodes with one booster model call
+        np.copyto(self.model_input, self.ring.window())
+        predicted_state = np.asarray(self.booster_model.predict_on_batch(self.model_input)).reshape(self.nenvs, -1)
+
+        # Step 3: Shift state by one step, only the new time step is written:
+        # B:VIMIN is kept, B:IMINER is predicted and the data is used for everything else
+        newest = self.batch_id + self.steps + self.nsamples - 1
+        self.column[:, 0] = self.VIMIN
+        self.column[:, 1] = predicted_state[:, 1]
+        self.column[:, 2:] = self.series[newest, 2:]
+        self.ring.push(self.column)
+        data_iminer = self.scaler.inverse_transform(self.series[newest, 1], 1)
+        data_reward = -np.abs(data_iminer)
+
+        # Reward
+        iminer = self.scaler.inverse_transform(predicted_state[:, 1], 1)
+        rewards = -np.abs(iminer)
+        dones |= np.abs(iminer) >= 2
+        rewards -= dones * 5 * (self.max_steps - self.steps)
+        dones |= self.steps >= self.max_steps
+
+        self.diff += np.abs(data_iminer - iminer)
+        self.data_total_reward += data_reward
+        self.total_reward += rewards
+
+        observations = self.ring.last().copy()
+        info = {}
+        done_envs = np.flatnonzero(dones)
+        if len(done_envs) > 0:
+            info = {'done_envs': done_envs,
+                    'terminal_observation': observations[done_envs],
+                    'episode_reward': self.total_reward[done_envs].copy(),
+                    'episode_data_reward': self.data_total_reward[done_envs].copy(),
+                    'episode_steps': self.steps[done_envs].copy()}
+            self._reset_envs(done_envs)
+            observations[done_envs] = self.ring.last()[done_envs]
+
+        return observations, rewards, dones, info
+
+    def reset(self):
+        logger.info('Resetting {} envs'.format(self.nenvs))
+        self._reset_envs(np.arange(self.nenvs))
+        return self.ring.last().copy()
@@ -4,9 +4,11 @@ from gym import spaces
 from gym.utils import seeding
 import pandas as pd
 import dataprep.dataset as dp
+import dataprep.cache as dc
+from dataprep.scaling import AffineScaler
+from gym_accelerator.envs.render_pipeline import AsyncRenderer, render_traces
+from gym_accelerator.envs.ring_window import RingWindow
 from tensorflow import keras
-from sklearn.preprocessing import MinMaxScaler
-import matplotlib.pyplot as plt
 import numpy as np
 
 import logging
@@ -18,36 +20,10 @@ logger.setLevel(logging.INFO)
 np.seterr(divide='ignore', invalid='ignore')
 
 
-def create_dataset(dataset, look_back=10 * 15, look_forward=1):
-    X, Y = [], []
-    offset = look_back + look_forward
-    for i in range(len(dataset) - (offset + 1)):
-        xx = dataset[i:(i + look_back), 0]
-        yy = dataset[(i + look_back):(i + offset), 0]
-        X.append(xx)
-        Y.append(yy)
-    return np.array(X), np.array(Y)
-
-
-def get_dataset(df, variable='B:VIMIN'):
-    dataset = df[variable].values
-    dataset = dataset.astype('float32')
-    dataset = np.reshape(dataset, (-1, 1))
-    scaler = MinMaxScaler(feature_range=(0, 1))
-    dataset = scaler.fit_transform(dataset)
-
-    train_size = int(len(dataset) * 0.70)
-    train, test = dataset[0:train_size, :], dataset[train_size:len(dataset), :]
-
-    X_train, Y_train = create_dataset(train)
-    X_train = np.reshape(X_train, (X_train.shape[0], 1, X_train.shape[1]))
-    Y_train = np.reshape(Y_train, (Y_train.shape[0], Y_train.shape[1]))
-
-    return scaler, X_train, Y_train
-
-
 class Surrogate_Accelerator_v1(gym.Env):
-    def __init__(self):
+    def __init__(self, shared_data=False):
+        # shared_data: memory-map the cached series read-only so parallel env instances share one copy
+        self.shared_data = shared_data
 
         self.save_dir = './'
         self.episodes = 0
@@ -57,6 +33,11 @@ class Surrogate_Accelerator_v1(gym.Env):
         self.data_total_reward = 0
         self.diff = 0
 
+        # Rendering is opt-in: every render_interval steps (0 disables) and/or at the end of each episode
+        self.render_interval = 0
+        self.render_on_done = False
+        self.renderer = None
+
         # Define boundary
         self.min_BIMIN = 103.1
         self.max_BIMIN = 103.6
@@ -78,27 +59,29 @@ class Surrogate_Accelerator_v1(gym.Env):
 
         # Load data to initialize the env
         filename = '310_11_more_params.csv'
-        data = dp.load_reformated_cvs('../data/' + filename, nrows=250000)
-        data['B:VIMIN'] = data['B:VIMIN'].shift(-1)
-        data = data.set_index(pd.to_datetime(data.time))
-        data = data.dropna()
-        data = data.drop_duplicates()
         self.variables = ['B:VIMIN', 'B:IMINER', 'B:LINFRQ', 'I:IB', 'I:MDAT40']
         # self.variables = ['B:VIMIN', 'B:IMINER', 'B:VIPHAS', 'B:LINFRQ', 'I:IB', 'I:MDAT40', 'I:MXIB']
         self.nvariables = len(self.variables)
         logger.info('Number of variables:{}'.format(self.nvariables))
 
-        self.scalers = []
-        data_list = []
-        x_train = []
-        # get_dataset also normalizes the data
-        for v in range(len(self.variables)):
-            data_list.append(get_dataset(data, variable=self.variables[v]))
-            self.scalers.append(data_list[v][0])
-            x_train.append(data_list[v][1])
-        # Axis
-        concate_axis = 1
-        self.X_train = np.concatenate(x_train, axis=concate_axis)
+        # Processed data, read from its columnar copy when there is one
+        source = dp.processed_source('../data/' + filename)
+        def prepare():
+            data = dp.load_reformated_cvs(source, nrows=250000)
+            data['B:VIMIN'] = data['B:VIMIN'].shift(-1)
+            data = data.set_index(pd.to_datetime(data.time))
+            data = data.dropna()
+            data = data.drop_duplicates()
+            scalers, series, _ = dp.get_scaled_series(data, self.variables, split_fraction=1.0)
+            return series, dc.scaler_params(scalers, self.variables)
+
+        # The cleaned and scaled series is cached on disk, the windows are views into the train part
+        series, scale_params = dc.cached_series(source, self.variables, prepare, nrows=250000,
+                                                look_back=10 * 15, scaling='minmax', mmap=shared_data)
+        self.scalers = dc.scalers_from_params(scale_params, self.variables)
+        self.scaler = AffineScaler.from_minmax(self.scalers)
+        train = series[0:int(len(series) * 0.70)]
+        self.X_train, _ = dp.create_windows(train, look_back=10 * 15)
 
         self.nbatches = self.X_train.shape[0]
         self.nsamples = self.X_train.shape[2]
@@ -116,11 +99,18 @@ class Surrogate_Accelerator_v1(gym.Env):
         self.actionMap_VIMIN = [0, 0.0001, 0.005, 0.001, -0.0001, -0.005, -0.001]
         self.action_space = spaces.Discrete(7)
         self.VIMIN = 0
-        ##
-        self.state = np.zeros(shape=(1, self.nvariables, self.nsamples))
+        ## The state history is a ring buffer, the booster model input is assembled into a reused buffer
+        self.ring = RingWindow((1, self.nvariables, self.nsamples), dtype=self.X_train.dtype)
+        self.model_input = np.zeros(shape=(1, self.nvariables, self.nsamples), dtype=self.X_train.dtype)
+        self.column = np.zeros(shape=(1, self.nvariables), dtype=self.X_train.dtype)
         self.predicted_state = np.zeros(shape=(1, self.nvariables, 1))
         logger.debug('Init pred shape:{}'.format(self.predicted_state.shape))
 
+    @property
+    def state(self):
+        # Current (1, nvariables, nsamples) window, a view into the ring buffer
+        return self.ring.window()
+
     def seed(self, seed=None):
         self.np_random, seed = seeding.np_random(seed)
         return [seed]
@@ -139,19 +129,20 @@ class Surrogate_Accelerator_v1(gym.Env):
         # Step 1: Calculate the new B:VINMIN based on policy action
         logger.info('Step() before action VIMIN:{}'.format(self.VIMIN))
         delta_VIMIN = self.actionMap_VIMIN[int(action)]
-        DENORN_BVIMIN = self.scalers[0].inverse_transform(np.array([self.VIMIN]).reshape(1, -1))
+        DENORN_BVIMIN = self.scaler.inverse_transform(np.array([self.VIMIN]).reshape(1, -1), 0)
         DENORN_BVIMIN += delta_VIMIN
         logger.debug('Step() descaled VIMIN:{}'.format(DENORN_BVIMIN))
         if DENORN_BVIMIN < self.min_BIMIN or DENORN_BVIMIN > self.max_BIMIN:
             logger.info('Step() descaled VIMIN:{} is out of bounds.'.format(DENORN_BVIMIN))
             done = True
 
-        self.VIMIN = self.scalers[0].transform(DENORN_BVIMIN)
+        self.VIMIN = self.scaler.transform(DENORN_BVIMIN, 0)
         logger.debug('Step() updated VIMIN:{}'.format(self.VIMIN))
-        self.state[0][0][self.nsamples - 1] = self.VIMIN
+        self.ring.set_last(0, self.VIMIN)
 
         # Step 2: Predict using booster model
-        self.predicted_state = self.booster_model.predict(self.state)
+        np.copyto(self.model_input, self.ring.window())
+        self.predicted_state = self.booster_model.predict(self.model_input)
         self.predicted_state = self.predicted_state.reshape(1, 3, 1)
 
         # Step 3: Update IMINER and LINFQN
@@ -170,27 +161,24 @@ class Surrogate_Accelerator_v1(gym.Env):
         # #self.state[0, 3:5, -1:] = injector_prediction[0,:]
         # logger.debug('Step() state with updated injector state model\n{}'.format(self.state[0,:,-2:]))
         #
-        # Step 4: Shift state by one step
-        self.state[0, :, 0:-1] = self.state[0, :, 1:]
-
-        # Update IMINER
-        self.state[0][1][self.nsamples - 1] = self.predicted_state[0, 1:2]
-        # ## Update injector variables
-        # self.state[0, 3:5, -1:] = injector_prediction[0,:]
-
-        # Update data state for rendering
-        self.data_state = None
-        self.data_state = np.copy(self.X_train[self.batch_id + self.steps].reshape(1, self.nvariables, self.nsamples))
-        data_iminer = self.scalers[1].inverse_transform(self.data_state[0][1][self.nsamples - 1].reshape(1, -1))
+        # Data state (a view into the series) for the reward and rendering
+        self.data_state = self.X_train[self.batch_id + self.steps].reshape(1, self.nvariables, self.nsamples)
+        data_iminer = self.scaler.inverse_transform(self.data_state[0][1][self.nsamples - 1].reshape(1, -1), 1)
         data_reward = -abs(data_iminer)
         #data_reward = np.exp(-2*np.abs(data_iminer))
 
-        # Use data for everything but the B:IMINER prediction
-        self.state[0, 2:self.nvariables, :] = self.data_state[0, 2:self.nvariables, :]
+        # Step 4: Shift state by one step, only the new time step is written:
+        # B:VIMIN is kept, B:IMINER is predicted and the data is used for everything else
+        # ## Update injector variables
+        # self.state[0, 3:5, -1:] = injector_prediction[0,:]
+        self.column[0, 0] = self.ring.last()[0, 0]
+        self.column[0, 1] = self.predicted_state[0, 1, 0]
+        self.column[0, 2:] = self.data_state[0, 2:, -1]
+        self.ring.push(self.column)
 
         iminer = self.predicted_state[0, 1]
         logger.debug('norm iminer:{}'.format(iminer))
-        iminer = self.scalers[1].inverse_transform(np.array([iminer]).reshape(1, -1))
+        iminer = self.scaler.inverse_transform(np.array([iminer]).reshape(1, -1), 1)
         logger.debug('iminer:{}'.format(iminer))
 
         # Reward
@@ -213,7 +201,8 @@ class Surrogate_Accelerator_v1(gym.Env):
         self.data_total_reward += np.asscalar(data_reward)
         self.total_reward += np.asscalar(reward)
 
-        self.render()
+        if (self.render_interval > 0 and self.steps % self.render_interval == 0) or (done and self.render_on_done):
+            self.render()
 
         return self.state[0, :, -1:].flatten(), np.asscalar(reward), done, {}
 
@@ -230,58 +219,32 @@ class Surrogate_Accelerator_v1(gym.Env):
         # self.batch_id = np.random.randint(0, high=self.nbatches)
         logger.info('Resetting env')
         # self.state = np.zeros(shape=(1,5,150))
-        logger.debug('self.state:{}'.format(self.state))
-        self.state = None
-        self.state = np.copy(self.X_train[self.batch_id].reshape(1, self.nvariables, self.nsamples))
+        self.ring.reset(self.X_train[self.batch_id].reshape(1, self.nvariables, self.nsamples))
         logger.debug('self.state:{}'.format(self.state))
         logger.debug('reset_data.shape:{}'.format(self.state.shape))
         self.VIMIN = self.state[0, 0, -1:]
         logger.debug('Normed VIMIN:{}'.format(self.VIMIN))
-        logger.debug('B:VIMIN:{}'.format(self.scalers[0].inverse_transform(np.array([self.VIMIN]).reshape(1, -1))))
+        logger.debug('B:VIMIN:{}'.format(self.scaler.inverse_transform(np.array([self.VIMIN]).reshape(1, -1), 0)))
         return self.state[0, :, -1:].flatten()
 
     def render(self):
-
-        plt.rcParams['axes.titlesize'] = 18
-        plt.rcParams['axes.titleweight'] = 'bold'
-        plt.rcParams['axes.labelsize'] = 18
-        plt.rcParams['axes.labelweight'] = 'regular'
-        plt.rcParams['xtick.labelsize'] = 14
-        plt.rcParams['ytick.labelsize'] = 14
-        plt.rcParams['font.family'] = [u'serif']
-        plt.rcParams['font.size'] = 14
-        plt.rcParams['font.family'] = [u'serif']
-        plt.rcParams['font.size'] = 16
-
+        # Snapshot the unscaled traces and render them in the background, frames are dropped when busy
         logger.debug('render()')
-        logger.debug('Save path:{}'.format(self.save_dir))
         render_dir = os.path.join(self.save_dir, 'render')
-        logger.debug('Render path:{}'.format(render_dir))
         if not os.path.exists(render_dir):
             os.mkdir(render_dir)
-        import seaborn as sns
-        sns.set_style("ticks")
         nvars = 2  # len(self.variables)
-        fig, axs = plt.subplots(nvars, figsize=(12, 8))
-        logger.debug('self.state:{}'.format(self.state))
-        for v in range(0, nvars):
-            utrace = self.state[0, v, :]
-            trace = self.scalers[v].inverse_transform(utrace.reshape(-1, 1))
-            if v == 0:
-                axs[v].set_title('Raw data reward: {:.2f} - RL agent reward: {:.2f} '.format(self.data_total_reward,
-                                                                                             self.total_reward))
-            axs[v].plot(trace, label='Digital twin', color='black')
-
-            # if v==1:
-            data_utrace = self.data_state[0, v, :]
-            data_trace = self.scalers[v].inverse_transform(data_utrace.reshape(-1, 1))
-            if v == 1:
-                x = np.linspace(0, 149, 150)
-                axs[v].fill_between(x, -data_trace.flatten(), +data_trace.flatten(), alpha=0.2, color='red')
-            axs[v].plot(data_trace, 'r--', label='Data')
-            axs[v].set_xlabel('time')
-            axs[v].set_ylabel('{}'.format(self.variables[v]))
-            axs[v].legend(loc='upper left')
-
-        plt.savefig(render_dir + '/episode{}_step{}_v1.png'.format(self.episodes, self.steps))
-        plt.close('all')
+        snapshot = {'traces': self.scaler.inverse_transform(self.state[0, :nvars], slice(0, nvars), axis=0),
+                    'data_traces': self.scaler.inverse_transform(self.data_state[0, :nvars], slice(0, nvars), axis=0),
+                    'variables': self.variables[:nvars],
+                    'data_total_reward': self.data_total_reward,
+                    'total_reward': self.total_reward,
+                    'filename': render_dir + '/episode{}_step{}_v1.png'.format(self.episodes, self.steps)}
+        if self.renderer is None:
+            self.renderer = AsyncRenderer()
+        self.renderer.submit(render_traces, snapshot)
+
+    def close(self):
+        if self.renderer is not None:
+            self.renderer.close()
+            self.renderer = None
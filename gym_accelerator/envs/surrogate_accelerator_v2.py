@@ -4,8 +4,10 @@ from gym.utils import seeding
 import numpy as np
 import pandas as pd
 import dataprep.dataset as dp
+import dataprep.cache as dc
+from dataprep.scaling import AffineScaler
+from gym_accelerator.envs.ring_window import RingWindow
 from tensorflow import keras
-from sklearn.preprocessing import MinMaxScaler
 import matplotlib.pyplot as plt
 import numpy as np
 
@@ -17,7 +19,9 @@ logger.setLevel(logging.INFO)
 np.seterr(divide='ignore', invalid='ignore')
         
 class Surrogate_Accelerator_v2(gym.Env):
-  def __init__(self):
+  def __init__(self, shared_data=False):
+    ## shared_data: memory-map the cached series read-only so parallel env instances share one copy
+    self.shared_data = shared_data
 
     self.save_dir='./'
     self.episodes = 0
@@ -34,32 +38,32 @@ class Surrogate_Accelerator_v2(gym.Env):
 
     ## Load data to initilize the env ##
     filename = 'final_310_311_data.csv'
-    data = dp.load_reformated_cvs('../data/' + filename,nrows=250000)
-    data['B:VIMIN'] = data['B:VIMIN'].shift(-1)
-    data['B:VIMIN_STD'] = data['B:VIMIN'].rolling(window=15).std()
-    data['B:IMINER_STD'] = data['B:IMINER'].rolling(window=15).std()
-    data = data.set_index(pd.to_datetime(data.time))
-    data = data.dropna()
-    data = data.drop_duplicates()
-
     self.variables = ['B:VIMIN', 'B:IMINER', 'B:VIMIN_STD', 'B:IMINER_STD', 'B:LINFRQ', 'I:IB', 'I:MDAT40']
-    data_list = []
-    self.scalers = []
-    ## get_dataset also normalizes the data
-    for v in range(len(self.variables)):
-      data_list.append(self.get_dataset(data,variable=self.variables[v]))
-      self.scalers.append(data_list[v][0])
-
-    # Axis
-    concate_axis = 1
+    ## Processed data, read from its columnar copy when there is one
+    source = dp.processed_source('../data/' + filename)
+    def prepare():
+      data = dp.load_reformated_cvs(source,nrows=250000)
+      data['B:VIMIN'] = data['B:VIMIN'].shift(-1)
+      data['B:VIMIN_STD'] = data['B:VIMIN'].rolling(window=15).std()
+      data['B:IMINER_STD'] = data['B:IMINER'].rolling(window=15).std()
+      data = data.set_index(pd.to_datetime(data.time))
+      data = data.dropna()
+      data = data.drop_duplicates()
+      scalers, series, _ = dp.get_scaled_series(data, self.variables, split_fraction=1.0, feature_range=(0.0001, 1))
+      return series, dc.scaler_params(scalers, self.variables)
+
+    ## The cleaned and scaled series is cached on disk, the windows are views into the train part
+    series, scale_params = dc.cached_series(source, self.variables, prepare, nrows=250000,
+                                            look_back=10*15, scaling='minmax', mmap=shared_data)
+    self.scalers = dc.scalers_from_params(scale_params, self.variables)
+    self.scaler = AffineScaler.from_minmax(self.scalers)
+    train = series[0:int(len(series)*0.70)]
+    X_train, Y_train = dp.create_windows(train, look_back=10*15)
 
     ## data
-    self.X_train = np.concatenate((data_list[0][1], data_list[1][1], data_list[2][1], data_list[3][1],
-                                data_list[4][1], data_list[5][1], data_list[6][1]), axis=concate_axis)
-    self.Y_train = np.concatenate((data_list[0][2], data_list[1][2]), axis=1)
-
-
-    self.X_train_raw = np.copy(self.X_train)
+    self.X_train = X_train
+    self.Y_train = Y_train[:, 0:2, 0]
+    self.X_train_raw = self.X_train
     self.nbatches = self.X_train.shape[0]
     self.nsamples = self.X_train.shape[2]
     self.batch_id = 0 #np.random.randint(0, high=self.nbatches)
@@ -74,11 +78,18 @@ class Surrogate_Accelerator_v2(gym.Env):
     self.actionMap_VIMIN = [0, 0.0001, 0.005, 0.001 , -0.0001,-0.005, -0.001]
     self.action_space = spaces.Discrete(7)
     self.VIMIN = 0
-    ##
-    self.state = np.zeros(shape=(1,7,150))
+    ## The state history is a ring buffer, the booster model input is assembled into a reused buffer
+    self.ring = RingWindow((1,7,150), dtype=self.X_train.dtype)
+    self.model_input = np.zeros(shape=(1,7,150), dtype=self.X_train.dtype)
+    self.column = np.zeros(shape=(1,7), dtype=self.X_train.dtype)
     self.predicted_state = np.zeros(shape=(1,7,1))
     logger.debug('Init pred shape:{}'.format(self.predicted_state.shape))
 
+  @property
+  def state(self):
+    ## Current (1,7,150) window, a view into the ring buffer
+    return self.ring.window()
+
   def seed(self, seed=None):
     self.np_random, seed = seeding.np_random(seed)
     return [seed]
@@ -98,24 +109,25 @@ class Surrogate_Accelerator_v2(gym.Env):
     ## Step 1: Calculate the new B:VINMIN based on policy action
     logger.info('Step() before action VIMIN:{}'.format(self.VIMIN))
     delta_VIMIN = self.actionMap_VIMIN[action]
-    DENORN_BVIMIN = self.scalers[0].inverse_transform(np.array([self.VIMIN ]).reshape(1, -1))
+    DENORN_BVIMIN = self.scaler.inverse_transform(np.array([self.VIMIN ]).reshape(1, -1), 0)
     DENORN_BVIMIN += delta_VIMIN
     logger.debug('Step() descaled VIMIN:{}'.format(DENORN_BVIMIN))
     if DENORN_BVIMIN < self.min_BIMIN or DENORN_BVIMIN > self.max_BIMIN:
       logger.info('Step() descaled VIMIN:{} is out of bounds.'.format(DENORN_BVIMIN))
       done = True
 
-    self.VIMIN = self.scalers[0].transform(DENORN_BVIMIN)
+    self.VIMIN = self.scaler.transform(DENORN_BVIMIN, 0)
     logger.debug('Step() updated VIMIN:{}'.format(self.VIMIN))
 
     logger.debug('Step() state B:VIMIN\n{}'.format(self.state[0,0,-2:1]))
 
     ## TODO: I need to shift the VIMIN data before pushing new VIMIN
-    self.state[ 0, 0, -1:] = self.VIMIN
+    self.ring.set_last(0, self.VIMIN)
     logger.debug('Step() state with Updated action on B:VIMIN\n{}'.format(self.state[0,0,-2:1]))
 
     ## Step 2: Predict using booster model
-    self.predicted_state = self.booster_model.predict(self.state)
+    np.copyto(self.model_input, self.ring.window())
+    self.predicted_state = self.booster_model.predict(self.model_input)
     self.predicted_state = self.predicted_state.reshape(1, 2, 1)
 
     ## Step 3: Update IMINER and LINFQN
@@ -134,23 +146,21 @@ class Surrogate_Accelerator_v2(gym.Env):
     ##self.state[0, 3:5, -1:] = injector_prediction[0,:]
     #logger.debug('Step() state with updated injector state model\n{}'.format(self.state[0,:,-2:]))
 
-    ## Step 4: Shift state by one step and update last time stamp using predictions
-    self.state[0, :, 0:-1] = self.state[ 0, :, 1:]
+    ## Update data state (a view into the series) for rendering
+    self.data_state = self.X_train[self.batch_id+self.steps].reshape(1, 7, 150)
 
-    ## Update IMINER
-    self.state[0, 1:2, -1:] = self.predicted_state[0,1:2]
+    ## Step 4: Shift state by one step, only the new time step is written:
+    ## B:VIMIN is kept, B:IMINER is predicted and the data is used for everything else
+    self.column[0, 0] = self.ring.last()[0, 0]
+    self.column[0, 1] = self.predicted_state[0, 1, 0]
     ## Update injector variables
     #self.state[0, 3:5, -1:] = injector_prediction[0,:]
-
-    ## Update data state for rendering
-    self.data_state = np.copy(self.X_train[self.batch_id+self.steps].reshape(1, 7, 150))
-
-    ## Use data for everything but the B:IMINER prediction ##
-    self.state[0, 2:7,:] = self.data_state[0, 2:7,:]
+    self.column[0, 2:7] = self.data_state[0, 2:7, -1]
+    self.ring.push(self.column)
 
     iminer = self.predicted_state[0,1]
     logger.debug('norm iminer:{}'.format(iminer))
-    iminer = self.scalers[1].inverse_transform(np.array([iminer]).reshape(1, -1))
+    iminer = self.scaler.inverse_transform(np.array([iminer]).reshape(1, -1), 1)
     logger.debug('iminer:{}'.format(iminer))
     reward = -abs(iminer)
     if abs(iminer) >= 2:
@@ -179,14 +189,14 @@ class Surrogate_Accelerator_v2(gym.Env):
     self.batch_id=0
     #self.state = np.zeros(shape=(1,5,150))
     logger.debug('self.state:{}'.format(self.state))
-    self.state = np.copy(self.X_train[self.batch_id].reshape(1,7,150))
-    ## Copy as data to keep track of what the true accelerator did
-    self.data_state = np.copy(self.X_train[self.batch_id].reshape(1,7,150))
+    self.ring.reset(self.X_train[self.batch_id].reshape(1,7,150))
+    ## Data (a view into the series) to keep track of what the true accelerator did
+    self.data_state = self.X_train[self.batch_id].reshape(1,7,150)
     logger.debug('self.state:{}'.format(self.state))
     logger.debug('reset_data.shape:{}'.format(self.state.shape))
     self.VIMIN = self.state[0,0,-1:]
     logger.debug('Normed VIMIN:{}'.format(self.VIMIN))
-    logger.debug('B:VIMIN:{}'.format(self.scalers[0].inverse_transform(np.array([self.VIMIN]).reshape(1, -1))))
+    logger.debug('B:VIMIN:{}'.format(self.scaler.inverse_transform(np.array([self.VIMIN]).reshape(1, -1), 0)))
 
     return self.state[0,:,-1:]
 
@@ -219,11 +229,11 @@ class Surrogate_Accelerator_v2(gym.Env):
     logger.debug('self.state:{}'.format(self.state))
     for v in range(0,nvars):#len(self.variables)):
       utrace = self.state[0, v, :]
-      trace  = self.scalers[v].inverse_transform(utrace.reshape(-1, 1))
+      trace  = self.scaler.inverse_transform(utrace.reshape(-1, 1), v)
       axs[v].plot(trace, label='RL Action')
       #if v==1:
       data_utrace = self.data_state[0, v, :]
-      data_trace = self.scalers[v].inverse_transform(data_utrace.reshape(-1, 1))
+      data_trace = self.scaler.inverse_transform(data_utrace.reshape(-1, 1), v)
       axs[v].plot(data_trace,'r--', label='Data')
       axs[v].set_xlabel('time')
       axs[v].set_ylabel('{}'.format(self.variables[v]));
@@ -235,7 +245,7 @@ class Surrogate_Accelerator_v2(gym.Env):
       ##print(self.variables[v])
       utrace = self.state[0,0,start_trace:end_trace]
       #print('utrace:\n {}'.format(utrace))
-      trace = self.scalers[v].inverse_transform(utrace.reshape(-1,1))
+      trace = self.scaler.inverse_transform(utrace.reshape(-1,1), v)
       #print('trace:\n {}'.format(trace))
       axs[v].plot(trace)
       #axs[v].legend(title=self.variables[v])
@@ -246,35 +256,3 @@ class Surrogate_Accelerator_v2(gym.Env):
     plt.close('all')
 
     #plt.close()
-
-  def create_dataset(self, dataset, look_back=10*15, look_forward=1):
-    X, Y = [], []
-    offset = look_back + look_forward
-    for i in range(len(dataset) - (offset + 1)):
-      xx = dataset[i:(i + look_back), 0]
-      yy = dataset[(i + look_back):(i + offset), 0]
-      X.append(xx)
-      Y.append(yy)
-    return np.array(X), np.array(Y)
-
-  def get_dataset(self, df, variable='B:VIMIN'):
-    dataset = df[variable].values  # numpy.ndarray
-    dataset = dataset.astype('float32')
-    dataset = np.reshape(dataset, (-1, 1))
-    scaler = MinMaxScaler(feature_range=(0.0001, 1))
-    dataset = scaler.fit_transform(dataset)
-
-    ## TODO: Fix
-    train_size = int(len(dataset) * 0.70)
-    train, test = dataset[0:train_size, :], dataset[train_size:len(dataset), :]
-
-    X_train, Y_train = self.create_dataset(train)
-    X_train = np.reshape(X_train, (X_train.shape[0], 1, X_train.shape[1]))
-    Y_train = np.reshape(Y_train, (Y_train.shape[0], Y_train.shape[1]))
-
-    #X_test, Y_test = create_dataset(test, look_back, look_forward)
-    #X_test = np.reshape(X_test, (X_test.shape[0], 1, X_test.shape[1]))
-    #Y_test = np.reshape(Y_test, (Y_test.shape[0], Y_test.shape[1]))
-
-    return scaler, X_train, Y_train#, X_test, Y_test
-
@@ -5,8 +5,10 @@ from gym.utils import seeding
 import numpy as np
 import pandas as pd
 import dataprep.dataset as dp
+import dataprep.cache as dc
+from dataprep.scaling import AffineScaler
+from gym_accelerator.envs.ring_window import RingWindow
 from tensorflow import keras
-from sklearn.preprocessing import MinMaxScaler
 import matplotlib.pyplot as plt
 import numpy as np
 
@@ -20,7 +22,9 @@ np.seterr(divide='ignore', invalid='ignore')
 class Surrogate_Accelerator_v3(gym.Env):
   batch_id: int
 
-  def __init__(self):
+  def __init__(self, shared_data=False):
+    ## shared_data: memory-map the cached series read-only so parallel env instances share one copy
+    self.shared_data = shared_data
 
     self.save_dir='./'
     self.episodes = 0
@@ -38,28 +42,28 @@ class Surrogate_Accelerator_v3(gym.Env):
 
     ## Load data ##
     filename = '310_11_more_params.csv'
-    data = dp.load_reformated_cvs('../data/' + filename,nrows=250000)
-    #data['B:VIMIN'] = data['B:VIMIN'].shift(-1)
-    data = data.set_index(pd.to_datetime(data.time))
-    data = data.dropna()
-    data = data.drop_duplicates()
-
     self.variables = ['B:VIMIN', 'B:IMINER', 'B:VIPHAS', 'B:LINFRQ', 'I:IB', 'I:MDAT40', 'I:MXIB']
-    self.scalers = []
-    data_list = []
-    x_train = []
-    ## get_dataset also normalizes the data
-    for v in range(len(self.variables)):
-      data_list.append(self.get_dataset(data,variable=self.variables[v]))
-      self.scalers.append(data_list[v][0])
-      x_train.append(data_list[v][1])
-
-    # Axis
-    concate_axis = 1
+    ## Processed data, read from its columnar copy when there is one
+    source = dp.processed_source('../data/' + filename)
+    def prepare():
+      data = dp.load_reformated_cvs(source,nrows=250000)
+      #data['B:VIMIN'] = data['B:VIMIN'].shift(-1)
+      data = data.set_index(pd.to_datetime(data.time))
+      data = data.dropna()
+      data = data.drop_duplicates()
+      scalers, series, _ = dp.get_scaled_series(data, self.variables, split_fraction=1.0, feature_range=(0.0001, 1))
+      return series, dc.scaler_params(scalers, self.variables)
+
+    ## The cleaned and scaled series is cached on disk, the windows are views into the train part
+    series, scale_params = dc.cached_series(source, self.variables, prepare, nrows=250000,
+                                            look_back=10*15, scaling='minmax', mmap=shared_data)
+    self.scalers = dc.scalers_from_params(scale_params, self.variables)
+    self.scaler = AffineScaler.from_minmax(self.scalers)
+    train = series[0:int(len(series)*0.70)]
 
     ## data
-    self.X_train = np.concatenate(x_train, axis=concate_axis)
-    self.X_train_raw = np.copy(self.X_train)
+    self.X_train, _ = dp.create_windows(train, look_back=10*15)
+    self.X_train_raw = self.X_train
     self.nbatches = self.X_train.shape[0]
     self.nsamples = self.X_train.shape[2]
     self.batch_id = 0 #np.random.randint(0, high=self.nbatches)
@@ -75,11 +79,18 @@ class Surrogate_Accelerator_v3(gym.Env):
     self.actionMap_VIMIN = [0, 0.005, -0.005, 0.01, -0.01, 0.02, -0.02]
     self.action_space = spaces.Discrete(len(self.actionMap_VIMIN))
     self.VIMIN = 0
-    ## Input states for the Booster model
-    self.state = np.zeros(shape=(1,self.nobs_states,self.nsamples))
+    ## The state history is a ring buffer, the booster model input is assembled into a reused buffer
+    self.ring = RingWindow((1,len(self.variables),self.nsamples), dtype=self.X_train.dtype)
+    self.model_input = np.zeros(shape=(1,len(self.variables),self.nsamples), dtype=self.X_train.dtype)
+    self.column = np.zeros(shape=(1,len(self.variables)), dtype=self.X_train.dtype)
     ## Booster model predicted states
     self.predicted_state = np.zeros(shape=(1,2,1))
 
+  @property
+  def state(self):
+    ## Current (1,nvariables,nsamples) window, a view into the ring buffer
+    return self.ring.window()
+
   def seed(self, seed=None):
     self.np_random, seed = seeding.np_random(seed)
     return [seed]
@@ -102,7 +113,7 @@ class Surrogate_Accelerator_v3(gym.Env):
     ## Step 1: Calculate the new B:VINMIN based on policy action
     logger.info('Step() scaled VIMIN before action :{}'.format(self.VIMIN))
     delta_VIMIN = self.actionMap_VIMIN[action]
-    DENORN_BVIMIN = self.scalers[0].inverse_transform(np.array([self.VIMIN ]).reshape(1, -1))
+    DENORN_BVIMIN = self.scaler.inverse_transform(np.array([self.VIMIN ]).reshape(1, -1), 0)
     logger.debug('Step() descaled before action VIMIN:{}'.format(DENORN_BVIMIN))
     DENORN_BVIMIN += delta_VIMIN
     logger.debug('Step() descaled after action VIMIN:{}'.format(DENORN_BVIMIN))
@@ -110,36 +121,36 @@ class Surrogate_Accelerator_v3(gym.Env):
       logger.info('Step() descaled VIMIN:{} is out of bounds.'.format(DENORN_BVIMIN))
       DENORN_BVIMIN -= delta_VIMIN
 
-    self.VIMIN = self.scalers[0].transform(DENORN_BVIMIN)
+    self.VIMIN = self.scaler.transform(DENORN_BVIMIN, 0)
     logger.info('Step() scaled VIMIN after action:{}'.format(self.VIMIN))
 
-    ## Shift and update value
+    ## The booster model sees B:VIMIN shifted and updated, the other variables are not shifted yet
     logger.debug('State with pre-updated action on B:VIMIN: {}'.format(self.state[0,0,:]))
-    self.state[0,0,0:self.nsamples-1] = self.state[0,0,1:self.nsamples]
-    self.state[0][0][self.nsamples-1] = np.asscalar(self.VIMIN)
-    #logger.debug('Step() state with updated action on B:VIMIN: {}'.format(self.state[0][0][self.nsamples-1]))
-    logger.debug('State with updated action on B:VIMIN: {}'.format(self.state[0,0,:]))
+    np.copyto(self.model_input, self.ring.window())
+    self.model_input[0,0,0:self.nsamples-1] = self.model_input[0,0,1:self.nsamples]
+    self.model_input[0][0][self.nsamples-1] = np.asscalar(self.VIMIN)
+    logger.debug('State with updated action on B:VIMIN: {}'.format(self.model_input[0,0,:]))
 
     ## Step 2: Predict using booster model
-    self.predicted_state = self.booster_model.predict(self.state)
+    self.predicted_state = self.booster_model.predict(self.model_input)
     self.predicted_state = self.predicted_state.reshape(1, 2, 1)
 
-    ## Shift and update value
-    self.state[0,1,0:self.nsamples-1] = self.state[0,1,1:self.nsamples]
-    self.state[0][1][self.nsamples-1] = self.predicted_state[0,1,0]
+    ## Get raw data (a view into the series) for the other variables
+    self.data_state = self.X_train[self.batch_id+self.steps].reshape(1, len(self.variables), self.nsamples)
 
-    ## Get raw data for the other variables
-    self.data_state = np.copy(self.X_train[self.batch_id+self.steps].reshape(1, len(self.variables), self.nsamples))
-
-    ## Update entries for everything but the B:VIMIN & B:IMINER  ##
-    self.state[0, 2:len(self.variables),:] = self.data_state[0, 2:len(self.variables),:]
+    ## Shift state by one step, only the new time step is written:
+    ## the updated B:VIMIN, the predicted B:IMINER and the data for everything else
+    self.column[0, 0] = self.model_input[0, 0, -1]
+    self.column[0, 1] = self.predicted_state[0, 1, 0]
+    self.column[0, 2:] = self.data_state[0, 2:, -1]
+    self.ring.push(self.column)
 
     ## Calculate the reward using B:IMINER
     norm_iminer = self.predicted_state[0,1]
     logger.debug('norm iminer:{}'.format(norm_iminer))
-    iminer = self.scalers[1].inverse_transform(np.array([norm_iminer]).reshape(1, -1))
+    iminer = self.scaler.inverse_transform(np.array([norm_iminer]).reshape(1, -1), 1)
 
-    #preiminer = self.scalers[1].inverse_transform(np.array([norm_preiminer]).reshape(1, -1))
+    #preiminer = self.scaler.inverse_transform(np.array([norm_preiminer]).reshape(1, -1), 1)
     #logger.debug('preiminer/iminer:{}/{}'.format(preiminer,iminer))
     #reward = -1 + 1.*math.exp(-5*abs(np.asscalar(iminer)))
     reward = -abs(iminer)
@@ -174,22 +185,20 @@ class Surrogate_Accelerator_v3(gym.Env):
     logger.info('Resetting env')
     self.batch_id=10
     #logger.debug('self.state:{}'.format(self.state))
-    self.state = None
-    self.state = np.copy(self.X_train[self.batch_id].reshape(1,len(self.variables),self.nsamples))
-    self.min_BIMIN = self.scalers[0].inverse_transform(self.state[:,0,:]).min()
-    self.max_BIMIN = self.scalers[0].inverse_transform(self.state[:,0,:]).max()
+    self.ring.reset(self.X_train[self.batch_id].reshape(1,len(self.variables),self.nsamples))
+    self.min_BIMIN = self.scaler.inverse_transform(self.state[:,0,:], 0).min()
+    self.max_BIMIN = self.scaler.inverse_transform(self.state[:,0,:], 0).max()
     logger.info('Lower and upper B:VIMIN: [{},{}]'.format(self.min_BIMIN,self.max_BIMIN))
     self.min_BIMIN = self.min_BIMIN*0.9999
     self.max_BIMIN = self.max_BIMIN*1.0001
     logger.info('Lower and upper controls: [{},{}]'.format(self.min_BIMIN,self.max_BIMIN))
-    ## Copy as data to keep track of what the true accelerator did
-    self.data_state = None
-    self.data_state = np.copy(self.X_train[self.batch_id].reshape(1,len(self.variables),self.nsamples))
+    ## Data (a view into the series) to keep track of what the true accelerator did
+    self.data_state = self.X_train[self.batch_id].reshape(1,len(self.variables),self.nsamples)
     #logger.debug('self.state:{}'.format(self.state))
     #logger.debug('reset_data.shape:{}'.format(self.state.shape))
     self.VIMIN = self.state[0][0][self.nsamples-1]
     logger.debug('Normed VIMIN:{}'.format(self.VIMIN))
-    logger.debug('B:VIMIN:{}'.format(self.scalers[0].inverse_transform(np.array([self.VIMIN]).reshape(1, -1))))
+    logger.debug('B:VIMIN:{}'.format(self.scaler.inverse_transform(np.array([self.VIMIN]).reshape(1, -1), 0)))
     observation_state = self.state[0, 2:, -1].flatten()
     return observation_state
 
@@ -222,13 +231,13 @@ class Surrogate_Accelerator_v3(gym.Env):
     #logger.debug('self.state:{}'.format(self.state))
     for v in range(0,nvars):#len(self.variables)):
       utrace = self.state[0, v, :]
-      trace  = self.scalers[v].inverse_transform(utrace.reshape(-1, 1))
+      trace  = self.scaler.inverse_transform(utrace.reshape(-1, 1), v)
       if v==0:
         axs[v].set_title('Total Reward: {:.2f}'.format(self.total_reward))
       axs[v].plot(trace, label='RL Action')
       #if v==1:
       data_utrace = self.data_state[0, v, :]
-      data_trace = self.scalers[v].inverse_transform(data_utrace.reshape(-1, 1))
+      data_trace = self.scaler.inverse_transform(data_utrace.reshape(-1, 1), v)
       axs[v].plot(data_trace,'r--', label='Data')
       axs[v].set_xlabel('Time steps')
       axs[v].set_ylabel('{}'.format(self.variables[v]));
@@ -240,7 +249,7 @@ class Surrogate_Accelerator_v3(gym.Env):
       ##print(self.variables[v])
       utrace = self.state[0,0,start_trace:end_trace]
       #print('utrace:\n {}'.format(utrace))
-      trace = self.scalers[v].inverse_transform(utrace.reshape(-1,1))
+      trace = self.scaler.inverse_transform(utrace.reshape(-1,1), v)
       #print('trace:\n {}'.format(trace))
       axs[v].plot(trace)
       #axs[v].legend(title=self.variables[v])
@@ -251,35 +260,3 @@ class Surrogate_Accelerator_v3(gym.Env):
     plt.close('all')
 
     #plt.close()
-
-  def create_dataset(self, dataset, look_back=10*15, look_forward=1):
-    X, Y = [], []
-    offset = look_back + look_forward
-    for i in range(len(dataset) - (offset + 1)):
-      xx = dataset[i:(i + look_back), 0]
-      yy = dataset[(i + look_back):(i + offset), 0]
-      X.append(xx)
-      Y.append(yy)
-    return np.array(X), np.array(Y)
-
-  def get_dataset(self, df, variable='B:VIMIN'):
-    dataset = df[variable].values  # numpy.ndarray
-    dataset = dataset.astype('float32')
-    dataset = np.reshape(dataset, (-1, 1))
-    scaler = MinMaxScaler(feature_range=(0.0001, 1))
-    dataset = scaler.fit_transform(dataset)
-
-    ## TODO: Fix
-    train_size = int(len(dataset) * 0.70)
-    train, test = dataset[0:train_size, :], dataset[train_size:len(dataset), :]
-
-    X_train, Y_train = self.create_dataset(train)
-    X_train = np.reshape(X_train, (X_train.shape[0], 1, X_train.shape[1]))
-    Y_train = np.reshape(Y_train, (Y_train.shape[0], Y_train.shape[1]))
-
-    #X_test, Y_test = create_dataset(test, look_back, look_forward)
-    #X_test = np.reshape(X_test, (X_test.shape[0], 1, X_test.shape[1]))
-    #Y_test = np.reshape(Y_test, (Y_test.shape[0], Y_test.shape[1]))
-
-    return scaler, X_train, Y_train#, X_test, Y_test
-
@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from dataprep.columnar import ColumnarWriter, write_columnar, load_columnar, load_columnar_frame
+from dataprep.dataset import processed_source, load_reformated_cvs, CSV_DATE_FORMAT
+
+
+class ColumnarTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        index = pd.date_range('2019-12-02 00:30:00', periods=5000, freq='66ms', name='time')
+        self.df = pd.DataFrame(np.random.rand(5000, 3), index=index, columns=['B:VIMIN', 'B:IMINER', 'I:IB'])
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_projection_and_time_range(self):
+        write_columnar(self.df, self.dirname, partition_freq='1min')
+        time, values = load_columnar(self.dirname, ['I:IB', 'B:VIMIN'])
+        self.assertEqual(values.dtype, np.float32)
+        np.testing.assert_array_equal(time, self.df.index.values)
+        np.testing.assert_array_equal(values, self.df[['I:IB', 'B:VIMIN']].values.astype(np.float32))
+
+        start, stop = self.df.index[1000], self.df.index[3000]
+        time, values = load_columnar(self.dirname, ['B:IMINER'], start=start, stop=stop, nrows=1500)
+        np.testing.assert_array_equal(time, self.df.index.values[1000:2500])
+        np.testing.assert_array_equal(values[:, 0], self.df['B:IMINER'].values[1000:2500].astype(np.float32))
+
+    def test_chunked_append(self):
+        with ColumnarWriter(self.dirname, partition_freq='1min') as writer:
+            for start in range(0, len(self.df), 777):
+                writer.append(self.df.iloc[start:start + 777])
+        df = load_columnar_frame(self.dirname, nrows=100)
+        self.assertEqual(list(df.columns), ['time', 'B:VIMIN', 'B:IMINER', 'I:IB'])
+        np.testing.assert_array_equal(df['B:VIMIN'].values, self.df['B:VIMIN'].values[:100].astype(np.float32))
+        self.assertEqual(len(load_columnar(self.dirname)[0]), len(self.df))
+
+    def test_env_loader(self):
+        # The env loader reads the columnar copy of a processed csv instead of the csv when it exists
+        for name, columnar_name in [('raw.h5_processed.csv.gz', 'raw.h5_processed'), ('data.csv', 'data_processed')]:
+            filename = os.path.join(self.dirname, name)
+            self.df.to_csv(filename, date_format=CSV_DATE_FORMAT)
+            self.assertEqual(processed_source(filename), filename)
+            csv_df = load_reformated_cvs(filename, nrows=1000)
+
+            write_columnar(self.df, os.path.join(self.dirname, columnar_name))
+            source = processed_source(filename)
+            self.assertEqual(source, os.path.join(self.dirname, columnar_name))
+            df = load_reformated_cvs(source, nrows=1000)
+            self.assertEqual(list(df.columns), list(csv_df.columns))
+            np.testing.assert_array_equal(df['time'].values, pd.to_datetime(csv_df['time']).values)
+            np.testing.assert_allclose(df.values[:, 1:].astype(np.float64), csv_df.values[:, 1:].astype(np.float64),
+                                       rtol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
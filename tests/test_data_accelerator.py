@@ -0,0 +1,81 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+import gym_accelerator.envs.data_accelerator as da
+from gym_accelerator.envs.data_accelerator import Data_Accelerator
+
+
+class StepManyTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Small B_VIMIN/B:VIMIN dataset and a cfg pointing to it, paths are relative to the env module
+        cls.tmpdir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        nrows = 16 * 40
+        setting = np.round(103.3 + 0.01 * np.sin(np.arange(nrows) / 50), 5)
+        df = pd.DataFrame({'B_VIMIN': setting, 'B:VIMIN': setting + rng.normal(0, 1e-3, nrows)})
+        df.to_csv(os.path.join(cls.tmpdir, 'data.csv'), index=False)
+        env_dir = os.path.dirname(os.path.abspath(da.__file__))
+        with open(os.path.join(cls.tmpdir, 'data_setup.json'), 'w') as json_file:
+            json.dump({'data_dir': os.path.relpath(cls.tmpdir, env_dir) + '/', 'data_name': 'data.csv',
+                       'data_type': 'csv'}, json_file)
+        cls.cfg_file = os.path.relpath(os.path.join(cls.tmpdir, 'data_setup.json'), env_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def make_envs(self, alpha=None):
+        envs = [Data_Accelerator(cfg_file=self.cfg_file) for _ in range(2)]
+        for env in envs:
+            env.reset()
+            if alpha is not None:
+                env.alpha = alpha
+        return envs
+
+    def assert_step_many(self, actions, alpha=None):
+        stepped, batched = self.make_envs(alpha)
+        expected = []
+        for action in actions:
+            observation, reward, done, info = stepped.step(action)
+            # step returns one of two reused observation buffers
+            expected.append((observation.copy(), reward, done, info))
+            if done:
+                break
+        observations, rewards, dones, _ = batched.step_many(actions)
+
+        self.assertEqual(len(observations), len(expected))
+        for i, (observation, reward, done, _) in enumerate(expected):
+            np.testing.assert_allclose(observations[i], observation)
+            np.testing.assert_allclose(rewards[i], reward)
+            self.assertEqual(dones[i], done)
+        self.assertEqual(batched.alpha, stepped.alpha)
+        self.assertEqual(batched.data_index, stepped.data_index)
+        self.assertEqual(batched.step_counter, stepped.step_counter)
+        self.assertEqual(batched.best_alpha, stepped.best_alpha)
+        np.testing.assert_allclose(batched.regulator.beta, stepped.regulator.beta)
+        np.testing.assert_allclose(batched.regulator_baseline.beta, stepped.regulator_baseline.beta)
+        np.testing.assert_allclose(batched._getState(), stepped._getState())
+
+    def test_in_bounds(self):
+        self.assert_step_many([0, 1, 2, 4, 5, 1, 1, 0, 2, 5] * 5)
+
+    def test_out_of_bounds(self):
+        # alpha runs over alpha_high on the fourth step
+        self.assert_step_many([2, 3, 3, 3, 0, 1])
+
+    def test_first_out_of_bounds(self):
+        self.assert_step_many([3], alpha=0.119)
+        self.assert_step_many([3, 0, 0], alpha=0.119)
+
+    def test_empty(self):
+        self.assert_step_many([])
+
+
+if __name__ == '__main__':
+    unittest.main()
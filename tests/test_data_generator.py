@@ -0,0 +1,153 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+import h5py
+import numpy as np
+import pandas as pd
+
+from dataprep.DataGenerator import DataGenerator
+from dataprep.dataset import rechunk_processed
+
+VARIABLES = ['B:IMINER', 'B:VIMIN', 'I:IB']
+
+
+def sample_reads(filename, variables, starts, backward, forward):
+    # Reference: the per sample, per variable reads of the original generator
+    with h5py.File(filename, 'r') as hf:
+        h5_variables = hf['ACNET/block0_items'][()].astype(str)
+        indices = [np.where(h5_variables == var) for var in variables]
+        list_x, list_y = [], []
+        for start in starts:
+            sub_list_x = [hf['ACNET/block0_values'][start:start + backward, index[0]].reshape(-1)
+                          for index in indices]
+            sub_list_y = [hf['ACNET/block0_values'][start + backward:start + backward + forward, index[0]].reshape(-1)
+                          for index in indices]
+            list_x.append(np.stack(sub_list_x, 1))
+            list_y.append(np.stack(sub_list_y, 1))
+    batch_y = np.stack(list_y, 0)
+    return np.stack(list_x, 0), batch_y.reshape(batch_y.shape[0], batch_y.shape[2])
+
+
+class DataGeneratorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, 'raw.h5_processed.h5')
+        rng = np.random.default_rng(0)
+        columns = ['I:MDAT40', 'B:VIMIN', 'B:LINFRQ', 'B:IMINER', 'I:IB']
+        index = pd.date_range('2019-12-02', periods=500, freq='66ms', name='time')
+        pd.DataFrame(rng.normal(size=(500, len(columns))), index=index, columns=columns).to_hdf(
+            self.filename, key='ACNET')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_block_reads_match_sample_reads(self):
+        rechunked = os.path.join(self.tmp_dir, 'raw.h5_windows.h5')
+        rechunk_processed(self.filename, rechunked, chunk_rows=64)
+        for filename in [self.filename, rechunked]:
+            generator = DataGenerator(filename, variables=VARIABLES, backward=20, forward=1, batch_size=16,
+                                      shuffle=False)
+            for index in [0, 5, len(generator) - 1]:
+                starts = np.arange(index * 16, (index + 1) * 16)
+                expected_x, expected_y = sample_reads(self.filename, VARIABLES, starts, 20, 1)
+                batch_x, batch_y = generator[index]
+                np.testing.assert_array_equal(batch_x, expected_x)
+                np.testing.assert_array_equal(batch_y, expected_y)
+
+        # A shuffled batch is still read as one block, the windows come in the shuffled order of the starts
+        generator = DataGenerator(self.filename, variables=VARIABLES, backward=20, forward=1, batch_size=16, seed=3)
+        starts = generator.epoch_starts(0)[16:32]
+        expected_x, expected_y = sample_reads(self.filename, VARIABLES, starts, 20, 1)
+        reads = []
+        read_block = generator._read_block
+        generator._read_block = lambda start, stop: reads.append((start, stop)) or read_block(start, stop)
+        batch_x, batch_y = generator[1]
+        np.testing.assert_array_equal(batch_x, expected_x)
+        np.testing.assert_array_equal(batch_y, expected_y)
+        self.assertEqual(reads, [(starts.min(), starts.min() + 16 + 20)])
+
+    def test_shuffle_determinism(self):
+        generators = [DataGenerator(self.filename, variables=VARIABLES, backward=20, batch_size=16, seed=seed)
+                      for seed in [7, 7, 8]]
+        nwindows, nbatches = generators[0].nwindows, len(generators[0])
+        for epoch in range(3):
+            starts = generators[0].epoch_starts(epoch)
+            np.testing.assert_array_equal(starts, generators[1].epoch_starts(epoch))
+            # Every batch is a shuffled span of consecutive starts, the spans do not overlap
+            self.assertEqual(len(np.unique(starts)), nbatches * 16)
+            self.assertTrue(0 <= starts.min() and starts.max() < nwindows)
+            spans = np.sort(starts.reshape(nbatches, 16), axis=1)
+            np.testing.assert_array_equal(spans, spans[:, :1] + np.arange(16))
+            self.assertFalse(np.array_equal(starts.reshape(nbatches, 16), spans))
+        self.assertFalse(np.array_equal(generators[0].epoch_starts(0), generators[0].epoch_starts(1)))
+        self.assertFalse(np.array_equal(generators[0].epoch_starts(0), generators[2].epoch_starts(0)))
+
+        # Batches only depend on (index, epoch), not on the order they are read in
+        batch = generators[0].batch(3, 1)
+        generators[1].batch(0, 2)
+        np.testing.assert_array_equal(generators[1].batch(3, 1)[0], batch[0])
+        generators[1].on_epoch_end()
+        np.testing.assert_array_equal(generators[1][3][0], batch[0])
+
+    def test_pickle_and_reopen(self):
+        generator = DataGenerator(self.filename, variables=VARIABLES, backward=20, batch_size=16, seed=1)
+        batch_x, batch_y = generator[2]
+        self.assertIsNotNone(generator.hf)
+
+        # The copy holds no file handle and opens the file on its first read
+        copy = pickle.loads(pickle.dumps(generator))
+        self.assertIsNone(copy.hf)
+        np.testing.assert_array_equal(copy[2][0], batch_x)
+        self.assertIsNotNone(copy.hf)
+
+        # A handle opened by another process is not reused
+        handle = generator.hf
+        generator.pid = -1
+        np.testing.assert_array_equal(generator[2][1], batch_y)
+        self.assertIsNot(generator.hf, handle)
+        handle.close()
+
+    def test_prefetch(self):
+        generator = DataGenerator(self.filename, variables=VARIABLES, backward=20, batch_size=16, seed=2)
+        batches = list(generator.prefetch(queue_size=2))
+        self.assertEqual(len(batches), len(generator))
+        for index in [0, len(generator) - 1]:
+            np.testing.assert_array_equal(batches[index][0], generator[index][0])
+
+        # A consumer stopping early does not leave the producer blocked
+        for batch in generator.prefetch(queue_size=1):
+            break
+
+    def test_prefetch_error(self):
+        generator = DataGenerator(self.filename, variables=VARIABLES, backward=20, batch_size=16, seed=2)
+        batch = generator.batch
+
+        def failing_batch(index, epoch):
+            if index == 3:
+                raise ValueError('bad batch')
+            return batch(index, epoch)
+        generator.batch = failing_batch
+
+        batches = []
+        with self.assertRaisesRegex(ValueError, 'bad batch'):
+            for item in generator.prefetch(queue_size=1):
+                batches.append(item)
+        self.assertEqual(len(batches), 3)
+
+    def test_to_tf_dataset(self):
+        generator = DataGenerator(self.filename, variables=VARIABLES, backward=20, batch_size=16, seed=4)
+        nbatches = len(generator)
+        dataset = generator.to_tf_dataset(cycle_length=3)
+        batches = [(x.numpy(), y.numpy()) for x, y in dataset.take(2 * nbatches)]
+        # Every epoch holds all its batches (interleaved shards are not ordered), the next epoch is reshuffled
+        for epoch in range(2):
+            expected = sorted(generator.batch(index, epoch)[1].tobytes() for index in range(nbatches))
+            read = sorted(y.tobytes() for x, y in batches[epoch * nbatches:(epoch + 1) * nbatches])
+            self.assertEqual(read, expected)
+        self.assertEqual(batches[0][0].shape, (16, 20, len(VARIABLES)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import unittest
+import tempfile
+import numpy as np
+import pandas as pd
+
+import dataprep.dataset as dp
+import dataprep.cache as dc
+
+
+class DatasetCacheTestCase(unittest.TestCase):
+    def test_build_once_and_reload(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'data.csv')
+            pd.DataFrame({'a': np.random.rand(100) * 10, 'b': np.random.rand(100)}).to_csv(filename, index=False)
+            variables = ['a', 'b']
+            nbuilds = []
+
+            def prepare():
+                nbuilds.append(1)
+                scalers, series, _ = dp.get_scaled_series(pd.read_csv(filename), variables, split_fraction=1.0)
+                return series, dc.scaler_params(scalers, variables)
+
+            for _ in range(2):
+                series, params = dc.cached_series(filename, variables, prepare, nrows=100, look_back=5)
+            self.assertEqual(len(nbuilds), 1)
+            self.assertIsInstance(series, np.memmap)
+            self.assertEqual(series.shape, (100, 2))
+            self.assertFalse(series.flags.writeable)
+            private, _ = dc.cached_series(filename, variables, prepare, nrows=100, look_back=5, mmap=False)
+            self.assertNotIsInstance(private, np.memmap)
+            np.testing.assert_array_equal(private, series)
+
+            scalers = dc.scalers_from_params(params, variables)
+            raw = pd.read_csv(filename)['a'].values.reshape(-1, 1)
+            np.testing.assert_allclose(scalers[0].transform(raw)[:, 0], series[:, 0], rtol=1e-5, atol=1e-6)
+
+            # A different look_back is a different entry
+            dc.cached_series(filename, variables, prepare, nrows=100, look_back=10)
+            self.assertEqual(len(nbuilds), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
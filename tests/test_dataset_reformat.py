@@ -0,0 +1,113 @@
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+import h5py
+import numpy as np
+import pandas as pd
+
+from dataprep.dataset import reformat_data, rechunk_processed
+
+
+def h5_layout(filename):
+    # Every node of the file with its shape, type, attributes and values
+    layout = []
+    with h5py.File(filename, 'r') as f:
+        def visit(name, node):
+            attrs = sorted((key, repr(node.attrs[key]), node.attrs.get_id(key).dtype.str) for key in node.attrs)
+            if isinstance(node, h5py.Dataset):
+                layout.append((name, node.shape, node.dtype.str, attrs, node[()].tobytes()))
+            else:
+                layout.append((name, attrs))
+        visit('/', f)
+        f.visititems(visit)
+    return layout
+
+
+def read_csv_bytes(filename):
+    with open(filename + '_processed.csv', 'rb') as csv_file, gzip.open(filename + '_processed.csv.gz', 'rb') as gz_file:
+        return csv_file.read(), gz_file.read()
+
+
+class ReformatDataTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, 'raw.h5')
+        start = pd.Timestamp('2019-12-02 01:00:00').timestamp()
+        # B_VIMIN has no data in the first second and an inf value that must be ignored
+        pd.DataFrame({'utc_seconds': start + np.linspace(0, 3, 91), 'value': np.arange(91.0)}).to_hdf(
+            self.filename, key='B_IMINER')
+        vimin = np.arange(60.0)
+        vimin[10] = np.inf
+        pd.DataFrame({'utc_seconds': start + 1 + np.linspace(0, 2, 60), 'value': vimin}).to_hdf(
+            self.filename, key='B_VIMIN')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_aligned_bins(self):
+        for nworkers in [1, 2]:
+            self.assertEqual(reformat_data(self.filename, nworkers=nworkers)['Status'], 'OK')
+            df = pd.read_hdf(self.filename + '_processed.h5', 'ACNET')
+            self.assertEqual(list(df.columns), ['B_IMINER', 'B_VIMIN'])
+            self.assertFalse(df.isna().values.any())
+            # Only the bins covered by both keys are kept
+            self.assertGreaterEqual(df.index[0], pd.Timestamp('2019-12-02 01:00:00.9'))
+            raw = pd.read_hdf(self.filename, 'B_IMINER')
+            raw = raw.set_index(pd.to_datetime(raw.utc_seconds, unit='s')).value.resample('66ms').mean()
+            np.testing.assert_allclose(df['B_IMINER'].values, raw[df.index].values)
+
+    def test_streaming_matches_in_memory(self):
+        reformat_data(self.filename, nworkers=1)
+        expected = pd.read_hdf(self.filename + '_processed.h5', 'ACNET')
+        expected_layout = h5_layout(self.filename + '_processed.h5')
+        for chunksize in [7, 1000]:
+            self.assertEqual(reformat_data(self.filename, chunksize=chunksize)['Status'], 'OK')
+            df = pd.read_hdf(self.filename + '_processed.h5', 'ACNET')
+            pd.testing.assert_frame_equal(df, expected, check_freq=False, check_exact=True)
+            self.assertEqual(h5_layout(self.filename + '_processed.h5'), expected_layout)
+            self.assertFalse(os.path.exists(self.filename + '_processed.h5.tmp'))
+
+    def test_streaming_csv_matches_in_memory(self):
+        # One row per bin around 01:00:30, a bin on a whole second
+        filename = os.path.join(self.tmp_dir, 'seconds.h5')
+        start = pd.Timestamp('2019-12-02 01:00:29.703').timestamp()
+        for key in ['B_IMINER', 'B_VIMIN']:
+            pd.DataFrame({'utc_seconds': start + 0.066 * np.arange(10), 'value': np.arange(10.0)}).to_hdf(
+                filename, key=key)
+        reformat_data(filename, data_type='csv', nworkers=1)
+        expected = read_csv_bytes(filename)
+        self.assertIn(b'\n2019-12-02 01:00:30.000000,', expected[0])
+        for chunksize in [1, 2, 1000]:
+            reformat_data(filename, data_type='csv', chunksize=chunksize)
+            self.assertEqual(read_csv_bytes(filename), expected)
+
+    def test_keys_across_midnight(self):
+        # B_VIMIN starts on the next day, both keys have to be binned on the same grid
+        filename = os.path.join(self.tmp_dir, 'midnight.h5')
+        start = pd.Timestamp('2019-12-02 23:59:58').timestamp()
+        pd.DataFrame({'utc_seconds': start + np.linspace(0, 4, 121), 'value': np.arange(121.0)}).to_hdf(
+            filename, key='B_IMINER')
+        pd.DataFrame({'utc_seconds': start + 2.5 + np.linspace(0, 1.5, 46), 'value': np.arange(46.0)}).to_hdf(
+            filename, key='B_VIMIN')
+        reformat_data(filename, nworkers=1)
+        expected = pd.read_hdf(filename + '_processed.h5', 'ACNET')
+        self.assertGreater(len(expected), 15)
+        self.assertGreaterEqual(expected.index[0], pd.Timestamp('2019-12-03'))
+        for chunksize in [5, 1000]:
+            reformat_data(filename, chunksize=chunksize)
+            df = pd.read_hdf(filename + '_processed.h5', 'ACNET')
+            pd.testing.assert_frame_equal(df, expected, check_freq=False, check_exact=True)
+
+    def test_rechunk_processed(self):
+        reformat_data(self.filename, nworkers=1)
+        processed, output = self.filename + '_processed.h5', self.filename + '_windows.h5'
+        rechunk_processed(processed, output, chunk_rows=8, compression='gzip')
+        with h5py.File(output, 'r') as f:
+            self.assertEqual(f['ACNET/block0_values'].chunks, (8, 1))
+        pd.testing.assert_frame_equal(pd.read_hdf(output, 'ACNET'), pd.read_hdf(processed, 'ACNET'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+import numpy as np
+
+from dataprep.dataset import create_windows, create_dataset
+
+
+class DatasetWindowsTestCase(unittest.TestCase):
+    def test_windows_match_loop(self):
+        series = np.random.rand(40, 3).astype(np.float32)
+        look_back, look_forward = 5, 2
+        X, Y = create_windows(series, look_back=look_back, look_forward=look_forward)
+        n = len(series) - (look_back + look_forward + 1)
+        self.assertEqual(X.shape, (n, 3, look_back))
+        self.assertEqual(Y.shape, (n, 3, look_forward))
+        for i in range(n):
+            np.testing.assert_array_equal(X[i], series[i:i + look_back].T)
+            np.testing.assert_array_equal(Y[i], series[i + look_back:i + look_back + look_forward].T)
+        # Windows are read-only views into the series
+        self.assertTrue(np.shares_memory(X, series))
+        self.assertFalse(X.flags.writeable)
+
+    def test_create_dataset(self):
+        dataset = np.arange(20, dtype=np.float32).reshape(-1, 1)
+        X, Y = create_dataset(dataset, look_back=3, look_forward=1)
+        self.assertEqual(X[0].tolist(), [0, 1, 2])
+        self.assertEqual(Y[0].tolist(), [3])
+        self.assertEqual(len(X), 20 - 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from gym_accelerator.envs.emulator_accelerator import Emulator_Accelerator
+
+
+def noise_emulator(df):
+    # Emulator with the noise index of df, without loading the default data
+    env = Emulator_Accelerator.__new__(Emulator_Accelerator)
+    env.df = env._prepData(df)
+    env.np_random = np.random.RandomState(1)
+    return env
+
+
+class NoiseIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # Settings on a 1e-4 grid, so many x+-sampling_window land exactly (up to rounding) on samples
+        vimin = 103.3 + 1e-4 * rng.integers(0, 200, 500)
+        self.df = pd.DataFrame({'B:VIMIN': vimin, 'B:IMINER': 0.5 * (vimin - 103.3) + rng.normal(0, 0.01, 500)})
+        self.env = noise_emulator(self.df)
+
+    def edge_points(self):
+        # Window edges of every sample and their float neighbours
+        w = self.env.sampling_window
+        edges = np.concatenate([self.df['B:VIMIN'].values - w, self.df['B:VIMIN'].values + w,
+                                self.df['B:VIMIN'].values])
+        return np.unique(np.concatenate([edges, np.nextafter(edges, np.inf), np.nextafter(edges, -np.inf)]))
+
+    def test_tables_match_between(self):
+        # Every table equals the histogram of the samples selected as in the original implementation
+        env, w = self.env, self.env.sampling_window
+        nkeys = len(env.noise_vimin) + 1
+        for x in self.edge_points()[::7]:
+            y_std = self.df[self.df['B:VIMIN'].between(x - w, x + w)]
+            lo, hi = env._noise_range(x)
+            self.assertEqual(hi - lo, len(y_std))
+            k = np.searchsorted(env.noise_keys, lo * nkeys + hi)
+            self.assertEqual(env.noise_keys[k], lo * nkeys + hi)
+            if y_std.empty:
+                continue
+            hist, bins = np.histogram(y_std['IMINER_std'], bins=100)
+            cdf = np.cumsum(hist)
+            np.testing.assert_allclose(env.noise_cdf[k], cdf / cdf[-1])
+            np.testing.assert_allclose(env.noise_midpoints[k], bins[:-1] + np.diff(bins) / 2)
+
+    def test_random_from_cdf(self):
+        x = self.edge_points()
+        noise = self.env._random_from_cdf(x)
+        self.assertEqual(noise.shape, x.shape)
+        # Outside of the data there is no noise
+        self.assertEqual(self.env._random_from_cdf(self.df['B:VIMIN'].max() + 1), 0)
+
+    def test_missing_range(self):
+        # A range missing from the index is an error, also under python -O
+        env, x = self.env, self.df['B:VIMIN'].values[:10]
+        lo, hi = env._noise_range(x[3])
+        env.noise_keys = env.noise_keys[env.noise_keys != lo * (len(env.noise_vimin) + 1) + hi]
+        with self.assertRaisesRegex(KeyError, 'missing from the noise index'):
+            env._random_from_cdf(x)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from gym_accelerator.envs.regulation import Regulator
+import gym_accelerator.envs.data_accelerator as da
+import gym_accelerator.envs.pid_sweep as ps
+
+
+class PIDSweepTestCase(unittest.TestCase):
+    def test_matches_regulator(self):
+        setting, measured = 103 + 0.1 * np.random.rand(2, 1000)
+        setting, measured = ps.regulation_windows(setting), ps.regulation_windows(measured)
+        alphas, gammas = np.array([8.5e-2, 0.1]), np.array([7.535e-5, 1e-3])
+        results = ps.sweep(setting, measured, alphas, gammas, chunk_size=7, per_window=True)
+        for p in range(2):
+            regulator = Regulator(alphas[p], gammas[p])
+            err_avg, rms = [], []
+            for s, m in zip(setting, measured):
+                err = 10 * (regulator(10 * (m - s), s) - m)
+                err_avg.append(np.average(abs(err)))
+                rms.append(np.sqrt(np.sum(np.square(err - err_avg[-1]))))
+            np.testing.assert_allclose(results['window_err_avg'][p], err_avg, rtol=1e-6)
+            self.assertAlmostEqual(results['err_avg'][p], np.mean(err_avg))
+            self.assertAlmostEqual(results['rms'][p], np.mean(rms))
+
+    def test_cross_entropy_search(self):
+        best, value = ps.cross_entropy_search(lambda x: np.sum(np.square(x - 0.3), axis=1), [0, 0], [1, 1], seed=0)
+        np.testing.assert_allclose(best, [0.3, 0.3], atol=1e-3)
+
+
+class DataEnvSweepTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Small B_VIMIN/B:VIMIN dataset and a cfg pointing to it, paths are relative to the env module
+        cls.tmpdir = tempfile.mkdtemp()
+        rng = np.random.default_rng(1)
+        nrows = 16 * 40 + 5
+        setting = np.round(103.3 + 0.01 * np.sin(np.arange(nrows) / 50), 5)
+        df = pd.DataFrame({'B_VIMIN': setting, 'B:VIMIN': setting + rng.normal(0, 1e-3, nrows)})
+        df.to_csv(os.path.join(cls.tmpdir, 'data.csv'), index=False)
+        env_dir = os.path.dirname(os.path.abspath(da.__file__))
+        with open(os.path.join(cls.tmpdir, 'data_setup.json'), 'w') as json_file:
+            json.dump({'data_dir': os.path.relpath(cls.tmpdir, env_dir) + '/', 'data_name': 'data.csv',
+                       'data_type': 'csv'}, json_file)
+        cls.cfg_file = os.path.relpath(os.path.join(cls.tmpdir, 'data_setup.json'), env_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_matches_data_env(self):
+        # Episodes of the data env with fixed gains, long enough to wrap around the data at step and at reset
+        nsteps, nepisodes = 7, 9
+        env = da.Data_Accelerator(cfg_file=self.cfg_file)
+        err_avg = []
+        for episode in range(nepisodes):
+            env.reset()
+            if episode % 2:
+                _, rewards, _, _ = env.step_many([0] * nsteps)
+            else:
+                rewards = [env.step(0)[1] for _ in range(nsteps)]
+            err_avg.extend(1e-5 / np.asarray(rewards))
+
+        setting, measured = ps.episode_windows(env.setting_data, env.measured_data, nsteps, nepisodes)
+        results = ps.sweep(setting, measured, env.alpha, env.gamma, chunk_size=10, per_window=True)
+        np.testing.assert_allclose(results['window_err_avg'][0], err_avg, rtol=1e-9)
+        self.assertAlmostEqual(results['reward'][0], np.mean(1e-5 / np.asarray(err_avg)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+
+from gym_accelerator.envs.regulation import Regulator
+
+
+def regulation_loop(alpha, gamma, error, setting, beta_last):
+    # Reference: the per-sample loop of the data env
+    beta = np.zeros(len(error))
+    beta[0] = beta_last
+    for i in range(1, len(error)):
+        beta[i] = beta[i - 1] + gamma * error[i]
+    return setting + alpha * error + beta, beta[-1]
+
+
+class RegulatorTestCase(unittest.TestCase):
+    def test_matches_loop(self):
+        regulator = Regulator(8.5e-2, 7.535e-5)
+        beta_last = 0.0
+        for _ in range(5):
+            error, setting = np.random.rand(15), 100 + np.random.rand(15)
+            expected, beta_last = regulation_loop(8.5e-2, 7.535e-5, error, setting, beta_last)
+            np.testing.assert_allclose(regulator(error, setting), expected)
+        regulator.reset()
+        self.assertEqual(regulator.beta, 0)
+
+    def test_sequence(self):
+        alphas = np.array([0.08, 0.09, 0.1, 0.11])
+        stepped, sequence = Regulator(8.5e-2, 7.535e-5), Regulator(8.5e-2, 7.535e-5)
+        error, setting = np.random.rand(4, 15), 100 + np.random.rand(15)
+        expected = []
+        for alpha, window in zip(alphas, error):
+            stepped.alpha = alpha
+            expected.append(stepped(window, setting))
+        np.testing.assert_allclose(sequence.sequence(error, setting, alpha=alphas), expected)
+        np.testing.assert_allclose(sequence.beta, stepped.beta)
+        # No windows, the integral term is kept
+        self.assertEqual(sequence.sequence(np.zeros((0, 15)), setting).shape, (0, 15))
+        np.testing.assert_allclose(sequence.beta, stepped.beta)
+
+    def test_batched(self):
+        alphas, gammas = np.array([0.1, 0.2, 0.3]), np.array([1e-3, 2e-3, 3e-3])
+        batched = Regulator(alphas, gammas, sign=-1.0, shape=(3,))
+        single = [Regulator(a, g, sign=-1.0) for a, g in zip(alphas, gammas)]
+        for _ in range(3):
+            error, setting = np.random.rand(3, 15), np.random.rand(3, 15)
+            regulated = batched(error, setting)
+            for i in range(3):
+                np.testing.assert_allclose(regulated[i], single[i](error[i], setting[i]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import threading
+import numpy as np
+
+from agents.replay_memory import ReplayMemory, SumTree, PrioritizedReplayMemory, LockedReplayMemory
+
+
+class ReplayMemoryTestCase(unittest.TestCase):
+    def test_wraps_around_capacity(self):
+        memory = ReplayMemory(4, (3,))
+        for i in range(6):
+            memory.append(np.full(3, i), i, float(i), np.full(3, i + 1), i == 5)
+        self.assertEqual(len(memory), 4)
+        self.assertEqual(memory.cursor, 2)
+        self.assertEqual(sorted(memory.actions.tolist()), [2, 3, 4, 5])
+
+    def test_sample_shapes(self):
+        memory = ReplayMemory(10, (5,))
+        for i in range(10):
+            memory.append(np.random.rand(5, 1), i % 7, -1.0, np.random.rand(5), False)
+        states, actions, rewards, next_states, dones = memory.sample(8)
+        self.assertEqual(states.shape, (8, 5))
+        self.assertEqual(next_states.dtype, np.float32)
+        self.assertEqual(actions.shape, (8,))
+        self.assertEqual(rewards.shape, (8,))
+        self.assertEqual(dones.dtype, np.bool_)
+
+    def test_locked_memory_concurrent_appends(self):
+        memory = LockedReplayMemory(ReplayMemory(1000, (2,)))
+
+        def actor(action):
+            for i in range(200):
+                memory.append(np.zeros(2), action, 0.0, np.zeros(2), False)
+
+        actors = [threading.Thread(target=actor, args=(a,)) for a in range(4)]
+        for thread in actors:
+            thread.start()
+        for thread in actors:
+            thread.join()
+        self.assertEqual(len(memory), 800)
+        self.assertEqual(np.bincount(memory.memory.actions[:800]).tolist(), [200] * 4)
+
+
+class SumTreeTestCase(unittest.TestCase):
+    def test_find_proportional_leaf(self):
+        tree = SumTree(5)
+        tree.update([0, 1, 2, 3, 4], [1.0, 2.0, 3.0, 4.0, 0.0])
+        self.assertEqual(tree.total(), 10.0)
+        self.assertEqual(tree.find([0.5, 1.0, 2.9, 3.0, 9.9]).tolist(), [0, 1, 1, 2, 3])
+
+    def test_prioritized_sampling_prefers_large_errors(self):
+        memory = PrioritizedReplayMemory(64, (2,), alpha=1.0)
+        for i in range(32):
+            memory.append(np.zeros(2), 0, 0.0, np.zeros(2), False)
+        memory.update_priorities(np.arange(32), np.r_[np.zeros(31), 10.0])
+        *_, idx, weights = memory.sample(100)
+        self.assertGreater(np.mean(idx == 31), 0.9)
+        self.assertAlmostEqual(float(weights.max()), 1.0)
+
+    def test_beta_annealing(self):
+        memory = LockedReplayMemory(PrioritizedReplayMemory(64, (2,), beta=0.4, beta_increment=0.1))
+        for i in range(8):
+            memory.append(np.zeros(2), 0, 0.0, np.zeros(2), False)
+        for _ in range(3):
+            memory.sample(4, anneal_beta=False)
+        self.assertAlmostEqual(memory.memory.beta, 0.4)
+        memory.anneal_beta()
+        memory.sample(4)
+        self.assertAlmostEqual(memory.memory.beta, 0.6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+import numpy as np
+
+from gym_accelerator.envs.ring_window import RingWindow
+
+
+class RingWindowTestCase(unittest.TestCase):
+    def test_matches_shifted_state(self):
+        nsamples = 7
+        state = np.random.rand(3, 4, nsamples).astype(np.float32)
+        ring = RingWindow(state.shape)
+        ring.reset(state)
+        for step in range(20):
+            column = np.random.rand(3, 4).astype(np.float32)
+            state[..., 0:-1] = state[..., 1:]
+            state[..., -1] = column
+            ring.push(column)
+            state[1, 0, -1] = step
+            ring.set_last(0, step, index=1)
+            if step % 3 == 0:
+                envs = np.array([0, 2])
+                state[envs] = np.random.rand(2, 4, nsamples)
+                ring.reset(state[envs], envs)
+            np.testing.assert_array_equal(ring.window(), state)
+            np.testing.assert_array_equal(ring.last(), state[..., -1])
+
+
+if __name__ == '__main__':
+    unittest.main()
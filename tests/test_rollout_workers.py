@@ -0,0 +1,68 @@
+import os
+import unittest
+from types import SimpleNamespace
+import numpy as np
+
+from agents.rollout_workers import RolloutWorkers
+from agents.replay_memory import ReplayMemory
+from agents.shared_buffers import SharedRingBuffer
+
+CFG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cfg', 'dqn_setup.json')
+
+
+class StubAgent:
+    # The parts of the DQN agents used by the learner side of the rollout workers
+    def __init__(self):
+        self.memory = ReplayMemory(64, (3,))
+        self.batch_size = 4
+        self.warmup_step = 8
+        self.epsilon = 1.0
+        self.epsilon_decay = 0.5
+
+    def epsilon_adj(self):
+        self.epsilon *= self.epsilon_decay
+
+
+class CollectTestCase(unittest.TestCase):
+    def setUp(self):
+        self.agent = StubAgent()
+        self.workers = RolloutWorkers(self.agent, 'unused', 10, cfg=CFG)
+        # Shared state of two workers, as set up by start() without spawning the processes
+        self.workers.buffers = [SharedRingBuffer(16, (3,)) for _ in range(2)]
+        self.producers = [SharedRingBuffer(*buffer.spec()) for buffer in self.workers.buffers]
+        self.workers.epsilon = SimpleNamespace(value=self.agent.epsilon)
+        self.workers.warmup = SimpleNamespace(value=True)
+        self.workers.random_actions = [SimpleNamespace(value=0) for _ in range(2)]
+
+    def tearDown(self):
+        for buffer in self.producers + self.workers.buffers:
+            buffer.close()
+
+    def put(self, worker, ntransitions, nrandom):
+        for i in range(ntransitions):
+            self.producers[worker].put(np.zeros(3), 0, 0.0, np.zeros(3), False)
+        self.workers.random_actions[worker].value += nrandom
+
+    def test_epsilon_decays_per_random_action(self):
+        # Warm up: no decay until the memory holds more than batch_size transitions
+        self.put(0, 4, 4)
+        self.assertEqual(self.workers.collect(), 4)
+        self.assertEqual(self.agent.epsilon, 1.0)
+        self.assertTrue(self.workers.warmup.value)
+
+        # Only the random actions decay epsilon, not every collected transition
+        self.put(0, 3, 1)
+        self.put(1, 3, 2)
+        self.assertEqual(self.workers.collect(), 6)
+        self.assertEqual(self.agent.epsilon, 0.5 ** 3)
+        self.assertEqual(self.workers.epsilon.value, self.agent.epsilon)
+        # The memory passed warmup_step, the workers stop forcing random actions
+        self.assertFalse(self.workers.warmup.value)
+
+        self.put(1, 5, 0)
+        self.workers.collect()
+        self.assertEqual(self.agent.epsilon, 0.5 ** 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
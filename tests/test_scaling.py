@@ -0,0 +1,31 @@
+import unittest
+import numpy as np
+
+from sklearn.preprocessing import MinMaxScaler
+from dataprep.scaling import AffineScaler
+
+
+class AffineScalerTestCase(unittest.TestCase):
+    def test_matches_minmax_scalers(self):
+        data = np.random.rand(100, 3) * [1, 10, 100] + 100
+        scalers = [MinMaxScaler(feature_range=(0.0001, 1)).fit(data[:, v:v + 1]) for v in range(3)]
+        scaler = AffineScaler.from_minmax(scalers)
+        expected = np.hstack([scalers[v].transform(data[:, v:v + 1]) for v in range(3)])
+        np.testing.assert_allclose(scaler.transform(data), expected)
+        np.testing.assert_allclose(scaler.transform(data.T, axis=0), expected.T)
+        np.testing.assert_allclose(scaler.transform(data[:, 1:3], slice(1, 3)), expected[:, 1:3])
+        np.testing.assert_allclose(scaler.inverse_transform(np.array([[0.5]]), 1),
+                                   scalers[1].inverse_transform(np.array([[0.5]])))
+        values = expected.copy()
+        scaler.inverse_transform_inplace(values)
+        np.testing.assert_allclose(values, data)
+
+    def test_robust(self):
+        scale_dict = {'a': {'median': 2.0, 'range': 4.0}, 'b': {'median': -1.0, 'range': 0.5}}
+        scaler = AffineScaler.from_robust(scale_dict, ['a', 'b'])
+        np.testing.assert_allclose(scaler.transform(np.array([6.0, 0.0])), [1.0, 2.0])
+        np.testing.assert_allclose(scaler.inverse_transform(np.array([1.0, 2.0])), [6.0, 0.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import numpy as np
+
+from agents.shared_buffers import SharedRingBuffer, SharedWeights
+from agents.replay_memory import ReplayMemory
+
+
+class SharedRingBufferTestCase(unittest.TestCase):
+    def setUp(self):
+        self.buffer = SharedRingBuffer(4, (3,))
+        # Attached by name, as a rollout worker does
+        self.producer = SharedRingBuffer(*self.buffer.spec())
+
+    def tearDown(self):
+        self.producer.close()
+        self.buffer.close()
+
+    def test_transitions_cross_the_wrap_in_order(self):
+        memory = ReplayMemory(16, (3,))
+        for i in range(10):
+            self.assertTrue(self.producer.put(np.full(3, i), i, float(i), np.full(3, i + 1), False))
+            if i % 3 == 2:
+                memory.extend(*self.buffer.get())
+        memory.extend(*self.buffer.get())
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(memory.actions[:10].tolist(), list(range(10)))
+        self.assertEqual(memory.next_states[9].tolist(), [10, 10, 10])
+
+    def test_full_buffer_does_not_overwrite(self):
+        for i in range(4):
+            self.producer.put(np.zeros(3), i, 0.0, np.zeros(3), False)
+        self.assertFalse(self.producer.put(np.zeros(3), 4, 0.0, np.zeros(3), False, should_stop=lambda: True))
+        self.assertEqual(self.buffer.get()[1].tolist(), [0, 1, 2, 3])
+
+
+class SharedWeightsTestCase(unittest.TestCase):
+    def test_roundtrip(self):
+        weights = [np.random.rand(5, 4).astype(np.float32), np.random.rand(4).astype(np.float32)]
+        shared = SharedWeights([w.shape for w in weights])
+        reader = SharedWeights(*shared.spec())
+        shared.write(weights)
+        version, values = reader.read()
+        self.assertEqual(version, 2)
+        for w, v in zip(weights, values):
+            np.testing.assert_array_equal(w, v)
+        reader.close()
+        shared.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import sys
+import unittest
+from unittest import mock
+import numpy as np
+
+import dataprep.cache as dc
+from gym_accelerator.envs.surrogate_accelerator_v1 import Surrogate_Accelerator_v1
+from gym_accelerator.envs.surrogate_accelerator_batch import Surrogate_Accelerator_Batch
+
+VARIABLES = ['B:VIMIN', 'B:IMINER', 'B:LINFRQ', 'I:IB', 'I:MDAT40']
+BATCH_ID = 10
+
+
+class StubBooster:
+    # Deterministic stand-in for the booster model: (n, 5, 150) windows to (n, 3) predictions
+    def predict_on_batch(self, x):
+        x = np.asarray(x)
+        return np.stack([x[:, 0, -1], 0.5 + 0.2 * (x[:, 1].mean(axis=-1) - 0.5) + 0.1 * (x[:, 0, -1] - 0.5),
+                         x[:, 2, -1]], axis=1)
+
+    def predict(self, x):
+        return self.predict_on_batch(x)
+
+
+class FixedStart:
+    # Random generator of the batch env, every episode starts at BATCH_ID as in Surrogate_Accelerator_v1
+    def randint(self, low, high=None, size=None):
+        return np.full(size, BATCH_ID, dtype=np.int64)
+
+
+def stub_series():
+    rng = np.random.default_rng(0)
+    series = 0.4 + 0.2 * rng.random((1000, len(VARIABLES)))
+    scale_params = {var: {'data_min': 0.0, 'data_max': 1.0, 'feature_range': [0, 1]} for var in VARIABLES}
+    # B:VIMIN between 103.0 and 103.7, B:IMINER between -3 and 3
+    scale_params['B:VIMIN'].update({'data_min': 103.0, 'data_max': 103.7})
+    scale_params['B:IMINER'].update({'data_min': -3.0, 'data_max': 3.0})
+    return series, scale_params
+
+
+def make_env(env_class, **kwargs):
+    # Env with the stub model and data, nothing is read from disk
+    keras = sys.modules[env_class.__module__].keras
+    with mock.patch.object(keras.models, 'load_model', return_value=StubBooster()), \
+            mock.patch.object(dc, 'cached_series', return_value=stub_series()):
+        return env_class(**kwargs)
+
+
+class SurrogateBatchEnvTestCase(unittest.TestCase):
+    def setUp(self):
+        self.env = make_env(Surrogate_Accelerator_Batch, nenvs=4)
+        self.env.np_random = FixedStart()
+
+    def test_shapes(self):
+        observations = self.env.reset()
+        self.assertEqual(observations.shape, (4, len(VARIABLES)))
+        observations, rewards, dones, info = self.env.step(np.zeros(4, dtype=np.int64))
+        self.assertEqual(observations.shape, (4, len(VARIABLES)))
+        self.assertEqual(rewards.shape, (4,))
+        self.assertEqual(dones.shape, (4,))
+        self.assertEqual(dones.dtype, np.bool_)
+        self.assertEqual(info, {})
+
+    def test_auto_reset(self):
+        env = self.env
+        start = env.reset()
+        env.step(np.zeros(4, dtype=np.int64))
+        # Env 1 moves B:VIMIN out of bounds, the others keep it
+        env.max_BIMIN = env.scaler.inverse_transform(env.VIMIN, 0).max() + 0.003
+        observations, rewards, dones, info = env.step(np.array([0, 2, 0, 0]))
+        np.testing.assert_array_equal(dones, [False, True, False, False])
+        np.testing.assert_array_equal(info['done_envs'], [1])
+        # The terminal observation is the last state of the episode, the returned one the new start
+        self.assertEqual(info['terminal_observation'].shape, (1, len(VARIABLES)))
+        np.testing.assert_allclose(env.scaler.inverse_transform(info['terminal_observation'][0, 0], 0),
+                                   env.scaler.inverse_transform(start[1, 0], 0) + 0.005)
+        np.testing.assert_array_equal(observations[1], start[1])
+        self.assertEqual(info['episode_steps'][0], 2)
+        np.testing.assert_array_equal(env.steps, [2, 0, 2, 2])
+        np.testing.assert_array_equal(env.episodes, [1, 2, 1, 1])
+
+    def test_matches_single_env(self):
+        single = make_env(Surrogate_Accelerator_v1)
+        single.max_steps = self.env.max_steps = 20
+        batch_observations = self.env.reset()
+        observation = single.reset()
+        np.testing.assert_allclose(batch_observations[2], observation)
+
+        # Small B:VIMIN steps, the episode ends after max_steps
+        actions = np.random.default_rng(1).choice([0, 1, 3, 4, 6], size=(single.max_steps, 4))
+        for step in range(single.max_steps):
+            batch_observations, rewards, dones, info = self.env.step(actions[step])
+            observation, reward, done, _ = single.step(actions[step, 2])
+            np.testing.assert_allclose(rewards[2], reward)
+            self.assertEqual(dones[2], done)
+            if not done:
+                np.testing.assert_allclose(batch_observations[2], observation)
+        # The finished episode is reported in info and the env starts over
+        self.assertTrue(done)
+        np.testing.assert_array_equal(info['done_envs'], np.arange(4))
+        np.testing.assert_allclose(info['terminal_observation'][2], observation)
+        np.testing.assert_allclose(info['episode_reward'][2], single.total_reward)
+        np.testing.assert_allclose(info['episode_data_reward'][2], single.data_total_reward)
+        np.testing.assert_allclose(batch_observations[2], single.reset())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import sys
+import unittest
+from unittest import mock
+import numpy as np
+
+import dataprep.cache as dc
+from gym_accelerator.envs.surrogate_accelerator import Surrogate_Accelerator
+from gym_accelerator.envs.surrogate_accelerator_v2 import Surrogate_Accelerator_v2
+from gym_accelerator.envs.surrogate_accelerator_v3 import Surrogate_Accelerator_v3
+
+
+class StubModel:
+    # Deterministic stand-in for the surrogate models, records the last input
+    def __init__(self, noutputs):
+        self.noutputs = noutputs
+        self.input = None
+
+    def predict(self, x):
+        self.input = np.array(x)
+        outputs = [0.5 + 0.1 * (x[:, i % x.shape[1]].mean(axis=-1) - 0.5) + 0.05 * (x[:, 0, -1] - 0.5)
+                   for i in range(self.noutputs)]
+        return np.stack(outputs, axis=1)
+
+
+def make_env(env_class, variables, noutputs):
+    # Env with the stub models and data, nothing is read from disk
+    rng = np.random.default_rng(0)
+    series = 0.4 + 0.2 * rng.random((1000, len(variables)))
+    scale_params = {var: {'data_min': 0.0, 'data_max': 1.0, 'feature_range': [0, 1]} for var in variables}
+    # B:VIMIN between 103.0 and 103.7, B:IMINER between -3 and 3
+    scale_params['B:VIMIN'].update({'data_min': 103.0, 'data_max': 103.7})
+    scale_params['B:IMINER'].update({'data_min': -3.0, 'data_max': 3.0})
+    keras = sys.modules[env_class.__module__].keras
+    with mock.patch.object(keras.models, 'load_model', side_effect=[StubModel(noutputs), StubModel(2)]), \
+            mock.patch.object(dc, 'cached_series', return_value=(series, scale_params)):
+        env = env_class()
+    env.render = lambda: None
+    return env
+
+
+class RingStateTestCase(unittest.TestCase):
+    # The ring buffer state matches the state shifted in place as in the original step()
+    actions = [1, 3, 0, 4, 6, 1, 1, 3, 0, 4, 2, 5]
+
+    def assert_matches_shift(self, env, reset, shift):
+        reset()
+        state = np.copy(env.X_train[env.batch_id].reshape(env.state.shape))
+        np.testing.assert_array_equal(env.state, state)
+        for action in self.actions:
+            env.step(action)
+            data_state = env.X_train[env.batch_id + env.steps].reshape(state.shape)
+            shift(state, env, data_state)
+            np.testing.assert_array_equal(env.state, state)
+
+    def test_v0(self):
+        env = make_env(Surrogate_Accelerator, ['B:VIMIN', 'B:IMINER', 'B:LINFRQ', 'I:IB', 'I:MDAT40'], 5)
+
+        def shift(state, env, data_state):
+            state[0, 0, -1:] = env.VIMIN
+            np.testing.assert_array_equal(env.booster_model.input, state)
+            state[0, :, 0:-1] = state[0, :, 1:]
+            state[0, 1:3, -1:] = env.predicted_state[0, 1:3]
+            state[0, 2:5, :] = data_state[0, 2:5, :]
+        self.assert_matches_shift(env, env.reset, shift)
+
+    def test_v2(self):
+        env = make_env(Surrogate_Accelerator_v2, ['B:VIMIN', 'B:IMINER', 'B:VIMIN_STD', 'B:IMINER_STD', 'B:LINFRQ',
+                                                  'I:IB', 'I:MDAT40'], 2)
+
+        def shift(state, env, data_state):
+            state[0, 0, -1:] = env.VIMIN
+            np.testing.assert_array_equal(env.booster_model.input, state)
+            state[0, :, 0:-1] = state[0, :, 1:]
+            state[0, 1:2, -1:] = env.predicted_state[0, 1:2]
+            state[0, 2:7, :] = data_state[0, 2:7, :]
+        self.assert_matches_shift(env, env.reset, shift)
+
+    def test_v3(self):
+        env = make_env(Surrogate_Accelerator_v3, ['B:VIMIN', 'B:IMINER', 'B:VIPHAS', 'B:LINFRQ', 'I:IB', 'I:MDAT40',
+                                                  'I:MXIB'], 2)
+
+        def shift(state, env, data_state):
+            state[0, 0, 0:-1] = state[0, 0, 1:]
+            state[0, 0, -1] = env.VIMIN.item()
+            np.testing.assert_array_equal(env.booster_model.input, state)
+            state[0, 1, 0:-1] = state[0, 1, 1:]
+            state[0, 1, -1] = env.predicted_state[0, 1, 0]
+            state[0, 2:, :] = data_state[0, 2:, :]
+        # reset is a property of this env
+        self.assert_matches_shift(env, lambda: env.reset, shift)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import os
+import unittest
+import tempfile
+import numpy as np
+
+from dataprep.trajectory import TrajectoryRecorder, load_trajectories
+
+
+class TrajectoryTestCase(unittest.TestCase):
+    def test_roundtrip_across_chunks(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'run', 'trajectories')
+            recorder = TrajectoryRecorder(filename, chunk_size=7, episodes_per_chunk=2)
+            for e in range(3):
+                total_reward = 0
+                for step in range(5):
+                    total_reward += -step
+                    recorder.record(np.full(5, step), step % 7, np.array([[-step]]), np.full(5, step + 1),
+                                    total_reward, step == 4, step % 2, e)
+                recorder.end_episode()
+            recorder.close()
+
+            columns = load_trajectories(filename)
+            self.assertIsInstance(columns['state'], np.memmap)
+            self.assertEqual(columns['state'].shape, (15, 5))
+            self.assertEqual(columns['episode'].tolist(), [0] * 5 + [1] * 5 + [2] * 5)
+            self.assertEqual(columns['reward'][:5].tolist(), [0, -1, -2, -3, -4])
+            self.assertEqual(int(columns['done'].sum()), 3)
+            self.assertEqual(columns['next_state'][4, 0], 5)
+
+            # Appending to the same run consolidates again
+            recorder = TrajectoryRecorder(filename)
+            recorder.record(np.zeros(5), 0, 0.0, np.zeros(5), 0.0, True, 0, 3)
+            recorder.close()
+            self.assertEqual(len(load_trajectories(filename, mmap=False)['action']), 16)
+
+
+if __name__ == '__main__':
+    unittest.main()